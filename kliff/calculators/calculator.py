@@ -1,5 +1,6 @@
 import logging
 from collections.abc import Sequence
+from concurrent.futures import ThreadPoolExecutor
 from typing import Any, Dict, List, Union
 
 import numpy as np
@@ -37,6 +38,7 @@ class Calculator:
         use_energy: Union[List[bool], bool] = True,
         use_forces: Union[List[bool], bool] = True,
         use_stress: Union[List[bool], bool] = False,
+        nthreads: int = 1,
     ):
         """
         Create compute arguments for a collection of configurations.
@@ -58,6 +60,10 @@ class Calculator:
             use_stress: Whether to require the calculator to compute stress.
                 If a list of bool is provided, each component is for one configuration
                 in `configs`. If a bool is provided, it is applied to all configurations.
+            nthreads: Number of threads to create the compute arguments. The neighbor
+                list construction in the C++ extension releases the GIL, so the compute
+                arguments of different configurations can be created concurrently. This
+                is ignored for KIM models, whose compute arguments are created serially.
         """
 
         self.use_energy = use_energy
@@ -97,13 +103,26 @@ class Calculator:
         ca_class = self.model.get_compute_argument_class()
 
         self.compute_arguments = []
-        for conf, e, f, s in zip(configs, use_energy, use_forces, use_stress):
-            if self._is_kim_model():
+        if self._is_kim_model():
+            for conf, e, f, s in zip(configs, use_energy, use_forces, use_stress):
                 kim_ca = self.model.create_a_kim_compute_argument()
                 ca = ca_class(kim_ca, conf, supported_species, infl_dist, e, f, s)
-            else:
+                self.compute_arguments.append(ca)
+
+        elif nthreads > 1:
+
+            def create_ca(conf, e, f, s):
+                return ca_class(conf, supported_species, infl_dist, e, f, s)
+
+            with ThreadPoolExecutor(max_workers=nthreads) as executor:
+                self.compute_arguments = list(
+                    executor.map(create_ca, configs, use_energy, use_forces, use_stress)
+                )
+
+        else:
+            for conf, e, f, s in zip(configs, use_energy, use_forces, use_stress):
                 ca = ca_class(conf, supported_species, infl_dist, e, f, s)
-            self.compute_arguments.append(ca)
+                self.compute_arguments.append(ca)
 
         logger.info(f"Create calculator for {len(configs)} configurations.")
         return self.compute_arguments
@@ -236,6 +255,53 @@ class Calculator:
         """
         return compute_arguments.get_reference()
 
+    def has_prediction_jacobian(self) -> bool:
+        """
+        Whether the derivatives of the predictions w.r.t. the optimizing parameters can
+        be computed analytically by :meth:`get_prediction_jacobian`.
+
+        This requires all the compute arguments to implement
+        ``compute_prediction_jacobian``, and no relation between the parameters to be
+        imposed by ``params_relation_callback`` of the model.
+        """
+        if self._is_kim_model() or self.compute_arguments is None:
+            return False
+        if self.model.params_relation_callback is not None:
+            return False
+
+        return all(ca.implemented_jacobian for ca in self.compute_arguments)
+
+    def get_prediction_jacobian(self, compute_arguments) -> np.array:
+        """
+        Get the derivatives of the prediction w.r.t. the optimizing parameters.
+
+        Args:
+            compute_arguments: A compute arguments instance for a configuration.
+
+        Returns:
+            2D array of shape (P, M), where P is the size of the prediction (see
+            :meth:`get_prediction`), and M is the number of optimizing parameters (see
+            :meth:`get_opt_params`).
+        """
+        dpred = compute_arguments.compute_prediction_jacobian(
+            self.model.get_model_params()
+        )
+
+        ca = compute_arguments
+        P = (
+            int(ca.compute_energy)
+            + 3 * ca.conf.get_num_atoms() * int(ca.compute_forces)
+            + 6 * int(ca.compute_stress)
+        )
+        n = self.get_num_opt_params()
+        jac = np.zeros((P, n))
+        for i in range(n):
+            name, _, _, c_idx = self.model.get_opt_param_name_value_and_indices(i)
+            if name in dpred:
+                jac[:, i] = dpred[name][:, c_idx]
+
+        return jac
+
     def get_opt_params(self) -> np.array:
         """
         Return a list of optimizing parameters.
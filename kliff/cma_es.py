@@ -0,0 +1,172 @@
+from typing import Callable, Optional
+
+import numpy as np
+import scipy.optimize
+
+_STATUS_MESSAGES = {
+    0: "Standard deviation of the parameters smaller than `tol`.",
+    1: "Maximum number of generations reached.",
+    2: "No finite function value found.",
+}
+
+
+def cma_es(
+    fn: Callable,
+    x0,
+    sigma0=None,
+    bounds=None,
+    popsize: Optional[int] = None,
+    maxiter: int = 100,
+    tol: float = 1e-8,
+    seed: Optional[int] = None,
+) -> scipy.optimize.OptimizeResult:
+    """
+    Minimize a function using the covariance matrix adaptation evolution strategy
+    (CMA-ES), with the (mu/mu_w, lambda) selection and the default parameters of
+    Hansen, "The CMA evolution strategy: a tutorial", arXiv:1604.00772.
+
+    The search is done in the coordinates scaled by ``sigma0``, such that parameters
+    of different magnitudes are explored alike. Candidates outside the bounds are
+    projected onto the bounds before evaluation.
+
+    Args:
+        fn: function to minimize, which computes the values of a batch of candidates,
+            i.e. ``fn(X)`` with ``X`` a 2D array of shape (popsize, len(x0)) returns a
+            1D array of size `popsize`.
+        x0: initial guess of the parameters, 1D array.
+        sigma0: initial standard deviation of each parameter, a scalar or a 1D array.
+            Default to 0.3 of the range of the bounds for bounded parameters, and
+            0.3 of the absolute value of ``x0`` (or 0.3 if ``x0`` is 0) otherwise.
+        bounds: (lb, ub) arrays of the lower and upper bounds, with ``-inf`` and
+            ``inf`` for no bounds. Parameters with equal lower and upper bounds (or
+            a zero ``sigma0``) are fixed, and are not searched.
+        popsize: number of candidates in a generation. Default to
+            ``4 + int(3 * log(n))``, with ``n`` the number of searched parameters.
+        maxiter: maximum number of generations.
+        tol: stop when the standard deviation of all the parameters (in the scaled
+            coordinates) is smaller than ``tol``.
+        seed: random seed.
+
+    Returns:
+        The result, with `x` the best parameters found, `fun` the function value,
+        `nit` the number of generations, `nfev` the number of function evaluations,
+        and `success`, `status`, and `message` the reason of termination: status 0
+        (success) if the standard deviation is smaller than ``tol``, 1 if ``maxiter``
+        is reached, and 2 if no finite function value is found.
+    """
+    x0 = np.asarray(x0, dtype=float)
+    n = len(x0)
+    if bounds is None:
+        lb, ub = np.full(n, -np.inf), np.full(n, np.inf)
+    else:
+        lb, ub = (np.asarray(b, dtype=float) for b in bounds)
+    bounded = np.isfinite(lb) & np.isfinite(ub)
+    if sigma0 is None:
+        sigma0 = np.where(
+            bounded,
+            0.3 * np.where(bounded, ub - lb, 0),
+            0.3 * np.where(x0 != 0, np.abs(x0), 1.0),
+        )
+    scale = np.broadcast_to(np.asarray(sigma0, dtype=float), (n,))
+
+    # parameters fixed by the bounds (or with a zero standard deviation) are not
+    # searched, since they cannot be scaled
+    free = (ub > lb) & (scale > 0)
+    x_fixed = np.clip(x0, lb, ub)
+    if not np.any(free):
+        f = np.asarray(fn(x_fixed[None, :]), dtype=float)[0]
+        status = 0 if np.isfinite(f) else 2
+        return scipy.optimize.OptimizeResult(
+            x=x_fixed,
+            fun=f,
+            nit=0,
+            nfev=1,
+            success=status == 0,
+            status=status,
+            message=_STATUS_MESSAGES[status],
+        )
+    x0, lb, ub, scale = x0[free], lb[free], ub[free], scale[free]
+    n = len(x0)
+
+    rng = np.random.RandomState(seed)
+
+    # selection and adaptation parameters
+    lam = 4 + int(3 * np.log(n)) if popsize is None else popsize
+    mu = lam // 2
+    weights = np.log(mu + 0.5) - np.log(np.arange(1, mu + 1))
+    weights /= np.sum(weights)
+    mueff = 1 / np.sum(weights ** 2)
+    cc = (4 + mueff / n) / (n + 4 + 2 * mueff / n)
+    cs = (mueff + 2) / (n + mueff + 5)
+    c1 = 2 / ((n + 1.3) ** 2 + mueff)
+    cmu = min(1 - c1, 2 * (mueff - 2 + 1 / mueff) / ((n + 2) ** 2 + mueff))
+    damps = 1 + 2 * max(0, np.sqrt((mueff - 1) / (n + 1)) - 1) + cs
+    chiN = np.sqrt(n) * (1 - 1 / (4 * n) + 1 / (21 * n ** 2))
+
+    # state in the scaled coordinates u = (x - x0) / scale
+    mean = np.zeros(n)
+    sigma = 1.0
+    C = np.eye(n)
+    B = np.eye(n)
+    D = np.ones(n)
+    pc = np.zeros(n)
+    ps = np.zeros(n)
+
+    best_x, best_f = x_fixed, np.inf
+    nit = 0
+    nfev = 0
+    status = 1
+    for it in range(maxiter):
+        z = rng.standard_normal((lam, n))
+        U = mean + sigma * (z * D) @ B.T
+        X = np.clip(x0 + U * scale, lb, ub)
+        U = (X - x0) / scale
+        X_all = np.tile(x_fixed, (lam, 1))
+        X_all[:, free] = X
+        f = np.asarray(fn(X_all), dtype=float)
+        nit += 1
+        nfev += lam
+
+        order = np.argsort(f)
+        if f[order[0]] < best_f:
+            best_x, best_f = X_all[order[0]], f[order[0]]
+
+        # update the mean, evolution paths, covariance, and step size
+        y = (U[order[:mu]] - mean) / sigma
+        y_w = weights @ y
+        mean = mean + sigma * y_w
+
+        inv_sqrt_C = B @ np.diag(1 / D) @ B.T
+        ps = (1 - cs) * ps + np.sqrt(cs * (2 - cs) * mueff) * inv_sqrt_C @ y_w
+        ps_norm = np.linalg.norm(ps)
+        hsig = ps_norm / np.sqrt(1 - (1 - cs) ** (2 * (it + 1))) / chiN < 1.4 + 2 / (
+            n + 1
+        )
+        pc = (1 - cc) * pc + hsig * np.sqrt(cc * (2 - cc) * mueff) * y_w
+        C = (
+            (1 - c1 - cmu) * C
+            + c1 * (np.outer(pc, pc) + (1 - hsig) * cc * (2 - cc) * C)
+            + cmu * (y.T * weights) @ y
+        )
+        sigma *= np.exp((cs / damps) * (ps_norm / chiN - 1))
+
+        C = (C + C.T) / 2
+        D2, B = np.linalg.eigh(C)
+        D = np.sqrt(np.maximum(D2, np.finfo(float).eps))
+
+        if sigma * np.max(D) < tol:
+            status = 0
+            break
+
+    if not np.isfinite(best_f):
+        status = 2
+
+    return scipy.optimize.OptimizeResult(
+        x=best_x,
+        fun=best_f,
+        nit=nit,
+        nfev=nfev,
+        success=status == 0,
+        status=status,
+        message=_STATUS_MESSAGES[status],
+    )
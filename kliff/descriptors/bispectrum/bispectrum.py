@@ -2,7 +2,7 @@ import logging
 
 import numpy as np
 
-from ...neighbor import NeighborList
+from ...neighbor import get_neighbor_list
 from ..descriptor import Descriptor, generate_full_cutoff, generate_species_code
 from . import bs
 
@@ -95,13 +95,16 @@ class Bispectrum(Descriptor):
         # neighbor list
         infl_dist = max(self.cutoff.values())
 
-        nei = NeighborList(conf, infl_dist, padding_need_neigh=False)
+        nei = get_neighbor_list(conf, infl_dist, padding_need_neigh=False)
 
         coords = nei.coords
         image = nei.image
-        species = np.asarray([self.species_code[i] for i in nei.species], dtype=np.intc)
+        species = nei.get_species_code(self.species_code)
 
-        numneigh, neighlist = nei.get_numneigh_and_neighlist_1D()
+        # prune neighbors beyond the cutoff of each species pair
+        numneigh, neighlist = nei.get_numneigh_and_neighlist_1D(
+            species_cutoffs=self.cutoff
+        )
 
         Natoms = len(coords)
         Ncontrib = conf.get_num_atoms()
@@ -5,7 +5,7 @@ from collections import OrderedDict
 import numpy as np
 
 from ...log import log_entry
-from ...neighbor import NeighborList
+from ...neighbor import get_neighbor_list
 from ..descriptor import (
     Descriptor,
     generate_full_cutoff,
@@ -141,11 +141,16 @@ class SymmetryFunction(Descriptor):
 
         # create neighbor list
         infl_dist = max(self.cutoff.values())
-        nei = NeighborList(conf, infl_dist, padding_need_neigh=False)
+        nei = get_neighbor_list(conf, infl_dist, padding_need_neigh=False)
 
         coords = nei.coords
         image = nei.image
-        species = np.asarray([self.species_code[i] for i in nei.species], dtype=np.intc)
+        species = nei.get_species_code(self.species_code)
+        # prune neighbors beyond the cutoff of each species pair
+        numneigh, neighlist_1D = nei.get_numneigh_and_neighlist_1D(
+            species_cutoffs=self.cutoff
+        )
+        begin_index = np.concatenate(([0], np.cumsum(numneigh)))
 
         Ncontrib = conf.get_num_atoms()
         Ndesc = len(self)
@@ -157,8 +162,8 @@ class SymmetryFunction(Descriptor):
         dzetadr_stress_config = []
 
         for i in range(Ncontrib):
-            neigh_indices, _, _ = nei.get_neigh(i)
-            neighlist = np.asarray(neigh_indices, dtype=np.intc)
+            neigh_indices = neighlist_1D[begin_index[i] : begin_index[i + 1]]
+            neighlist = np.ascontiguousarray(neigh_indices, dtype=np.intc)
             zeta, dzetadr = self._cdesc.generate_one_atom(
                 i, coords, species, neighlist, grad
             )
@@ -1,14 +1,20 @@
+import functools
 import logging
 import os
-from typing import Any, Callable, Dict, List, Optional
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple, Union
 
 import numpy as np
 import scipy.optimize
 
 from kliff import parallel
 from kliff.calculators.calculator import Calculator, _WrapperCalculator
+from kliff.cma_es import cma_es
 from kliff.error import report_import_error
 from kliff.log import log_entry
+from kliff.utils import savez_atomic, to_path
 
 try:
     import torch
@@ -170,6 +176,8 @@ class Loss:
                 "normalize_by_natoms": True,
             }
             See the documentation of :meth:`energy_forces_residual` for more.
+        kwargs: extra keyword arguments passed to :class:`LossPhysicsMotivatedModel`,
+            e.g. ``cache_size``. Not supported for :class:`LossNeuralNetworkModel`.
     """
 
     def __new__(
@@ -178,12 +186,18 @@ class Loss:
         nprocs: int = 1,
         residual_fn: Optional[Callable] = None,
         residual_data: Optional[Dict[str, Any]] = None,
+        **kwargs,
     ):
         if isinstance(calculator, Calculator):
             return LossPhysicsMotivatedModel(
-                calculator, nprocs, residual_fn, residual_data
+                calculator, nprocs, residual_fn, residual_data, **kwargs
             )
         else:
+            if kwargs:
+                raise LossError(
+                    f"Keyword arguments `{', '.join(kwargs)}` are only supported for "
+                    "physics-based models, not for neural network models."
+                )
             return LossNeuralNetworkModel(
                 calculator, nprocs, residual_fn, residual_data
             )
@@ -210,6 +224,18 @@ class LossPhysicsMotivatedModel:
                 "normalize_by_natoms": True,
             }
             See the documentation of :meth:`energy_forces_residual` for more.
+        cache_size: Number of most recently evaluated parameter sets whose residual and
+            loss are cached, such that re-evaluating at the same parameters (e.g. by
+            line searches or Nelder-Mead) does not recompute the dataset. Default to
+            0, i.e. no caching.
+        cache_tol: Parameter sets whose components differ by at most ``cache_tol``
+            from a cached one are considered the same. Default to 0, i.e. only exactly
+            the same parameters hit the cache. It should be much smaller than the steps
+            of finite differences, if they are used by the optimizer.
+        rebalance_after: In MPI mode, the configurations are initially partitioned
+            between the processes by their estimated compute cost. If given, they are
+            repartitioned by the compute time measured in the ``rebalance_after``-th
+            evaluation of the residual. Default to ``None``, i.e. no repartition.
     """
 
     scipy_minimize_methods = [
@@ -229,8 +255,24 @@ class LossPhysicsMotivatedModel:
         "trust-krylov",
     ]
     scipy_minimize_methods_not_supported_args = ["bounds"]
+    scipy_minimize_methods_use_gradient = [
+        "CG",
+        "BFGS",
+        "Newton-CG",
+        "L-BFGS-B",
+        "TNC",
+        "SLSQP",
+        "trust-constr",
+        "dogleg",
+        "trust-ncg",
+        "trust-exact",
+        "trust-krylov",
+    ]
     scipy_least_squares_methods = ["trf", "dogbox", "lm", "geodesiclm"]
     scipy_least_squares_methods_not_supported_args = ["bounds"]
+    minibatch_methods = ["SGD", "Adam"]
+    population_methods = ["differential_evolution", "CMA-ES"]
+    population_methods_not_supported_args = ["bounds", "workers"]
 
     def __init__(
         self,
@@ -238,6 +280,9 @@ class LossPhysicsMotivatedModel:
         nprocs: int = 1,
         residual_fn: Optional[Callable] = None,
         residual_data: Optional[Dict[str, Any]] = None,
+        cache_size: int = 0,
+        cache_tol: float = 0.0,
+        rebalance_after: Optional[int] = None,
     ):
 
         default_residual_data = {
@@ -258,9 +303,54 @@ class LossPhysicsMotivatedModel:
         )
         self.residual_data = residual_data
 
+        # persistent worker pool used during minimization in multiprocessing mode; the
+        # workers form a grid of (point group, configuration shard), such that each
+        # request of one or more parameters (e.g. for finite differences and population
+        # based methods) is split over both the parameters and the configurations
+        self._pool = None
+        # number of (point groups, configuration shards) of the grid
+        self._pool_grid = None
+
+        # the residual of each configuration is written in place into its segment of
+        # a preallocated buffer, i.e. residual[offsets[i]:offsets[i+1]]
+        self._residual_offsets = self._get_residual_offsets()
+        self._residual = np.empty(self._residual_offsets[-1])
+        # parameters of the residual in the buffer
+        self._residual_x = None
+
+        self._cache = _ResultCache(cache_size, cache_tol) if cache_size > 0 else None
+
+        # checkpoint of the minimization in progress
+        self._checkpoint = None
+
+        # partition of the configurations between MPI processes, and the measured
+        # compute time of the configurations of this process (0 for others)
+        self.rebalance_after = rebalance_after
+        self._mpi_partition = None
+        self._mpi_timings = np.zeros(len(calculator.get_compute_arguments()))
+        self._mpi_num_evaluations = 0
+        # whether the residual sizes of the configurations of all processes are known
+        self._mpi_residual_sizes_known = False
+
+        # buffers for MPI communication, of the parameters broadcast from rank 0 and of
+        # the residual gathered to rank 0
+        self._mpi_message = None
+        self._mpi_send = None
+        self._mpi_recv = None
+        self._mpi_recv_index = None
+        self._mpi_counts = None
+        self._mpi_displs = None
+
         logger.info(f"`{self.__class__.__name__}` instantiated.")
 
-    def minimize(self, method: str, **kwargs):
+    def minimize(
+        self,
+        method: str,
+        checkpoint: Optional[Union[str, Path]] = None,
+        checkpoint_interval: int = 10,
+        resume_from: Optional[Union[str, Path]] = None,
+        **kwargs,
+    ):
         """
         Minimize the loss.
 
@@ -268,24 +358,243 @@ class LossPhysicsMotivatedModel:
             method: minimization methods as specified at:
                 https://docs.scipy.org/doc/scipy/reference/generated/scipy.optimize.minimize.html
                 https://docs.scipy.org/doc/scipy/reference/generated/scipy.optimize.least_squares.html
+                or a mini-batch method `SGD` or `Adam`; see
+                :meth:`_minibatch_optimize` for their arguments,
+                or a population based method `differential_evolution` or `CMA-ES`;
+                see :meth:`_population_optimize` for their arguments.
+
+            checkpoint: path to a ``.npz`` file to periodically save the state of the
+                minimization: the last evaluated parameters, the best parameters and
+                loss, and the number of loss evaluations. The file is written
+                atomically (by rank 0 in MPI mode). Only the evaluations of the loss in
+                this process (rank 0 in MPI mode) are recorded, e.g. not those of the
+                mini-batch methods or in worker processes.
+
+            checkpoint_interval: number of loss evaluations between two saves of the
+                checkpoint.
+
+            resume_from: path to a checkpoint file saved by a previous minimization,
+                to start from its best parameters and continue its evaluation count. If
+                ``checkpoint`` is not given, the checkpoint is saved to this file.
 
             kwargs: extra keyword arguments that can be used by the scipy optimizer
         """
         kwargs = self._adjust_kwargs(method, **kwargs)
+        if parallel.get_MPI_world_size() > 1:
+            self._reset_MPI()
+
+        state = None
+        if resume_from is not None:
+            state = self._load_checkpoint(resume_from)
+            self.calculator.update_model_params(state["best_x"])
+            msg = (
+                f"Resume minimization from `{resume_from}`, with loss {state['best_loss']} "
+                f"after {state['nevals']} evaluations."
+            )
+            log_entry(logger, msg, level="info")
+            if checkpoint is None:
+                checkpoint = resume_from
+
+        if checkpoint is not None:
+            self._checkpoint = _Checkpoint(checkpoint, checkpoint_interval, state)
 
         msg = "Start minimization using method: {}.".format(method)
         log_entry(logger, msg, level="info")
 
-        result = self._scipy_optimize(method, **kwargs)
+        try:
+            if method in self.minibatch_methods:
+                result = self._minibatch_optimize(method, **kwargs)
+            elif method in self.population_methods:
+                result = self._population_optimize(method, **kwargs)
+            else:
+                result = self._scipy_optimize(method, **kwargs)
+        finally:
+            if self._checkpoint is not None:
+                self._checkpoint.save()
+                self._checkpoint = None
 
         msg = "Finish minimization using method: {}.".format(method)
         log_entry(logger, msg, level="info")
 
+        if self._cache is not None:
+            info = self._cache.info()
+            msg = (
+                f"Result cache: {info['hits']} hits, {info['misses']} misses, "
+                f"hit rate {info['hit_rate']:.3f}."
+            )
+            log_entry(logger, msg, level="info")
+
         # update final optimized parameters
         self.calculator.update_model_params(result.x)
 
         return result
 
+    def multistart(
+        self,
+        method: str,
+        nstarts: int = 10,
+        nprocs: Optional[int] = None,
+        scale: float = 0.5,
+        include_current: bool = True,
+        seed: Optional[int] = None,
+        **kwargs,
+    ) -> List[Dict[str, Any]]:
+        """
+        Minimize the loss from multiple initial parameters, and rank the results.
+
+        The initial parameters are sampled uniformly within the bounds of parameters
+        with both lower and upper bounds. For other parameters, they are sampled from a
+        normal distribution centered at the current value, with a standard deviation
+        of ``scale`` times its absolute value (or ``scale`` if the value is 0), and
+        clipped to the bound if there is one.
+
+        The minimizations are run concurrently in ``nprocs`` forked processes, which
+        share the compute arguments (copy on write) instead of rebuilding them. In MPI
+        mode, they are run one after another, each parallelized over the data across
+        the ranks; all the ranks should call this function with the same ``seed``.
+
+        After the minimizations, the model parameters are set to the best results.
+
+        Args:
+            method: minimization method; see :meth:`minimize`.
+            nstarts: number of minimizations.
+            nprocs: number of processes to run the minimizations. Default to the
+                ``nprocs`` provided at initialization.
+            scale: relative standard deviation to sample unbounded parameters.
+            include_current: whether to use the current parameters as the first
+                initial parameters.
+            seed: random seed to sample the initial parameters.
+            kwargs: extra keyword arguments passed to :meth:`minimize`. If
+                `checkpoint` is given, e.g. `ckpt.npz`, the checkpoint of the ``i``-th
+                minimization is saved to `ckpt_i.npz`. `resume_from` is not supported.
+
+        Returns:
+            A list of the results of the minimizations ranked by the final loss, each a
+            dict with keys: `start` (the index of the minimization), `x0` (the initial
+            parameters), `x` (the final parameters), `loss` (the final loss),
+            `success`, `message`, and `result` (the result returned by
+            :meth:`minimize`, ``None`` if the minimization failed with an exception).
+        """
+        nprocs = self.nprocs if nprocs is None else nprocs
+
+        if kwargs.get("resume_from") is not None:
+            raise LossError(
+                "`resume_from` is not supported by `multistart`, since each "
+                "minimization starts from its own initial parameters."
+            )
+
+        x = np.asarray(self.calculator.get_opt_params(), dtype=float)
+        lb, ub = self._get_opt_params_bounds_arrays()
+        rng = np.random.RandomState(seed)
+        X0 = _sample_initial_params(x, lb, ub, nstarts, scale, rng)
+        if include_current and nstarts > 0:
+            X0[0] = x
+
+        msg = f"Start {nstarts} minimizations using method: {method}."
+        log_entry(logger, msg, level="info")
+
+        if parallel.get_MPI_world_size() > 1 or nprocs <= 1:
+            results = [
+                self._minimize_from(i, X0, self, method, kwargs) for i in range(nstarts)
+            ]
+        else:
+            results = parallel.parmap2(
+                self._minimize_from,
+                range(nstarts),
+                X0,
+                self,
+                method,
+                kwargs,
+                True,
+                nprocs=min(nprocs, nstarts),
+            )
+
+        # failed minimizations have a loss of nan and are ranked last
+        results = sorted(
+            results, key=lambda r: (np.isnan(r["loss"]), r["loss"], r["start"])
+        )
+
+        msg = "Results of multi-start minimization:\n{:>6} {:>6} {:>14} {:>8}".format(
+            "rank", "start", "loss", "success"
+        )
+        for i, r in enumerate(results):
+            msg += "\n{:>6} {:>6} {:>14.6e} {:>8}".format(
+                i, r["start"], r["loss"], str(r["success"])
+            )
+        log_entry(logger, msg, level="info")
+
+        if results and not np.isnan(results[0]["loss"]):
+            self.calculator.update_model_params(results[0]["x"])
+
+        return results
+
+    @staticmethod
+    def _minimize_from(i, X0, loss, method, kwargs, forked=False) -> Dict[str, Any]:
+        """
+        Run the ``i``-th minimization of :meth:`multistart` from initial parameters
+        ``X0[i]``. If ``forked``, it runs in a forked process, with a copy of ``loss``.
+        """
+        # the minimizations are already run concurrently
+        if forked:
+            loss.nprocs = 1
+
+        # each minimization has its own checkpoint
+        if kwargs.get("checkpoint") is not None:
+            path = to_path(kwargs["checkpoint"])
+            kwargs = dict(
+                kwargs, checkpoint=path.with_name(f"{path.stem}_{i}{path.suffix}")
+            )
+
+        x0 = np.array(X0[i])
+        loss.calculator.update_model_params(x0)
+        try:
+            result = loss.minimize(method, **kwargs)
+            x = np.asarray(result.x)
+            if parallel.get_MPI_world_size() > 1:
+                # the loss cannot be recomputed, since the other ranks have stopped
+                value = getattr(result, "cost", None)
+                value = result.fun if value is None else value
+            else:
+                value = loss._get_loss(x)
+            success = bool(getattr(result, "success", True))
+            message = str(getattr(result, "message", ""))
+        except Exception as e:
+            result, x, value, success, message = None, x0, np.nan, False, repr(e)
+            log_entry(logger, f"Minimization {i} failed: {message}", level="warning")
+
+        return {
+            "start": i,
+            "x0": x0,
+            "x": x,
+            "loss": np.nan if value is None else float(value),
+            "success": success,
+            "message": message,
+            "result": result,
+        }
+
+    def _load_checkpoint(self, path: Union[str, Path]) -> Dict[str, Any]:
+        """
+        Load a checkpoint saved during :meth:`minimize`. In MPI mode, it is loaded by
+        rank 0 and broadcast to the other ranks.
+        """
+        if parallel.get_MPI_world_size() > 1:
+            comm = MPI.COMM_WORLD
+            state = _Checkpoint.load(path) if comm.Get_rank() == 0 else None
+            state = comm.bcast(state, root=0)
+        else:
+            state = _Checkpoint.load(path)
+
+        n = self.calculator.get_num_opt_params()
+        if len(state["best_x"]) != n:
+            msg = (
+                f"Expect {n} optimizing parameters in checkpoint `{path}`; got "
+                f"{len(state['best_x'])}."
+            )
+            log_entry(logger, msg, level="error")
+            raise LossError(msg)
+
+        return state
+
     def _adjust_kwargs(self, method, **kwargs):
         """
         Check kwargs and adjust them as necessary.
@@ -337,6 +646,35 @@ class LossPhysicsMotivatedModel:
                     msg = 'Method "{}" cannot handle bounds.'.format(method)
                     log_entry(logger, msg, level="error")
                     raise LossError(msg)
+
+        elif method in self.minibatch_methods:
+            # bounds are imposed internally by projecting the parameters
+            pass
+
+        elif method in self.population_methods:
+
+            # check support status
+            for i in self.population_methods_not_supported_args:
+                if i in kwargs:
+                    msg = (
+                        'Argument "{}" should not be set via the "minimize" method. '
+                        "It it set internally.".format(i)
+                    )
+                    log_entry(logger, msg, level="error")
+                    raise LossError(msg)
+
+            # adjust bounds
+            if method == "differential_evolution":
+                bounds = self.calculator.get_opt_params_bounds()
+                if any(b[0] is None or b[1] is None for b in bounds):
+                    msg = (
+                        'Method "{}" requires lower and upper bounds of all '
+                        "parameters.".format(method)
+                    )
+                    log_entry(logger, msg, level="error")
+                    raise LossError(msg)
+                kwargs["bounds"] = bounds
+
         else:
             msg = 'minimization method "{}" not supported.'.format(method)
             log_entry(logger, msg, level="error")
@@ -384,14 +722,30 @@ class LossPhysicsMotivatedModel:
                 minimize_fn = scipy.optimize.minimize
                 func = self._get_loss_MPI
 
+            # analytic Jacobian of the residual, with the rows of the configurations of
+            # each rank gathered to rank 0; otherwise, left to scipy
+            if (
+                method in self.scipy_minimize_methods_use_gradient
+                or (
+                    method in self.scipy_least_squares_methods
+                    and method != "geodesiclm"
+                )
+            ) and ("jac" not in kwargs and self._has_analytic_jacobian()):
+                msg = "Using analytic Jacobian of the residual."
+                log_entry(logger, msg, level="info")
+                if method in self.scipy_least_squares_methods:
+                    kwargs["jac"] = self._get_residual_jacobian_MPI
+                else:
+                    # loss and its gradient are returned together by func
+                    kwargs["jac"] = True
+                    func = self._get_loss_and_gradient_MPI
+
             if rank == 0:
                 result = minimize_fn(func, x, method=method, **kwargs)
                 # notify other process to break func
-                break_flag = True
-                for i in range(1, size):
-                    comm.send(break_flag, dest=i, tag=i)
+                self._stop_MPI_workers()
             else:
-                func(x)
+                self._compute_residual_MPI(x)
                 result = None
 
             result = comm.bcast(result, root=0)
@@ -421,81 +775,730 @@ class LossPhysicsMotivatedModel:
                     )
                     log_entry(logger, msg, level="warning")
 
-            x = self.calculator.get_opt_params()
-            if method in self.scipy_least_squares_methods:
-                if method == "geodesiclm":
-                    from geodesicLM import geodesiclm
+            x = self.calculator.get_opt_params()
+
+            # Jacobian of the residual, computed analytically or by finite differences
+            # of the parameters in parallel; otherwise, left to scipy
+            analytic = False
+            fd_scheme = None
+            rel_step = None
+            if method in self.scipy_minimize_methods_use_gradient or (
+                method in self.scipy_least_squares_methods and method != "geodesiclm"
+            ):
+                options = kwargs.get("options", {})
+                if "jac" not in kwargs and self._has_analytic_jacobian():
+                    analytic = True
+                    msg = "Using analytic Jacobian of the residual."
+                    log_entry(logger, msg, level="info")
+                elif (
+                    self.nprocs > 1
+                    and kwargs.get("jac", "2-point") in ["2-point", "3-point"]
+                    and "eps" not in options
+                ):
+                    # an absolute step given by `eps` is left to scipy
+                    fd_scheme = kwargs.pop("jac", "2-point")
+                    if method in self.scipy_least_squares_methods:
+                        rel_step = kwargs.pop("diff_step", None)
+                    else:
+                        rel_step = options.get("finite_diff_rel_step")
+                    msg = (
+                        f"Using {fd_scheme} finite-difference Jacobian of the "
+                        "residual, with parameters perturbed in parallel."
+                    )
+                    log_entry(logger, msg, level="info")
+
+            if method in self.scipy_least_squares_methods:
+                if method == "geodesiclm":
+                    from geodesicLM import geodesiclm
+
+                    minimize_fn = geodesiclm
+                else:
+                    minimize_fn = scipy.optimize.least_squares
+                    if analytic:
+                        kwargs["jac"] = self._get_residual_jacobian
+                    elif fd_scheme is not None:
+                        kwargs["jac"] = functools.partial(
+                            self._get_residual_jacobian_fd,
+                            scheme=fd_scheme,
+                            rel_step=rel_step,
+                        )
+                func = self._get_residual
+            elif method in self.scipy_minimize_methods:
+                minimize_fn = scipy.optimize.minimize
+                func = self._get_loss
+                if analytic or fd_scheme is not None:
+                    # loss and its gradient are returned together by func
+                    kwargs["jac"] = True
+                    func = functools.partial(
+                        self._get_loss_and_gradient,
+                        fd_scheme=fd_scheme,
+                        rel_step=rel_step,
+                    )
+
+            if self.nprocs > 1:
+                # workers hold their shard of compute arguments for the entire
+                # minimization, and only receive the parameters at each evaluation
+                self._pool = self._create_pool()
+            try:
+                result = minimize_fn(func, x, method=method, **kwargs)
+            finally:
+                if self._pool is not None:
+                    self._pool.close()
+                self._pool = None
+
+            return result
+
+    def _minibatch_optimize(
+        self,
+        method: str,
+        batch_size: int = 100,
+        num_epochs: int = 10,
+        lr: float = 0.001,
+        momentum: float = 0.0,
+        betas: Tuple[float, float] = (0.9, 0.999),
+        eps: float = 1e-8,
+        jac: Optional[str] = None,
+        seed: Optional[int] = None,
+    ) -> scipy.optimize.OptimizeResult:
+        """
+        Minimize the loss with stochastic gradient methods, where each step uses the
+        gradient of the loss of a random mini-batch of the configurations.
+
+        In each epoch, the configurations are shuffled and split into batches of
+        ``batch_size`` configurations, and a step is taken for each batch. The loss of a
+        batch is averaged over its configurations, i.e. ``0.5 |r_b|^2 / B`` for the
+        residual ``r_b`` of a batch of ``B`` configurations, such that the step size does
+        not depend on the batch size. After each step, the parameters are projected onto
+        their bounds.
+
+        A user should not call this function, but should call the ``minimize`` method.
+        The computation is serial; ``nprocs`` is not used, and MPI is not supported.
+
+        Args:
+            method: `SGD` (with optional momentum) or `Adam`.
+            batch_size: number of configurations in a batch.
+            num_epochs: number of passes over all configurations.
+            lr: learning rate.
+            momentum: momentum factor of `SGD`.
+            betas: coefficients of the running averages of the gradient and its square
+                of `Adam`.
+            eps: term added to the denominator of `Adam` for numerical stability.
+            jac: how to compute the gradient: ``2-point`` or ``3-point`` for finite
+                differences. If ``None``, the analytic Jacobian is used if available,
+                otherwise ``2-point``.
+            seed: random seed to shuffle the configurations.
+
+        Returns:
+            The result, with `x` the final parameters, `fun` the average batch loss of
+            the last epoch, `history` the average batch loss of each epoch, `nit` the
+            number of steps, and `nepoch` the number of epochs.
+        """
+        if parallel.get_MPI_world_size() > 1:
+            msg = f'Method "{method}" is not supported in MPI mode.'
+            log_entry(logger, msg, level="error")
+            raise LossError(msg)
+
+        if jac is None:
+            jac = "analytic" if self._has_analytic_jacobian() else "2-point"
+        elif jac not in ["2-point", "3-point"]:
+            raise LossError(
+                f"Expect `jac` to be `2-point`, `3-point`, or `None`; got {jac}."
+            )
+
+        x = np.asarray(self.calculator.get_opt_params(), dtype=float)
+        lb, ub = self._get_opt_params_bounds_arrays()
+        rng = np.random.RandomState(seed)
+        N = len(self.calculator.get_compute_arguments())
+
+        # first and second moments of the gradient (only the first for SGD)
+        m = np.zeros_like(x)
+        v = np.zeros_like(x)
+
+        history = []
+        nit = 0
+        for epoch in range(num_epochs):
+            indices = rng.permutation(N)
+            batch_losses = []
+            for start in range(0, N, batch_size):
+                batch = indices[start : start + batch_size]
+                loss, grad = self._get_loss_and_gradient_batch(x, batch, jac)
+                batch_losses.append(loss)
+                nit += 1
+
+                if method == "SGD":
+                    m = momentum * m + grad
+                    x = x - lr * m
+                else:
+                    m = betas[0] * m + (1 - betas[0]) * grad
+                    v = betas[1] * v + (1 - betas[1]) * grad ** 2
+                    m_hat = m / (1 - betas[0] ** nit)
+                    v_hat = v / (1 - betas[1] ** nit)
+                    x = x - lr * m_hat / (np.sqrt(v_hat) + eps)
+                x = np.clip(x, lb, ub)
+
+            history.append(np.mean(batch_losses))
+            msg = f"Epoch {epoch}, average batch loss {history[-1]:.6e}."
+            log_entry(logger, msg, level="info")
+
+        self.calculator.update_model_params(x)
+
+        return scipy.optimize.OptimizeResult(
+            x=x,
+            fun=history[-1] if history else None,
+            history=history,
+            nit=nit,
+            nepoch=num_epochs,
+            success=True,
+            message="Maximum number of epochs reached.",
+        )
+
+    def _get_loss_and_gradient_batch(self, x, batch, jac: str):
+        """
+        Compute the loss of a batch of configurations, averaged over the
+        configurations, and its gradient w.r.t. the optimizing parameters.
+
+        Args:
+            x: optimizing parameter values, 1D array
+            batch: indices of the compute arguments in the batch
+            jac: `analytic`, `2-point`, or `3-point`.
+        """
+        cas = self.calculator.get_compute_arguments()
+        if isinstance(self.calculator, _WrapperCalculator):
+            calc_list = self.calculator.get_calculator_list()
+        else:
+            calc_list = [self.calculator] * len(cas)
+
+        def get_residual(p):
+            self.calculator.update_model_params(p)
+            residuals = [
+                self._get_residual_single_config(
+                    cas[i], calc_list[i], self.residual_fn, self.residual_data
+                )
+                for i in batch
+            ]
+            return np.concatenate(residuals)
+
+        if jac == "analytic":
+            residual = get_residual(x)
+            jacs = [
+                self._get_residual_jacobian_single_config(
+                    cas[i], self.calculator, self.residual_fn, self.residual_data
+                )
+                for i in batch
+            ]
+            jacobian = np.concatenate(jacs)
+        else:
+            lb, ub = self._get_opt_params_bounds_arrays()
+            h, central = _get_finite_difference_steps(x, lb, ub, jac)
+            points = _get_finite_difference_points(x, h, central, jac)
+            residual = get_residual(x)
+            residuals = [get_residual(p) for p in points]
+            jacobian = _get_finite_difference_jacobian(
+                residual, residuals, h, central, jac
+            )
+
+        B = len(batch)
+        loss = 0.5 * np.dot(residual, residual) / B
+        grad = np.dot(jacobian.T, residual) / B
+
+        return loss, grad
+
+    def evaluate_many(self, X) -> np.array:
+        """
+        Compute the loss at a batch of parameters.
+
+        In multiprocessing mode, the parameters and the compute arguments are both split
+        between the worker processes, so that a batch is computed in parallel even for
+        a single configuration. In MPI mode, if there are more parameter sets than
+        configurations, the parameter sets are split between the ranks, each computing
+        the loss of all the configurations; otherwise, each loss is computed by all the
+        ranks, each for its part of the configurations. This is only supported within
+        :meth:`minimize` of population based methods, where the other ranks wait for
+        rank 0 to request evaluations.
+
+        Args:
+            X: 2D array of shape (number of parameter sets, number of optimizing
+                parameters).
+
+        Returns:
+            1D array of the loss of each parameter set.
+        """
+        X = np.atleast_2d(np.asarray(X, dtype=float))
+
+        if parallel.get_MPI_world_size() > 1:
+            if len(X) > len(self.calculator.get_compute_arguments()):
+                return self._evaluate_many_MPI(X)
+            return np.asarray([self._get_loss_MPI(x) for x in X])
+
+        if self._pool is not None:
+            losses = np.asarray(self._map_pool(list(X), "loss"))
+        elif self.nprocs > 1:
+            self._pool = self._create_pool()
+            try:
+                losses = np.asarray(self._map_pool(list(X), "loss"))
+            finally:
+                self._pool.close()
+                self._pool = None
+        else:
+            return np.asarray([self._get_loss(x) for x in X])
+
+        # the losses computed by the workers are recorded in the main process
+        if self._checkpoint is not None:
+            for x, loss in zip(X, losses):
+                self._checkpoint.record(x, loss)
+
+        return losses
+
+    def _population_optimize(self, method: str, **kwargs):
+        """
+        Minimize the loss with population based methods, where the loss of all the
+        candidates of a generation are computed in parallel by :meth:`evaluate_many`.
+
+        A user should not call this function, but should call the ``minimize`` method.
+
+        Args:
+            method: `differential_evolution` or `CMA-ES`.
+            kwargs: for `differential_evolution`, extra keyword arguments of
+                scipy.optimize.differential_evolution, except `bounds` (all the
+                optimizing parameters need to be bounded) and `workers`; for `CMA-ES`,
+                extra keyword arguments of :func:`~kliff.cma_es.cma_es`, except
+                `bounds`.
+        """
+        size = parallel.get_MPI_world_size()
+        loss_fn = self._get_loss_MPI if size > 1 else self._get_loss
+        x0 = np.asarray(self.calculator.get_opt_params(), dtype=float)
+
+        def run():
+            if method == "differential_evolution":
+                # candidates of a generation are evaluated together only when the
+                # population is updated once per generation
+                kwargs.setdefault("updating", "deferred")
+                return scipy.optimize.differential_evolution(
+                    loss_fn, workers=self._map_loss, **kwargs
+                )
+            else:
+                lb, ub = self._get_opt_params_bounds_arrays()
+                return cma_es(self.evaluate_many, x0, bounds=(lb, ub), **kwargs)
+
+        if size > 1:
+            comm = MPI.COMM_WORLD
+            rank = comm.Get_rank()
+
+            if rank == 0:
+                result = run()
+                # notify other process to break
+                self._stop_MPI_workers()
+            else:
+                self._compute_residual_MPI(x0)
+                result = None
+
+            return comm.bcast(result, root=0)
+
+        else:
+            if self.nprocs > 1:
+                self._pool = self._create_pool()
+            try:
+                result = run()
+            finally:
+                if self._pool is not None:
+                    self._pool.close()
+                self._pool = None
+
+            return result
+
+    def _map_loss(self, func, X) -> List[float]:
+        """
+        Map-like callable, used as the `workers` of
+        scipy.optimize.differential_evolution, to compute the loss of all the
+        candidates of a generation together.
+
+        `func` is the loss function wrapped by scipy, and is not called; the loss is
+        computed by :meth:`evaluate_many` instead.
+        """
+        return list(self.evaluate_many(list(X)))
+
+    def _create_pool(self) -> parallel.WorkerPool:
+        """
+        Create a pool of worker processes arranged in a grid of (point group,
+        configuration shard).
+
+        The compute arguments are split into `min(nprocs, number of configurations)`
+        contiguous shards, and the remaining factor of the processes is used to split
+        the parameters of a request, e.g. a single configuration with `nprocs=4`
+        computes the finite difference points on 4 workers.
+        """
+        cas = self.calculator.get_compute_arguments()
+        if isinstance(self.calculator, _WrapperCalculator):
+            calc_list = self.calculator.get_calculator_list()
+        else:
+            calc_list = [self.calculator] * len(cas)
+        pairs = list(zip(cas, calc_list))
+
+        num_shards = max(1, min(self.nprocs, len(pairs)))
+        num_groups = max(1, self.nprocs // num_shards)
+        shards = [
+            [pairs[i] for i in idx]
+            for idx in np.array_split(np.arange(len(pairs)), num_shards)
+        ]
+        self._pool_grid = (num_groups, num_shards)
+
+        # one (point group, configuration shard) item for each worker
+        items = [(g, shard) for g in range(num_groups) for shard in shards]
+
+        return parallel.WorkerPool(
+            self._get_residual_shard,
+            items,
+            num_groups,
+            self.calculator,
+            self.residual_fn,
+            self.residual_data,
+            nprocs=len(items),
+        )
+
+    def _map_pool(self, points: List[np.array], mode: str) -> List[Any]:
+        """
+        Compute the residuals, Jacobians or losses at a list of parameters with the
+        worker pool, and combine the results of the configuration shards.
+
+        Args:
+            points: list of optimizing parameter values.
+            mode: `residual`, `jacobian` or `loss`, see :meth:`_get_residual_shard`.
+
+        Returns:
+            A list of results, one for each of the parameters: a list of the residual
+            of each configuration for `residual`, the Jacobian for `jacobian`, and the
+            loss for `loss`.
+        """
+        num_shards = self._pool_grid[1]
+
+        # results[k][j]: result of configuration shard j at points[k]
+        results = [[None] * num_shards for _ in points]
+        for w, worker_results in enumerate(self._pool.map(points, mode)):
+            j = w % num_shards
+            for k, r in worker_results:
+                results[k][j] = r
+
+        if mode == "residual":
+            # shards are contiguous, so the residuals are in order of the configs
+            return [[ri for r in rs for ri in r] for rs in results]
+        elif mode == "loss":
+            return [sum(rs) for rs in results]
+        else:
+            return [np.concatenate(rs) for rs in results]
+
+    def _get_residual_jacobian_fd(
+        self,
+        x,
+        scheme: str = "2-point",
+        rel_step: Optional[float] = None,
+        f0: Optional[np.array] = None,
+    ):
+        """
+        Compute the Jacobian of the residual w.r.t. the optimizing parameters using
+        finite differences, where the residuals at all the perturbed parameters are
+        evaluated together by the worker processes, each for its shard of the compute
+        arguments.
+
+        The step size and the treatment of bounds follow scipy.optimize.least_squares:
+        a one-sided difference pointing into the feasible region is used if a central
+        (for ``3-point``) or forward (for ``2-point``) difference would violate the
+        bounds.
+
+        Args:
+            x: optimizing parameter values, 1D array
+            scheme: ``2-point`` or ``3-point``.
+            rel_step: relative step size, e.g. `diff_step` of
+                scipy.optimize.least_squares. If ``None``, the default of the scheme is
+                used.
+            f0: residual at `x`. If ``None``, the residual of the last evaluation is
+                used if it is at `x` (e.g. scipy.optimize.least_squares computes the
+                Jacobian right after the residual), otherwise it is computed.
+
+        Returns:
+            2D array of shape (len(residual), len(x)).
+        """
+        x = np.asarray(x, dtype=float)
+        if f0 is None:
+            if self._residual_x is not None and np.array_equal(self._residual_x, x):
+                f0 = self._residual.copy()
+            else:
+                f0 = self._get_residual(x)
+
+        lb, ub = self._get_opt_params_bounds_arrays()
+        h, central = _get_finite_difference_steps(x, lb, ub, scheme, rel_step)
+        points = _get_finite_difference_points(x, h, central, scheme)
+
+        if self._pool is not None:
+            residuals = [np.concatenate(r) for r in self._map_pool(points, "residual")]
+        else:
+            residuals = [self._get_residual(p) for p in points]
+
+        # publish params x to predictor
+        self.calculator.update_model_params(x)
+
+        return _get_finite_difference_jacobian(f0, residuals, h, central, scheme)
+
+    def _get_opt_params_bounds_arrays(self) -> Tuple[np.array, np.array]:
+        """
+        Get the lower and upper bounds of the optimizing parameters as arrays, with
+        ``-inf`` and ``inf`` for no bounds.
+        """
+        bounds = self.calculator.get_opt_params_bounds()
+        lb = np.asarray([-np.inf if b[0] is None else b[0] for b in bounds])
+        ub = np.asarray([np.inf if b[1] is None else b[1] for b in bounds])
+
+        return lb, ub
+
+    def _get_residual(self, x):
+        """
+        Compute the residual in serial or multiprocessing mode.
+
+        This is a callable for optimizing method in scipy.optimize.least_squares,
+        which is passed as the first positional argument.
+
+        Args:
+            x: optimizing parameter values, 1D array
+
+        Returns:
+            A copy of the residual buffer, since the optimizer may keep the residuals
+            of previous evaluations.
+        """
+        return self._get_residual_and_loss(x)[0].copy()
+
+    def _get_residual_and_loss(self, x) -> Tuple[np.array, float]:
+        """
+        Compute the residual (into the preallocated residual buffer) and the loss,
+        or get them from the result cache if `x` is evaluated before.
+
+        Args:
+            x: optimizing parameter values, 1D array
+
+        Returns:
+            The residual buffer, which is overwritten by the next call, and the loss.
+        """
+        cached = None if self._cache is None else self._cache.get(x)
+        if cached is not None:
+            residual, loss = cached
+            # the parameters are published as if computed
+            self.calculator.update_model_params(x)
+            self._residual[:] = residual
+            residual = self._residual
+        else:
+            residual = self._compute_residual(x)
+            loss = 0.5 * np.dot(residual, residual)
+            if self._cache is not None:
+                self._cache.add(x, residual.copy(), loss)
+        self._residual_x = np.array(x, dtype=float)
+
+        if self._checkpoint is not None:
+            self._checkpoint.record(x, loss)
+
+        return residual, loss
+
+    def cache_info(self) -> Optional[Dict[str, Any]]:
+        """
+        Statistics of the result cache, with keys `hits`, `misses`, `hit_rate`,
+        `size`, and `max_size`; ``None`` if caching is not enabled.
+        """
+        return None if self._cache is None else self._cache.info()
+
+    def clear_cache(self):
+        """
+        Clear the result cache, e.g. after changing the dataset or residual function.
+        """
+        if self._cache is not None:
+            self._cache.clear()
+
+    def _compute_residual(self, x) -> np.array:
+        """
+        Compute the residual into the preallocated residual buffer.
+
+        Args:
+            x: optimizing parameter values, 1D array
+
+        Returns:
+            The residual buffer, which is overwritten by the next call.
+        """
+        if self._pool is not None:
+            return self._set_residual(self._map_pool([x], "residual")[0])
+
+        # publish params x to predictor
+        self.calculator.update_model_params(x)
+
+        cas = self.calculator.get_compute_arguments()
+
+        if isinstance(self.calculator, _WrapperCalculator):
+            calc_list = self.calculator.get_calculator_list()
+        else:
+            calc_list = [self.calculator] * len(cas)
+
+        if self.nprocs > 1:
+            residuals = parallel.parmap2(
+                self._get_residual_single_config,
+                zip(cas, calc_list),
+                self.residual_fn,
+                self.residual_data,
+                nprocs=self.nprocs,
+                tuple_X=True,
+            )
+        else:
+            residuals = (
+                self._get_residual_single_config(
+                    ca, calc, self.residual_fn, self.residual_data
+                )
+                for ca, calc in zip(cas, calc_list)
+            )
+
+        return self._set_residual(list(residuals))
+
+    def _set_residual(self, residuals: List[np.array]) -> np.array:
+        """
+        Write the residual of each configuration into the residual buffer.
+
+        If the sizes of the residuals are different from the expected ones, e.g. a
+        custom residual function does not return one component for each component of
+        the prediction, the offsets are updated from the actual sizes and the buffer is
+        reallocated.
+
+        Args:
+            residuals: residual of each configuration
+
+        Returns:
+            The residual buffer, which is overwritten by the next call.
+        """
+        sizes = [len(r) for r in residuals]
+        if not np.array_equal(sizes, np.diff(self._residual_offsets)):
+            self._set_residual_sizes(sizes)
+        np.concatenate(residuals, out=self._residual)
+
+        return self._residual
+
+    def _set_residual_sizes(self, sizes: Sequence[int]):
+        """
+        Set the offsets of the residual of each configuration from their sizes, and
+        reallocate the residual buffer.
+        """
+        self._residual_offsets = np.concatenate(([0], np.cumsum(sizes, dtype=int)))
+        self._residual = np.empty(self._residual_offsets[-1])
+
+        msg = (
+            "The sizes of the residuals are different from those of the predictions; "
+            f"the residual buffer is resized to {len(self._residual)}."
+        )
+        log_entry(logger, msg, level="debug")
+
+    def _get_residual_offsets(self) -> np.array:
+        """
+        Get the offsets of the residual of each configuration in the residual of all
+        configurations, assuming the residual of a configuration has the same size as
+        its prediction. They are updated at the first evaluation if the residuals have
+        different sizes.
 
-                    minimize_fn = geodesiclm
-                else:
-                    minimize_fn = scipy.optimize.least_squares
-                func = self._get_residual
-            elif method in self.scipy_minimize_methods:
-                minimize_fn = scipy.optimize.minimize
-                func = self._get_loss
+        Returns:
+            1D array of size `number of configurations + 1`.
+        """
+        cas = self.calculator.get_compute_arguments()
+        sizes = [
+            int(ca.compute_energy)
+            + 3 * ca.conf.get_num_atoms() * int(ca.compute_forces)
+            + 6 * int(ca.compute_stress)
+            for ca in cas
+        ]
 
-            result = minimize_fn(func, x, method=method, **kwargs)
-            return result
+        return np.concatenate(([0], np.cumsum(sizes, dtype=int)))
 
-    def _get_residual(self, x):
+    def _get_residual_jacobian(self, x):
         """
-        Compute the residual in serial or multiprocessing mode.
+        Compute the Jacobian of the residual w.r.t. the optimizing parameters in serial
+        or multiprocessing mode, using the analytic derivatives of the predictions.
 
-        This is a callable for optimizing method in scipy.optimize.least_squares,
-        which is passed as the first positional argument.
+        This is a callable passed as the `jac` argument of
+        scipy.optimize.least_squares.
 
         Args:
             x: optimizing parameter values, 1D array
+
+        Returns:
+            2D array of shape (len(residual), len(x)).
         """
 
+        if self._pool is not None:
+            return self._map_pool([x], "jacobian")[0]
+
         # publish params x to predictor
         self.calculator.update_model_params(x)
 
         cas = self.calculator.get_compute_arguments()
 
-        # TODO the if else could be combined
-        if isinstance(self.calculator, _WrapperCalculator):
-            calc_list = self.calculator.get_calculator_list()
-            X = zip(cas, calc_list)
-            if self.nprocs > 1:
-                residuals = parallel.parmap2(
-                    self._get_residual_single_config,
-                    X,
-                    self.residual_fn,
-                    self.residual_data,
-                    nprocs=self.nprocs,
-                    tuple_X=True,
+        if self.nprocs > 1:
+            jacs = parallel.parmap2(
+                self._get_residual_jacobian_single_config,
+                cas,
+                self.calculator,
+                self.residual_fn,
+                self.residual_data,
+                nprocs=self.nprocs,
+                tuple_X=False,
+            )
+        else:
+            jacs = [
+                self._get_residual_jacobian_single_config(
+                    ca, self.calculator, self.residual_fn, self.residual_data
                 )
-                residual = np.concatenate(residuals)
-            else:
-                residual = []
-                for ca, calc in X:
-                    current_residual = self._get_residual_single_config(
-                        ca, calc, self.residual_fn, self.residual_data
-                    )
-                    residual = np.concatenate((residual, current_residual))
+                for ca in cas
+            ]
+
+        return np.concatenate(jacs)
+
+    def _get_loss_and_gradient(
+        self, x, fd_scheme: Optional[str] = None, rel_step: Optional[float] = None
+    ):
+        """
+        Compute the loss and its gradient ``J^T r`` w.r.t. the optimizing parameters,
+        where ``J`` is the Jacobian of the residual ``r``.
+
+        This is a callable for gradient based optimizing method in
+        scipy.optimize.minimize, used with `jac=True`.
 
+        Args:
+            x: 1D array, optimizing parameter values
+            fd_scheme: ``2-point`` or ``3-point`` to compute the Jacobian by finite
+                differences (see :meth:`_get_residual_jacobian_fd`). If ``None``, the
+                analytic Jacobian is used.
+            rel_step: relative step size of the finite differences.
+        """
+        residual, loss = self._get_residual_and_loss(x)
+        if fd_scheme is None:
+            jac = self._get_residual_jacobian(x)
         else:
-            if self.nprocs > 1:
-                residuals = parallel.parmap2(
-                    self._get_residual_single_config,
-                    cas,
-                    self.calculator,
-                    self.residual_fn,
-                    self.residual_data,
-                    nprocs=self.nprocs,
-                    tuple_X=False,
-                )
-                residual = np.concatenate(residuals)
-            else:
-                residual = []
-                for ca in cas:
-                    current_residual = self._get_residual_single_config(
-                        ca, self.calculator, self.residual_fn, self.residual_data
-                    )
-                    residual = np.concatenate((residual, current_residual))
+            # the residual buffer is overwritten at the perturbed parameters
+            residual = residual.copy()
+            jac = self._get_residual_jacobian_fd(
+                x, fd_scheme, rel_step=rel_step, f0=residual
+            )
+        grad = np.dot(jac.T, residual)
 
-        return residual
+        return loss, grad
+
+    def _has_analytic_jacobian(self) -> bool:
+        """
+        Whether the Jacobian of the residual can be computed analytically.
+
+        This requires the calculator to provide the derivatives of the predictions
+        w.r.t. the optimizing parameters, and the residual function to be one of the
+        built-in ones, which are linear in the prediction. Otherwise, the optimizers fall
+        back to finite differences.
+        """
+        if not isinstance(self.calculator, Calculator):
+            return False
+        if self.residual_fn not in [
+            energy_forces_residual,
+            energy_residual,
+            forces_residual,
+        ]:
+            return False
+
+        return self.calculator.has_prediction_jacobian()
 
     def _get_loss(self, x):
         """
@@ -507,80 +1510,349 @@ class LossPhysicsMotivatedModel:
         Args:
             x: 1D array, optimizing parameter values
         """
-        residual = self._get_residual(x)
-        loss = 0.5 * np.linalg.norm(residual) ** 2
+        _, loss = self._get_residual_and_loss(x)
         return loss
 
     def _get_residual_MPI(self, x):
-        def residual_my_chunk(x):
-            # broadcast parameters
-            x = comm.bcast(x, root=0)
+        """
+        Compute the residual in MPI mode.
+
+        Args:
+            x: optimizing parameter values, 1D array
+
+        Returns:
+            The residual on rank 0, and ``None`` on the other ranks.
+        """
+        residual = self._compute_residual_MPI(x)
+        if residual is not None:
+            # the optimizer may keep the residuals of previous evaluations
+            residual = residual.copy()
+        return residual
+
+    def _compute_residual_MPI(self, x):
+        """
+        Compute the residual into the preallocated residual buffer in MPI mode.
+
+        Rank 0 runs the optimizer and returns the residual buffer. The other ranks
+        loop to compute the residual of their configurations whenever rank 0 does,
+        until they are notified to stop, and then return ``None``.
+
+        At each evaluation, a buffer of a flag followed by the parameters is broadcast
+        from rank 0, and the residuals of the configurations of all ranks are gathered
+        to rank 0, without pickling. The flag is 0 to compute the residual, 1 to stop,
+        2 to compute the losses of a batch of parameters with
+        :meth:`_evaluate_many_MPI`, and 3 to compute the Jacobian of the residual with
+        :meth:`_get_residual_jacobian_MPI`.
+        """
+        comm = MPI.COMM_WORLD
+        rank = comm.Get_rank()
+
+        cas = self.calculator.get_compute_arguments()
+        if self._mpi_partition is None:
+            self._set_mpi_partition(self._split_data())
+        if self._mpi_message is None:
+            n = self.calculator.get_num_opt_params()
+            self._mpi_message = np.zeros(1 + n)
+        message = self._mpi_message
+
+        while True:
+
+            if rank == 0:
+                message[0] = 0
+                message[1:] = x
+            comm.Bcast(message, root=0)
+            if message[0] == 2:
+                self._evaluate_many_MPI()
+                continue
+            if message[0] == 3:
+                self._get_residual_jacobian_MPI()
+                continue
+            if message[0] != 0:
+                break
+
             # publish params x to predictor
-            self.calculator.update_model_params(x)
+            self.calculator.update_model_params(message[1:].copy())
 
-            residual = []
-            for ca in cas:
+            residuals = []
+            for i in self._mpi_partition[rank]:
+                t0 = time.perf_counter()
                 current_residual = self._get_residual_single_config(
-                    ca, self.calculator, self.residual_fn, self.residual_data
+                    cas[i], self.calculator, self.residual_fn, self.residual_data
                 )
-                residual.extend(current_residual)
-            return residual
+                self._mpi_timings[i] = time.perf_counter() - t0
+                residuals.append(current_residual)
+
+            if not self._mpi_residual_sizes_known:
+                self._gather_residual_sizes([len(r) for r in residuals])
+            residual = self._mpi_send
+            np.concatenate([[]] + residuals, out=residual)
+
+            if rank == 0:
+                recv = [self._mpi_recv, self._mpi_counts, self._mpi_displs, MPI.DOUBLE]
+                comm.Gatherv(residual, recv, root=0)
+                # place the residual of each configuration at its offset
+                self._residual[self._mpi_recv_index] = self._mpi_recv
+            else:
+                comm.Gatherv(residual, None, root=0)
+
+            self._mpi_num_evaluations += 1
+            if self._mpi_num_evaluations == self.rebalance_after:
+                self._rebalance_data()
+
+            if rank == 0:
+                if self._checkpoint is not None:
+                    loss = 0.5 * np.dot(self._residual, self._residual)
+                    self._checkpoint.record(message[1:], loss)
+                return self._residual
+
+    def _reset_MPI(self):
+        """
+        Reset the partition of the configurations between the MPI processes and the
+        communication buffers at the start of a minimization, since the number of
+        optimizing parameters and the configurations may have changed since the last
+        one.
+        """
+        n = self.calculator.get_num_opt_params()
+        self._mpi_message = np.zeros(1 + n)
+        self._residual_offsets = self._get_residual_offsets()
+        self._residual = np.empty(self._residual_offsets[-1])
+        self._mpi_partition = None
+        self._mpi_timings = np.zeros(len(self.calculator.get_compute_arguments()))
+        self._mpi_num_evaluations = 0
+        self._mpi_residual_sizes_known = False
+        self._mpi_send = None
+        self._mpi_recv = None
+        self._mpi_recv_index = None
+        self._mpi_counts = None
+        self._mpi_displs = None
+
+    def _gather_residual_sizes(self, sizes: List[int]):
+        """
+        Learn the residual size of each configuration at the first evaluation in MPI
+        mode, since each rank only knows the sizes of its own configurations. The sizes
+        are assumed not to change in later evaluations.
+
+        Args:
+            sizes: residual sizes of the configurations of this rank, in the order of
+                its partition.
+        """
+        comm = MPI.COMM_WORLD
+        rank = comm.Get_rank()
+
+        all_sizes = np.diff(self._residual_offsets)
+        local = list(zip(self._mpi_partition[rank], sizes))
+        for part in comm.allgather(local):
+            for i, n in part:
+                all_sizes[i] = n
+
+        if not np.array_equal(all_sizes, np.diff(self._residual_offsets)):
+            self._set_residual_sizes(all_sizes)
+            self._set_mpi_partition(self._mpi_partition)
+        self._mpi_residual_sizes_known = True
 
+    def _stop_MPI_workers(self):
+        """
+        Notify the other ranks, looping in :meth:`_compute_residual_MPI`, to stop.
+        """
+        if self._mpi_message is None:
+            n = self.calculator.get_num_opt_params()
+            self._mpi_message = np.zeros(1 + n)
+        self._mpi_message[0] = 1
+        MPI.COMM_WORLD.Bcast(self._mpi_message, root=0)
+
+    def _evaluate_many_MPI(self, X=None) -> np.array:
+        """
+        Compute the loss at a batch of parameters in MPI mode, where the parameter sets
+        are split between the ranks and each rank computes the loss of all the
+        configurations at its parameter sets.
+
+        Rank 0 notifies the other ranks, looping in :meth:`_compute_residual_MPI`, and
+        broadcasts the parameters `X`; the other ranks call this with ``X=None``.
+
+        Returns:
+            1D array of the loss of each parameter set, on all ranks.
+        """
         comm = MPI.COMM_WORLD
         rank = comm.Get_rank()
         size = comm.Get_size()
 
-        # get my chunk of data
-        cas = self._split_data()
+        if rank == 0:
+            if self._mpi_message is None:
+                n = self.calculator.get_num_opt_params()
+                self._mpi_message = np.zeros(1 + n)
+            self._mpi_message[0] = 2
+            comm.Bcast(self._mpi_message, root=0)
+        X = comm.bcast(X, root=0)
+
+        cas = self.calculator.get_compute_arguments()
+        losses = np.zeros(len(X))
+        for k in range(rank, len(X), size):
+            self.calculator.update_model_params(X[k])
+            for ca in cas:
+                r = self._get_residual_single_config(
+                    ca, self.calculator, self.residual_fn, self.residual_data
+                )
+                losses[k] += 0.5 * np.dot(r, r)
+        comm.Allreduce(MPI.IN_PLACE, losses, op=MPI.SUM)
 
-        while True:
+        if rank == 0 and self._checkpoint is not None:
+            for x, loss in zip(X, losses):
+                self._checkpoint.record(x, loss)
 
-            if rank == 0:
-                break_flag = False
-                for i in range(1, size):
-                    comm.send(break_flag, dest=i, tag=i)
-                residual = residual_my_chunk(x)
-                all_residuals = comm.gather(residual, root=0)
-                return np.concatenate(all_residuals)
-            else:
-                break_flag = comm.recv(source=0, tag=rank)
-                if break_flag:
-                    break
-                else:
-                    residual = residual_my_chunk(x)
-                    all_residuals = comm.gather(residual, root=0)
+        return losses
 
-    def _get_loss_MPI(self, x):
+    def _get_residual_jacobian_MPI(self, x=None) -> Optional[np.array]:
+        """
+        Compute the Jacobian of the residual w.r.t. the optimizing parameters in MPI
+        mode, using the analytic derivatives of the predictions.
+
+        Each rank computes the rows of the configurations of its partition, which are
+        gathered to rank 0 and placed at the offsets of the configurations. Rank 0
+        notifies the other ranks, looping in :meth:`_compute_residual_MPI`, and
+        broadcasts the parameters `x`; the other ranks call this with ``x=None``.
+
+        This is a callable passed as the `jac` argument of
+        scipy.optimize.least_squares.
+
+        Returns:
+            2D array of shape (len(residual), len(x)) on rank 0, and ``None`` on the
+            other ranks.
+        """
         comm = MPI.COMM_WORLD
         rank = comm.Get_rank()
 
+        cas = self.calculator.get_compute_arguments()
+        if self._mpi_partition is None:
+            self._set_mpi_partition(self._split_data())
+        if self._mpi_message is None:
+            n = self.calculator.get_num_opt_params()
+            self._mpi_message = np.zeros(1 + n)
+        message = self._mpi_message
+
+        if rank == 0:
+            message[0] = 3
+            message[1:] = x
+            comm.Bcast(message, root=0)
+        n = len(message) - 1
+
+        # publish params x to predictor
+        self.calculator.update_model_params(message[1:].copy())
+
+        jacs = [
+            self._get_residual_jacobian_single_config(
+                cas[i], self.calculator, self.residual_fn, self.residual_data
+            )
+            for i in self._mpi_partition[rank]
+        ]
+        send = np.concatenate([np.empty((0, n))] + jacs).ravel()
+
+        if rank == 0:
+            recv = np.empty(len(self._residual) * n)
+            counts = [c * n for c in self._mpi_counts]
+            displs = [d * n for d in self._mpi_displs]
+            comm.Gatherv(send, [recv, counts, displs, MPI.DOUBLE], root=0)
+            jac = np.empty((len(self._residual), n))
+            jac[self._mpi_recv_index] = recv.reshape(-1, n)
+            return jac
+        else:
+            comm.Gatherv(send, None, root=0)
+            return None
+
+    def _get_loss_and_gradient_MPI(self, x):
+        """
+        Compute the loss and its gradient ``J^T r`` in MPI mode on rank 0, where ``J``
+        is the Jacobian of the residual ``r``.
+
+        This is a callable for gradient based optimizing method in
+        scipy.optimize.minimize, used with `jac=True`.
+        """
         residual = self._get_residual_MPI(x)
+        jac = self._get_residual_jacobian_MPI(x)
+        loss = 0.5 * np.dot(residual, residual)
+
+        return loss, np.dot(jac.T, residual)
+
+    def _get_loss_MPI(self, x):
+        comm = MPI.COMM_WORLD
+        rank = comm.Get_rank()
+
+        residual = self._compute_residual_MPI(x)
         if rank == 0:
-            loss = 0.5 * np.linalg.norm(residual) ** 2
+            loss = 0.5 * np.dot(residual, residual)
         else:
             loss = None
 
         return loss
 
-    # NOTE this function can be called only once, no need to call it each time
-    # _get_residual_MPI is called
-    def _split_data(self):
+    def _split_data(self) -> List[List[int]]:
+        """
+        Partition the configurations between the MPI processes, such that each process
+        has about the same estimated compute cost.
+
+        The cost of a configuration is estimated as the number of atoms plus the number
+        of neighbors of all atoms (if available from the compute arguments).
+
+        Returns:
+            Indices of the compute arguments assigned to each process.
+        """
+        size = MPI.COMM_WORLD.Get_size()
+        cas = self.calculator.get_compute_arguments()
+        costs = [_estimate_compute_cost(ca) for ca in cas]
+
+        return parallel.partition_by_cost(costs, size)
+
+    def _set_mpi_partition(self, partition: List[List[int]]):
+        """
+        Set the partition of the configurations between the MPI processes, and the
+        buffers to gather the residual to rank 0.
+
+        Args:
+            partition: indices of the compute arguments assigned to each process
+        """
+        rank = MPI.COMM_WORLD.Get_rank()
+        offsets = self._residual_offsets
+        sizes = np.diff(offsets)
+
+        counts = [int(np.sum(sizes[np.asarray(p, dtype=int)])) for p in partition]
+        self._mpi_partition = partition
+        self._mpi_send = np.empty(counts[rank])
+
+        if rank == 0:
+            self._mpi_counts = counts
+            self._mpi_displs = [0] + list(np.cumsum(counts[:-1], dtype=int))
+            self._mpi_recv = np.empty(offsets[-1])
+            # position in the residual of each component of the receive buffer
+            index = [
+                np.arange(offsets[i], offsets[i + 1]) for p in partition for i in p
+            ]
+            self._mpi_recv_index = np.concatenate([[]] + index).astype(int)
+
+    def _rebalance_data(self):
+        """
+        Repartition the configurations between the MPI processes, based on the compute
+        time of each configuration measured in the last evaluation.
+        """
         comm = MPI.COMM_WORLD
         rank = comm.Get_rank()
-        size = comm.Get_size()
 
-        # get a portion of data based on rank
-        cas = self.calculator.get_compute_arguments()
-        # random.shuffle(cas)
+        # each process only measures the time of its own configurations, and all the
+        # processes compute the same partition from the sum
+        timings = self._mpi_timings.copy()
+        comm.Allreduce(MPI.IN_PLACE, timings, op=MPI.SUM)
+        partition = parallel.partition_by_cost(timings, comm.Get_size())
 
-        rank_size = len(cas) // size
-        # last rank deal with the case where len(cas) cannot evenly divide size
-        if rank == size - 1:
-            cas = cas[rank_size * rank :]
-        else:
-            cas = cas[rank_size * rank : rank_size * (rank + 1)]
+        if rank == 0:
+            loads = [np.sum(timings[p]) for p in self._mpi_partition]
+            new_loads = [np.sum(timings[p]) for p in partition]
+            msg = (
+                f"Rebalance data between MPI processes. Max/mean compute time of the "
+                f"processes changes from {np.max(loads) / np.mean(loads):.3f} to "
+                f"{np.max(new_loads) / np.mean(new_loads):.3f}."
+            )
+            log_entry(logger, msg, level="info")
 
-        return cas
+        self._set_mpi_partition(partition)
+        self._mpi_timings[:] = 0
 
     @staticmethod
     def _get_residual_single_config(ca, calculator, residual_fn, residual_data):
@@ -601,6 +1873,64 @@ class LossPhysicsMotivatedModel:
 
         return residual
 
+    @staticmethod
+    def _get_residual_shard(
+        shard, points, mode, num_groups, calculator, residual_fn, residual_data
+    ) -> List[Any]:
+        """
+        Compute the residual of a shard of (compute arguments, calculator) pairs at
+        the parameters of a point group in a worker process.
+
+        Args:
+            shard: a list of a single (point group, list of (compute arguments,
+                calculator) pairs) item, see :meth:`_create_pool`.
+            points: list of optimizing parameter values, of which the worker of point
+                group `g` computes `points[g::num_groups]`.
+            mode: what to compute at each of the parameters: `residual` (a list of the
+                residual of each configuration), `jacobian` (of the residual of the
+                shard), or `loss` (of the shard).
+            num_groups: number of point groups.
+
+        Returns:
+            A list of (index of the parameters in `points`, result) tuples.
+        """
+        if mode == "jacobian":
+            fn = LossPhysicsMotivatedModel._get_residual_jacobian_single_config
+        else:
+            fn = LossPhysicsMotivatedModel._get_residual_single_config
+
+        group, pairs = shard[0]
+        results = []
+        for k in range(group, len(points), num_groups):
+            calculator.update_model_params(points[k])
+            r = [fn(ca, calc, residual_fn, residual_data) for ca, calc in pairs]
+            if mode == "residual":
+                results.append((k, r))
+            elif mode == "loss":
+                results.append((k, sum(0.5 * np.dot(ri, ri) for ri in r)))
+            else:
+                results.append((k, np.concatenate(r)))
+
+        return results
+
+    @staticmethod
+    def _get_residual_jacobian_single_config(
+        ca, calculator, residual_fn, residual_data
+    ):
+        jac = calculator.get_prediction_jacobian(ca)
+
+        # the residual functions are linear in the prediction, so the derivative of
+        # residual w.r.t. prediction is the residual of a unit prediction error
+        conf = ca.conf
+        identifier = conf.identifier
+        weight = conf.weight
+        natoms = conf.get_num_atoms()
+        ones = np.ones(len(jac))
+        zeros = np.zeros(len(jac))
+        scale = residual_fn(identifier, natoms, weight, ones, zeros, residual_data)
+
+        return scale[:, None] * jac
+
 
 class LossNeuralNetworkModel(object):
     """
@@ -880,6 +2210,200 @@ class LossNeuralNetworkModel(object):
         self.optimizer.load_state_dict(torch.load(path))
 
 
+class _ResultCache:
+    """
+    A least recently used (LRU) cache of the residual and loss, keyed by the optimizing
+    parameters.
+
+    Args:
+        max_size: Maximum number of parameter sets to cache.
+        tol: Parameters whose components differ by at most ``tol`` from those of a
+            cached entry hit the cache. If 0, the parameters need to be exactly the same.
+    """
+
+    def __init__(self, max_size: int, tol: float = 0.0):
+        # {parameters as bytes: (parameters, residual, loss)}
+        self._cache = OrderedDict()
+        self.max_size = max_size
+        self.tol = tol
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, x) -> Optional[Tuple[np.array, float]]:
+        """
+        Get the (residual, loss) of parameters ``x``; ``None`` if not cached.
+        """
+        x = np.asarray(x, dtype=float)
+        key = x.tobytes()
+
+        if key not in self._cache and self.tol > 0:
+            for k, (y, _, _) in self._cache.items():
+                if y.shape == x.shape and np.max(np.abs(y - x), initial=0) <= self.tol:
+                    key = k
+                    break
+
+        if key in self._cache:
+            self._cache.move_to_end(key)
+            self.hits += 1
+            _, residual, loss = self._cache[key]
+            return residual, loss
+        else:
+            self.misses += 1
+            return None
+
+    def add(self, x, residual: np.array, loss: float):
+        """
+        Cache the residual and loss of parameters ``x``, evicting the least recently
+        used entry if the cache is full.
+        """
+        x = np.array(x, dtype=float)
+        self._cache[x.tobytes()] = (x, residual, loss)
+        self._cache.move_to_end(x.tobytes())
+        while len(self._cache) > self.max_size:
+            self._cache.popitem(last=False)
+
+    def clear(self):
+        """
+        Remove all cached entries and reset the statistics.
+        """
+        self._cache.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def info(self) -> Dict[str, Any]:
+        n = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / n if n > 0 else 0.0,
+            "size": len(self._cache),
+            "max_size": self.max_size,
+        }
+
+
+def _estimate_compute_cost(ca) -> int:
+    """
+    Estimate the cost to compute the properties of a configuration as the number of
+    atoms plus the number of neighbors of all atoms.
+
+    The number of neighbors is only available for compute arguments using
+    :class:`~kliff.neighbor.NeighborList`; otherwise, it is ignored.
+    """
+    cost = ca.conf.get_num_atoms()
+
+    neigh = getattr(ca, "neigh", None)
+    if hasattr(neigh, "get_numneigh_and_neighlist_1D"):
+        numneigh = neigh.get_numneigh_and_neighlist_1D()[0]
+        cost += int(np.sum(numneigh))
+
+    return cost
+
+
+class _Checkpoint:
+    """
+    State of a minimization, periodically saved to a ``.npz`` file: the last evaluated
+    parameters, the best parameters and loss, and the number of loss evaluations.
+
+    Args:
+        path: path to the checkpoint file.
+        interval: number of evaluations between two saves.
+        state: state loaded by :meth:`load` to continue from.
+    """
+
+    def __init__(
+        self,
+        path: Union[str, Path],
+        interval: int = 10,
+        state: Optional[Dict[str, Any]] = None,
+    ):
+        self.path = to_path(path)
+        self.interval = interval
+
+        if state is None:
+            self.x = None
+            self.best_x = None
+            self.best_loss = np.inf
+            self.nevals = 0
+        else:
+            self.x = state["x"]
+            self.best_x = state["best_x"]
+            self.best_loss = state["best_loss"]
+            self.nevals = state["nevals"]
+
+    def record(self, x, loss: float):
+        """
+        Record an evaluation of the loss, and save the checkpoint every ``interval``
+        evaluations.
+
+        A non-finite loss (e.g. of unphysical parameters) is never the best one; if no
+        finite loss is recorded, the last evaluated parameters are used as the best
+        ones, with a best loss of ``inf``.
+        """
+        self.x = np.array(x, dtype=float)
+        self.nevals += 1
+        if np.isfinite(loss) and loss < self.best_loss:
+            self.best_loss = float(loss)
+            self.best_x = self.x
+        elif not np.isfinite(self.best_loss):
+            self.best_x = self.x
+
+        if self.nevals % self.interval == 0:
+            self.save()
+
+    def save(self):
+        """
+        Save the checkpoint, only from rank 0 in MPI mode.
+
+        The file is written atomically (see :func:`~kliff.utils.savez_atomic`), such
+        that a partially written checkpoint is never observed.
+        """
+        if self.x is None:
+            return
+        if parallel.get_MPI_world_size() > 1 and MPI.COMM_WORLD.Get_rank() != 0:
+            return
+
+        savez_atomic(
+            self.path,
+            x=self.x,
+            best_x=self.best_x,
+            best_loss=self.best_loss,
+            nevals=self.nevals,
+        )
+
+    @staticmethod
+    def load(path: Union[str, Path]) -> Dict[str, Any]:
+        """
+        Load the state saved by :meth:`save`.
+        """
+        with np.load(to_path(path)) as data:
+            return {
+                "x": np.asarray(data["x"], dtype=float),
+                "best_x": np.asarray(data["best_x"], dtype=float),
+                "best_loss": float(data["best_loss"]),
+                "nevals": int(data["nevals"]),
+            }
+
+
+def _sample_initial_params(x, lb, ub, n: int, scale: float, rng) -> np.array:
+    """
+    Sample ``n`` initial parameters, uniformly within the bounds for parameters with
+    both lower and upper bounds, and from a normal distribution centered at ``x`` with
+    a relative standard deviation ``scale`` (clipped to the bounds) otherwise.
+
+    Returns:
+        2D array of shape (n, len(x)).
+    """
+    bounded = np.isfinite(lb) & np.isfinite(ub)
+    std = scale * np.where(x != 0, np.abs(x), 1.0)
+
+    uniform = rng.uniform(
+        np.where(bounded, lb, 0), np.where(bounded, ub, 1), (n, len(x))
+    )
+    normal = np.clip(x + std * rng.standard_normal((n, len(x))), lb, ub)
+
+    return np.where(bounded, uniform, normal)
+
+
 def _check_residual_data(data: Dict[str, Any], default: Dict[str, Any]):
     """
     Check whether user provided residual data is valid, and add default values if not
@@ -920,6 +2444,104 @@ def _check_compute_flag(calculator, residual_data):
         log_entry(logger, msg.format("stress", sw), level="warning")
 
 
+def _get_finite_difference_steps(
+    x, lb, ub, scheme: str, rel_step: Optional[float] = None
+):
+    """
+    Get the finite-difference step of each parameter, following the rules of
+    scipy.optimize.least_squares, adjusted such that the perturbed parameters stay
+    within the bounds.
+
+    Args:
+        x: parameter values, 1D array
+        lb: lower bounds of the parameters, 1D array
+        ub: upper bounds of the parameters, 1D array
+        scheme: ``2-point`` or ``3-point``.
+        rel_step: relative step size. If ``None``, ``eps**(1/2)`` for ``2-point`` and
+            ``eps**(1/3)`` for ``3-point``, where ``eps`` is the machine epsilon.
+
+    Returns:
+        h: steps; a negative step means a backward difference.
+        central: whether to use central difference for each parameter. Always `False`
+            for ``2-point``.
+    """
+    if scheme not in ["2-point", "3-point"]:
+        raise LossError(
+            f"Expect finite-difference scheme to be `2-point` or `3-point`; got "
+            f"{scheme}."
+        )
+    if rel_step is None:
+        rel_step = np.finfo(float).eps ** (0.5 if scheme == "2-point" else 1 / 3)
+
+    sign_x = np.where(x >= 0, 1.0, -1.0)
+    h = rel_step * sign_x * np.maximum(1.0, np.abs(x))
+    # x + h may be represented inexactly
+    h = (x + h) - x
+
+    if scheme == "2-point":
+        # step backward if stepping forward violates the bounds
+        violated = (x + h < lb) | (x + h > ub)
+        h = np.where(violated, -h, h)
+        central = np.zeros(len(x), dtype=bool)
+    else:
+        h = np.abs(h)
+        central = (x - h >= lb) & (x + h <= ub)
+        # one-sided steps into the feasible region, toward the farther bound
+        forward = (ub - x) >= (x - lb)
+        h = np.where(central | forward, h, -h)
+
+    return h, central
+
+
+def _get_finite_difference_points(x, h, central, scheme: str) -> List[np.array]:
+    """
+    Get the perturbed parameters at which to evaluate a function for finite
+    differences, for each parameter in order (one for ``2-point``, and two for
+    ``3-point``). The function value at `x` itself is needed as well, but is typically
+    available already, so it is not included.
+
+    Args:
+        x: parameter values, 1D array
+        h, central: steps and whether to use central difference, as returned by
+            :func:`_get_finite_difference_steps`.
+        scheme: ``2-point`` or ``3-point``.
+    """
+    E = np.diag(h)
+    points = []
+    for i in range(len(x)):
+        if scheme == "2-point":
+            points.append(x + E[i])
+        elif central[i]:
+            points.extend([x - E[i], x + E[i]])
+        else:
+            points.extend([x + E[i], x + 2 * E[i]])
+
+    return points
+
+
+def _get_finite_difference_jacobian(f0, values, h, central, scheme: str) -> np.array:
+    """
+    Get the finite-difference Jacobian from the function value at `x` and those at the
+    parameters given by :func:`_get_finite_difference_points`.
+
+    Returns:
+        2D array of shape (len(f0), len(h)).
+    """
+    n = len(h)
+    jac = np.empty((len(f0), n))
+    for i in range(n):
+        if scheme == "2-point":
+            jac[:, i] = (values[i] - f0) / h[i]
+        elif central[i]:
+            f1, f2 = values[2 * i], values[2 * i + 1]
+            jac[:, i] = (f2 - f1) / (2 * h[i])
+        else:
+            f1, f2 = values[2 * i], values[2 * i + 1]
+            jac[:, i] = (-3 * f0 + 4 * f1 - f2) / (2 * h[i])
+
+    return jac
+
+
 class LossError(Exception):
     def __init__(self, msg):
         super(LossError, self).__init__(msg)
@@ -1,11 +1,15 @@
 import logging
-from typing import Callable, Dict, Optional
+from typing import Callable, Dict, List, Optional
 
 import numpy as np
 from kliff.dataset.dataset import Configuration
 from kliff.models.model import ComputeArguments, Model
 from kliff.models.parameter import Parameter
-from kliff.neighbor import NeighborList, assemble_forces, assemble_stress
+from kliff.neighbor import (
+    assemble_forces_from_pairs,
+    assemble_stress_from_pairs,
+    get_neighbor_list,
+)
 
 logger = logging.getLogger(__name__)
 
@@ -13,9 +17,26 @@ logger = logging.getLogger(__name__)
 class LJComputeArguments(ComputeArguments):
     """
     KLIFF built-in Lennard-Jones 6-12 potential computation functions.
+
+    The energy, forces, and stress are computed from all the pairs of atoms at once
+    using array operations. For multiple species, the parameters of each pair of atoms
+    are looked up from dense (nspecies, nspecies) tables by the integer species codes of
+    the two atoms.
+
+    Attributes:
+        half_list: If ``True``, a half neighbor list is used, i.e. each pair of atoms is
+            computed only once; otherwise, a full neighbor list is used, and each pair
+            is computed twice.
+        image_neighbor_list: If ``True``, an :class:`~kliff.neighbor.ImageNeighborList`
+            is used instead of a :class:`~kliff.neighbor.NeighborList`, i.e. the
+            neighbors are represented by lattice shifts instead of padding atoms. This
+            saves memory for small periodic cells with a large influence distance.
     """
 
     implemented_property = ["energy", "forces", "stress"]
+    implemented_jacobian = True
+    half_list = True
+    image_neighbor_list = False
 
     def __init__(
         self,
@@ -35,102 +56,314 @@ class LJComputeArguments(ComputeArguments):
             compute_stress,
         )
 
-        self.neigh = NeighborList(
-            self.conf, influence_distance, padding_need_neigh=False
+        self.neigh = get_neighbor_list(
+            self.conf,
+            influence_distance,
+            padding_need_neigh=False,
+            images=self.image_neighbor_list,
         )
 
+        # pairs of atoms and species code of atoms, see `_get_pairs`
+        self.species_code = None
+        self._pairs = None
+        self._pairs_key = None
+        self._pairs_coords = None
+        self._pairs_geometry = None
+
+        if supported_species is None:
+            self.pair_index = get_pair_index(1)
+        else:
+            self.pair_index = get_pair_index(len(supported_species))
+
     def compute(self, params: Dict[str, Parameter]):
-        epsilon = params["epsilon"][0]
-        sigma = params["sigma"][0]
-        rcut = params["cutoff"][0]
-        coords = self.conf.coords
+        N = self.conf.get_num_atoms()
 
-        coords_including_padding = self.neigh.coords
-        if self.compute_forces:
-            forces_including_padding = np.zeros_like(coords_including_padding)
-
-        energy = 0
-        for i, xyz_i in enumerate(coords):
-            neighlist, _, _ = self.neigh.get_neigh(i)
-            for j in neighlist:
-                xyz_j = coords_including_padding[j]
-                rij = xyz_j - xyz_i
-                r = np.linalg.norm(rij)
-                if self.compute_forces:
-                    phi, dphi = self.calc_phi_dphi(epsilon, sigma, r, rcut)
-                    energy += 0.5 * phi
-                    pair = 0.5 * dphi / r * rij
-                    forces_including_padding[i] = forces_including_padding[i] + pair
-                    forces_including_padding[j] = forces_including_padding[j] - pair
-                elif self.compute_energy:
-                    phi = self.calc_phi(epsilon, sigma, r, rcut)
-                    energy += 0.5 * phi
+        numneigh, neighlist, rij, r, k = self._get_pairs()
+        epsilon, sigma, rcut = self._get_pair_params(params, k)
+
+        # each pair is counted twice in a full list
+        factor = 1.0 if self.half_list else 0.5
+
+        if self.compute_forces or self.compute_stress:
+            phi, dphi = self.calc_phi_dphi(epsilon, sigma, r, rcut)
+            # derivative of energy w.r.t. rij
+            dEdr = (factor * dphi / r)[:, None] * rij
+        else:
+            phi = self.calc_phi(epsilon, sigma, r, rcut)
 
         if self.compute_energy:
-            self.results["energy"] = energy
+            self.results["energy"] = factor * np.sum(phi)
         if self.compute_forces:
-            forces = assemble_forces(
-                forces_including_padding, len(coords), self.neigh.padding_image
+            forces = assemble_forces_from_pairs(
+                dEdr, numneigh, neighlist, N, self._get_image()
             )
             self.results["forces"] = forces
         if self.compute_stress:
             volume = self.conf.get_volume()
-            stress = assemble_stress(
-                coords_including_padding, forces_including_padding, volume
-            )
+            stress = assemble_stress_from_pairs(rij, dEdr, volume)
             self.results["stress"] = stress
 
+    def compute_prediction_jacobian(
+        self, params: Dict[str, Parameter]
+    ) -> Dict[str, np.ndarray]:
+        """
+        Compute the derivative of the prediction (see :meth:`get_prediction`) w.r.t.
+        the parameters.
+
+        The derivative w.r.t. ``cutoff`` is zero, since the energy only changes
+        discontinuously with it.
+
+        Args:
+            params: the parameters of the model.
+
+        Returns:
+            Derivatives with parameter name as key, and a 2D array of shape (P, S) as
+            value, where P is the size of the prediction and S the size of the parameter.
+        """
+        N = self.conf.get_num_atoms()
+
+        numneigh, neighlist, rij, r, k = self._get_pairs()
+        epsilon, sigma, rcut = self._get_pair_params(params, k)
+        factor = 1.0 if self.half_list else 0.5
+
+        sor = sigma / r
+        sor6 = sor * sor * sor
+        sor6 = sor6 * sor6
+        sor12 = sor6 * sor6
+        inside = r <= rcut
+
+        # derivatives of phi and dphi/dr w.r.t. epsilon and sigma
+        derivs = {
+            "epsilon": (
+                np.where(inside, 4 * (sor12 - sor6), 0.0),
+                np.where(inside, 24 * (-2 * sor12 + sor6) / r, 0.0),
+            ),
+            "sigma": (
+                np.where(inside, 4 * epsilon * (12 * sor12 - 6 * sor6) / sigma, 0.0),
+                np.where(
+                    inside, 24 * epsilon * (-24 * sor12 + 6 * sor6) / (r * sigma), 0.0
+                ),
+            ),
+        }
+
+        num_params = len(params["epsilon"])
+        jac = {}
+        for name, (dphi_dp, ddphi_dp) in derivs.items():
+            # a component of the parameter only affects the pairs of its species pair
+            columns = []
+            for c in range(num_params):
+                mask = k == c
+                col = []
+                if self.compute_energy:
+                    col.append([factor * np.sum(dphi_dp[mask])])
+                if self.compute_forces or self.compute_stress:
+                    dEdr_dp = (mask * factor * ddphi_dp / r)[:, None] * rij
+                if self.compute_forces:
+                    dforces = assemble_forces_from_pairs(
+                        dEdr_dp, numneigh, neighlist, N, self._get_image()
+                    )
+                    col.append(dforces.ravel())
+                if self.compute_stress:
+                    volume = self.conf.get_volume()
+                    col.append(assemble_stress_from_pairs(rij, dEdr_dp, volume))
+                columns.append(np.concatenate(col))
+            jac[name] = np.stack(columns, axis=1)
+
+        jac["cutoff"] = np.zeros_like(jac["epsilon"])
+
+        return jac
+
+    def _get_pairs(self):
+        """
+        Pairs of atoms, their displacement vectors, distances, and the index of the
+        parameters of their species pair. With a half list, each pair is included only
+        once.
+
+        The pairs only depend on the neighbor list and the coordinates, not on the
+        parameters, so they are computed once and reused across calls. The pairs are
+        recomputed when the neighbor list is rebuilt, and the displacements and distances
+        when the coordinates of the atoms change.
+        """
+        key = (self.neigh, self.neigh.num_builds, self.half_list)
+        if self._pairs_key != key:
+            if self.image_neighbor_list:
+                numneigh, neighlist, shifts = self.neigh.get_numneigh_and_neighlist_1D(
+                    half_list=self.half_list
+                )
+            else:
+                numneigh, neighlist = self.neigh.get_numneigh_and_neighlist_1D(
+                    half_list=self.half_list
+                )
+                shifts = None
+            # species code of contributing and padding atoms
+            if self.supported_species is None:
+                self.species_code = np.zeros(len(self.neigh.coords), dtype=np.intc)
+            else:
+                self.species_code = self.neigh.get_species_code(self.supported_species)
+
+            atoms = np.repeat(np.arange(len(numneigh)), numneigh)
+            k = self.pair_index[self.species_code[atoms], self.species_code[neighlist]]
+            self._pairs = (numneigh, neighlist, atoms, shifts, k)
+            self._pairs_key = key
+            self._pairs_coords = None
+
+        numneigh, neighlist, atoms, shifts, k = self._pairs
+
+        coords = self.neigh.coords
+        if self._pairs_coords is None or not np.array_equal(self._pairs_coords, coords):
+            if self.image_neighbor_list:
+                rij = self.neigh.get_displacements(numneigh, neighlist, shifts)
+            else:
+                rij = coords[neighlist] - coords[atoms]
+            r = np.sqrt(np.sum(rij * rij, axis=1))
+            self._pairs_geometry = (rij, r)
+            self._pairs_coords = coords.copy()
+
+        rij, r = self._pairs_geometry
+
+        return numneigh, neighlist, rij, r, k
+
+    def _get_image(self) -> Optional[np.ndarray]:
+        """
+        Index of the contributing atom, of which a neighbor is an image; ``None`` if the
+        neighbors are already indexed by contributing atoms.
+        """
+        return None if self.image_neighbor_list else self.neigh.image
+
+    def _get_pair_params(self, params: Dict[str, Parameter], k: np.ndarray):
+        """
+        Parameters of each pair of atoms, by the index of their species pair.
+        """
+        epsilon = np.asarray(params["epsilon"].value)
+        sigma = np.asarray(params["sigma"].value)
+        rcut = np.asarray(params["cutoff"].value)
+        if len(epsilon) != self.pair_index.max() + 1:
+            raise LennardJonesError(
+                f"Expect {self.pair_index.max() + 1} values for each parameter, one for "
+                f"each species pair; got {len(epsilon)}."
+            )
+
+        return epsilon[k], sigma[k], rcut[k]
+
     @staticmethod
     def calc_phi(epsilon, sigma, r, rcut):
-        if r > rcut:
-            phi = 0
-        else:
-            sor = sigma / r
-            sor6 = sor * sor * sor
-            sor6 = sor6 * sor6
-            sor12 = sor6 * sor6
-            phi = 4 * epsilon * (sor12 - sor6)
+        """
+        Pair energy of atoms at distances `r`. `r` can be a scalar or an array.
+        """
+        sor = sigma / r
+        sor6 = sor * sor * sor
+        sor6 = sor6 * sor6
+        sor12 = sor6 * sor6
+        phi = 4 * epsilon * (sor12 - sor6)
+        phi = np.where(r > rcut, 0.0, phi)
         return phi
 
     @staticmethod
     def calc_phi_dphi(epsilon, sigma, r, rcut):
-        if r > rcut:
-            phi = 0.0
-            dphi = 0.0
-        else:
-            sor = sigma / r
-            sor6 = sor * sor * sor
-            sor6 = sor6 * sor6
-            sor12 = sor6 * sor6
-            phi = 4 * epsilon * (sor12 - sor6)
-            dphi = 24 * epsilon * (-2 * sor12 + sor6) / r
+        """
+        Pair energy and its derivative w.r.t. `r` of atoms at distances `r`. `r` can
+        be a scalar or an array.
+        """
+        sor = sigma / r
+        sor6 = sor * sor * sor
+        sor6 = sor6 * sor6
+        sor12 = sor6 * sor6
+        outside = r > rcut
+        phi = np.where(outside, 0.0, 4 * epsilon * (sor12 - sor6))
+        dphi = np.where(outside, 0.0, 24 * epsilon * (-2 * sor12 + sor6) / r)
         return phi, dphi
 
 
+class LJImageComputeArguments(LJComputeArguments):
+    """
+    KLIFF built-in Lennard-Jones 6-12 potential computation functions, using an
+    :class:`~kliff.neighbor.ImageNeighborList`.
+    """
+
+    image_neighbor_list = True
+
+
 class LennardJones(Model):
     """
     KLIFF built-in Lennard-Jones 6-12 potential model.
+
+    Args:
+        model_name: name of the model.
+        params_relation_callback: A callback function to set the relations between
+            parameters. See :class:`~kliff.models.Model`.
+        species: Species supported by the model. If ``None``, all atoms are treated as
+            the same species, and each of ``epsilon``, ``sigma``, and ``cutoff`` has a
+            single value. Otherwise, each parameter has a value for each species pair,
+            in the order of ``(0, 0), (0, 1), ... (0, n-1), (1, 1), (1, 2) ...
+            (n-1, n-1)``, where ``n`` is the number of species and ``i`` denotes
+            ``species[i]``.
+        image_neighbor_list: If ``True``, use an
+            :class:`~kliff.neighbor.ImageNeighborList` instead of padding atoms, which
+            is more efficient for small periodic cells with a large cutoff.
     """
 
     def __init__(
-        self, model_name="LJ6-12", params_relation_callback: Optional[Callable] = None
+        self,
+        model_name="LJ6-12",
+        params_relation_callback: Optional[Callable] = None,
+        species: Optional[List[str]] = None,
+        image_neighbor_list: bool = False,
     ):
+        self.species = species
+        self.image_neighbor_list = image_neighbor_list
         super(LennardJones, self).__init__(model_name, params_relation_callback)
 
     def init_model_params(self):
+        n = 1 if self.species is None else len(self.species)
+        num_pairs = n * (n + 1) // 2
+
         model_params = {
-            "epsilon": Parameter(value=[1.0]),
-            "sigma": Parameter(value=[2.0]),
-            "cutoff": Parameter(value=[5.0]),
+            "epsilon": Parameter(value=[1.0] * num_pairs),
+            "sigma": Parameter(value=[2.0] * num_pairs),
+            "cutoff": Parameter(value=[5.0] * num_pairs),
         }
 
         return model_params
 
     def init_influence_distance(self):
-        return self.model_params["cutoff"][0]
+        return max(self.model_params["cutoff"].value)
 
     def init_supported_species(self):
-        return None
+        if self.species is None:
+            return None
+        return {s: i for i, s in enumerate(self.species)}
 
     def get_compute_argument_class(self):
+        if self.image_neighbor_list:
+            return LJImageComputeArguments
         return LJComputeArguments
+
+
+def get_pair_index(n: int) -> np.ndarray:
+    """
+    Index of the parameters of each species pair in a dense (n, n) table.
+
+    Args:
+        n: number of species
+
+    Returns:
+        Symmetric 2D int array, where entry ``(i, j)`` is the index of the parameter
+        component for the species pair ``(i, j)``.
+    """
+    pair_index = np.zeros((n, n), dtype=np.intc)
+    k = 0
+    for i in range(n):
+        for j in range(i, n):
+            pair_index[i, j] = pair_index[j, i] = k
+            k += 1
+
+    return pair_index
+
+
+class LennardJonesError(Exception):
+    def __init__(self, msg):
+        super(LennardJonesError, self).__init__(msg)
+        self.msg = msg
+
+    def __expr__(self):
+        return self.msg
@@ -18,6 +18,11 @@ class ComputeArguments:
     This is the base class for other compute arguments. Typically, a user will not
     directly use this.
 
+    A subclass can provide the derivatives of the prediction w.r.t. the model parameters
+    by setting ``implemented_jacobian = True`` and implementing
+    :meth:`compute_prediction_jacobian`, which enables the optimizers to use analytic
+    Jacobians instead of finite differences.
+
     Args:
         conf: atomic configurations
         supported_species: species supported by the potential model, with chemical
@@ -29,6 +34,7 @@ class ComputeArguments:
     """
 
     implemented_property = []
+    implemented_jacobian = False
 
     def __init__(
         self,
@@ -68,6 +74,25 @@ class ComputeArguments:
         """
         raise NotImplementedError('"compute" method not implemented.')
 
+    def compute_prediction_jacobian(
+        self, params: Dict[str, Parameter]
+    ) -> Dict[str, np.ndarray]:
+        """
+        Compute the derivatives of the prediction (see :meth:`get_prediction`) w.r.t.
+        the parameters.
+
+        Args:
+            params: the parameters of the model.
+
+        Returns:
+            Derivatives with parameter name as key, and a 2D array of shape (P, S) as
+            value, where P is the size of the prediction and S the size of the parameter.
+            Parameters that the prediction does not depend on can be omitted.
+        """
+        raise NotImplementedError(
+            '"compute_prediction_jacobian" method not implemented.'
+        )
+
     def get_compute_flag(self, name: str) -> bool:
         """
         Check whether the model is asked to compute property.
@@ -1,3 +1,23 @@
-from .neighbor import NeighborList, assemble_forces, assemble_stress
+from .neighbor import (
+    ImageNeighborList,
+    NeighborList,
+    NeighborListCache,
+    assemble_forces,
+    assemble_forces_from_pairs,
+    assemble_stress,
+    assemble_stress_from_pairs,
+    get_neighbor_list,
+    get_neighbor_list_cache,
+)
 
-__all__ = ["NeighborList", "assemble_forces", "assemble_stress"]
+__all__ = [
+    "ImageNeighborList",
+    "NeighborList",
+    "NeighborListCache",
+    "assemble_forces",
+    "assemble_forces_from_pairs",
+    "assemble_stress",
+    "assemble_stress_from_pairs",
+    "get_neighbor_list",
+    "get_neighbor_list_cache",
+]
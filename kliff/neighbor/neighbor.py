@@ -1,8 +1,16 @@
-from typing import Dict, List, Tuple
+import hashlib
+import itertools
+import threading
+import warnings
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple, Union
 
 import numpy as np
+from scipy.spatial import cKDTree
 from kliff.atomic_data import atomic_number, atomic_species
 from kliff.dataset.dataset import Configuration
+from kliff.utils import savez_atomic, to_path
 
 from . import nl
 
@@ -22,21 +30,44 @@ class NeighborList:
         infl_dist: Influence distance, within which atoms are interacting with each other.
             In literatures, this is usually referred as ``cutoff``.
         padding_need_neigh: Whether to generate neighbors for padding atoms.
+        skin: Verlet skin distance. The neighbor list is built using a cutoff of
+            ``infl_dist + skin`` such that it can be reused via :meth:`update` as long as
+            no atom moves more than half of the skin since the last build. Note, if
+            ``skin > 0``, the neighbors of an atom can be farther away than ``infl_dist``
+            (but within ``infl_dist + skin``), and it is up to the caller to screen them.
+        cutoffs: Cutoff distances of multiple neighbor lists to create for the atoms. Each
+            cutoff should be no larger than ``infl_dist``, and the neighbor list
+            associated with ``cutoffs[i]`` can be requested via ``neigh_list_index = i``
+            in :meth:`get_neigh` and :meth:`get_numneigh_and_neighlist_1D`. If ``None``,
+            a single neighbor list with a cutoff of ``infl_dist`` is created.
+        backend: Neighbor search method, one of ``nl`` and ``kdtree``. ``nl`` uses the
+            cell list of the C++ extension, which bins all atoms into a uniform grid of
+            cells. ``kdtree`` uses ``scipy.spatial.cKDTree``, which does not allocate
+            memory for empty space, and thus can be faster for highly inhomogeneous
+            configurations, e.g. surfaces and clusters in vacuum. Both create the same
+            padding atoms and find the same neighbors, but the neighbors of an atom may
+            be in different order. See ``utils/benchmark_neighbor.py`` to compare them.
 
     Attributes:
         coords: 2D array
             Coordinates of contributing and padding atoms.
-        species: list
-            Species string of contributing and padding atoms.
+        species_code: 1D int array
+            Atomic number of contributing and padding atoms.
+        species: 1D str array
+            Species string of contributing and padding atoms. It is created from
+            ``species_code`` on first access.
         image: 1D array
             Atom index, of which an atom is an image. The image of a contributing atom is
             itself.
         padding_coords: 2D array
             Coordinates of padding atoms.
-        padding_species: list
-            Species string and padding atoms.
+        padding_species: 1D str array
+            Species string of padding atoms.
         padding_image: 1D array
             Atom index, of which a padding atom is an image.
+        num_builds: int
+            Number of times the neighbor list has been built, e.g. to tell whether data
+            derived from the neighbor list is outdated.
 
     Note:
         To get the total force on a contributing atom, the forces on all padding atoms
@@ -44,44 +75,86 @@ class NeighborList:
         atom.
     """
 
+    backends = ["nl", "kdtree"]
+
     def __init__(
-        self, conf: Configuration, infl_dist: float, padding_need_neigh: bool = False
+        self,
+        conf: Configuration,
+        infl_dist: float,
+        padding_need_neigh: bool = False,
+        skin: float = 0.0,
+        cutoffs: Optional[Sequence[float]] = None,
+        backend: str = "nl",
     ):
         self.conf = conf
         self.infl_dist = infl_dist
         self.padding_need_neigh = padding_need_neigh
+        self.skin = skin
+
+        # content of the configuration needed to rebuild the neighbor list, such that
+        # the neighbor list does not depend on `conf` once created
+        self._cell = np.array(conf.cell, dtype=np.double)
+        self._PBC = np.array(conf.PBC, dtype=np.intc)
+        self._species_code_cb = species_to_code(conf.species)
+        self._conf_hash = None
+
+        if backend not in self.backends:
+            raise NeighborListError(
+                f"Expect `backend` to be one of {self.backends}; got {backend}."
+            )
+        self.backend = backend
+
+        if cutoffs is None:
+            cutoffs = [infl_dist]
+        self.cutoffs = np.asarray(cutoffs, dtype=np.double)
+        if self.cutoffs.size == 0 or np.max(self.cutoffs) > infl_dist:
+            raise NeighborListError(
+                f"Expect `cutoffs` to be non-empty and no larger than `infl_dist = "
+                f"{infl_dist}`; got {cutoffs}."
+            )
 
         # all atoms: contrib + padding
         self.coords = None
-        self.species = None
+        self.species_code = None
         self.image = None
 
         self.padding_coords = None
-        self.padding_species = None
         # padding_image[0] = 3: padding atom 1 is the image of contributing atom 3
         self.padding_image = None
 
+        # lattice translation of padding atoms w.r.t. the atoms they are images of
+        self._padding_shift = None
+        # contributing atom coords when the neighbor list was last built
+        self._coords_at_build = None
+
         # neigh
         self.neigh = nl.initialize()
+        self.num_builds = 0
         self.create_neigh()
 
-    def create_neigh(self):
-        coords_cb = np.asarray(self.conf.coords, dtype=np.double)
-        species_cb = self.conf.species
-        cell = np.asarray(self.conf.cell, dtype=np.double)
-        PBC = np.asarray(self.conf.PBC, dtype=np.intc)
+    def create_neigh(self, coords: Optional[np.array] = None):
+        """
+        Create padding atoms and build the neighbor list from scratch.
+
+        Args:
+            coords: Coordinates of the contributing atoms, 2D array of shape (N, 3). If
+                ``None``, the coordinates of the configuration are used (or those of the
+                last build, if the neighbor list does not keep the configuration).
+        """
+        if coords is None:
+            coords = self._coords_at_build if self.conf is None else self.conf.coords
+        coords_cb = np.array(coords, dtype=np.double)
+        cell = self._cell
+        PBC = self._PBC
 
         # create padding atoms
-        species_code_cb = np.asarray(
-            [atomic_number[s] for s in species_cb], dtype=np.intc
-        )
-        out = nl.create_paddings(self.infl_dist, cell, PBC, coords_cb, species_code_cb)
+        species_code_cb = self._species_code_cb
+        cutoff = self.infl_dist + self.skin
+        out = nl.create_paddings(cutoff, cell, PBC, coords_cb, species_code_cb)
         coords_pd, species_code_pd, image_pd, error = out
         check_error(error, "nl.create_padding")
-        species_pd = [atomic_species[i] for i in species_code_pd]
 
         self.padding_coords = np.asarray(coords_pd, dtype=np.double)
-        self.padding_species = species_pd
         self.padding_image = np.asarray(image_pd, dtype=np.intc)
 
         num_cb = coords_cb.shape[0]
@@ -90,26 +163,97 @@ class NeighborList:
         self.coords = np.asarray(
             np.concatenate((coords_cb, coords_pd)), dtype=np.double
         )
-        self.species = np.concatenate((species_cb, species_pd))
+        self.species_code = np.asarray(
+            np.concatenate((species_code_cb, species_code_pd)), dtype=np.intc
+        )
         self.image = np.asarray(
             np.concatenate((np.arange(num_cb), image_pd)), dtype=np.intc
         )
+        self._padding_shift = self.padding_coords - coords_cb[self.padding_image]
+        self._coords_at_build = coords_cb
+        self._conf_hash = None
         # flag to indicate whether to create neighborlist for an atom
         need_neigh = np.ones(num_cb + num_pd, dtype=np.intc)
         if not self.padding_need_neigh:
             need_neigh[num_cb:] = 0
 
         # create neighbor list
-        cutoffs = np.asarray([self.infl_dist], dtype=np.double)
-        error = nl.build(self.neigh, self.coords, self.infl_dist, cutoffs, need_neigh)
-        check_error(error, "nl.build")
+        cutoffs = self.cutoffs + self.skin
+        if self.backend == "kdtree":
+            numneigh, neighlist = _search_kdtree(self.coords, cutoffs, need_neigh)
+            error = nl.set_neigh(self.neigh, cutoffs, numneigh, neighlist)
+            check_error(error, "nl.set_neigh")
+        else:
+            error = nl.build(self.neigh, self.coords, cutoff, cutoffs, need_neigh)
+            check_error(error, "nl.build")
+        self.num_builds += 1
+
+    @property
+    def conf_hash(self) -> str:
+        """
+        Hash of the content of the configuration at the current coordinates of the
+        contributing atoms, i.e. those of the last :meth:`create_neigh` or
+        :meth:`update`; see :func:`hash_configuration`.
+        """
+        if self._conf_hash is None:
+            n = len(self._species_code_cb)
+            self._conf_hash = _hash_content(
+                self._cell,
+                self._PBC,
+                code_to_species(self._species_code_cb),
+                self.coords[:n],
+            )
+        return self._conf_hash
 
-    def get_neigh(self, index: int) -> Tuple[List[int], np.array, List[str]]:
+    def update(self, coords: np.array) -> bool:
+        """
+        Update the neighbor list for new coordinates of the contributing atoms.
+
+        If no atom has moved more than half of the skin distance since the neighbor list
+        was last built, only the coordinates of contributing and padding atoms are
+        refreshed, and the neighbor list is reused. Otherwise, the padding atoms and the
+        neighbor list are rebuilt from scratch.
+
+        Args:
+            coords: New coordinates of the contributing atoms, 2D array of shape (N, 3).
+                The atoms should be in the same order as in the configuration.
+
+        Returns:
+            ``True`` if the neighbor list is rebuilt, ``False`` otherwise.
+        """
+        coords = np.asarray(coords, dtype=np.double)
+        if coords.shape != self._coords_at_build.shape:
+            raise NeighborListError(
+                f"Expect `coords` of shape {self._coords_at_build.shape}; "
+                f"got {coords.shape}."
+            )
+
+        disp = coords - self._coords_at_build
+        max_disp_sq = np.max(np.sum(disp * disp, axis=1)) if len(disp) > 0 else 0.0
+
+        if max_disp_sq > (0.5 * self.skin) ** 2:
+            self.create_neigh(coords)
+            return True
+
+        # update in place, since other objects may hold references to these arrays
+        n = len(coords)
+        self.padding_coords[:] = coords[self.padding_image] + self._padding_shift
+        self.coords[:n] = coords
+        self.coords[n:] = self.padding_coords
+        self._conf_hash = None
+
+        return False
+
+    def get_neigh(
+        self, index: int, neigh_list_index: int = 0
+    ) -> Tuple[List[int], np.array, List[str]]:
         """
         Get the indices, coordinates, and species string of a given atom.
 
         Args:
             index: Atom number whose neighbor info is requested.
+            neigh_list_index: Index of the neighbor list, i.e. the neighbors within
+                ``cutoffs[neigh_list_index]`` are returned.
 
         Returns:
             neigh_indices: Indices of neighbor atoms in self.coords and self.species.
@@ -118,10 +262,8 @@ class NeighborList:
             neigh_species: Species symbol of neighbor atoms.
         """
 
-        cutoffs = np.asarray([self.infl_dist], dtype=np.double)
-        neigh_list_index = 0
         num_neigh, neigh_indices, error = nl.get_neigh(
-            self.neigh, cutoffs, neigh_list_index, index
+            self.neigh, self.cutoffs, neigh_list_index, index
         )
         check_error(error, "nl.get_neigh")
 
@@ -131,7 +273,11 @@ class NeighborList:
         return neigh_indices, neigh_coords, neigh_species
 
     def get_numneigh_and_neighlist_1D(
-        self, request_padding: bool = False
+        self,
+        request_padding: bool = False,
+        neigh_list_index: int = 0,
+        species_cutoffs: Optional[Dict[str, float]] = None,
+        half_list: bool = False,
     ) -> Tuple[np.array, np.array]:
         """
         Get the number of neighbors and neighbor list for all atoms.
@@ -140,6 +286,22 @@ class NeighborList:
             request_padding: If ``True``, the returned number of neighbors and neighbor
                 list include those for padding atoms; If ``False``, only return these
                 for contributing atoms.
+            neigh_list_index: Index of the neighbor list, i.e. the neighbors within
+                ``cutoffs[neigh_list_index]`` are returned.
+            species_cutoffs: Cutoff distances for species pairs, with key of the form
+                ``A-B`` where ``A`` and ``B`` are species string, and value the cutoff.
+                If provided, a neighbor ``j`` of atom ``i`` is removed if their distance
+                is not smaller than the cutoff of their species pair. This is useful for
+                multi-species systems, where the cutoff of the neighbor list has to be
+                the largest cutoff of all species pairs.
+            half_list: If ``True``, return a half neighbor list, in which each pair of
+                interacting atoms appears only once. A pair of contributing atoms ``i``
+                and ``j`` is kept in the list of atom ``min(i, j)``. A pair of
+                contributing atom ``i`` and padding atom ``p`` is equivalent to a pair of
+                ``image[p]`` and an image of ``i``; only one of them is kept. Summing a
+                pairwise quantity over the half list (without a factor of 0.5) gives the
+                same result as summing it over the full list with a factor of 0.5.
+                Cannot be used together with ``request_padding``.
 
         Returns:
             numneigh: 1D array; number of neighbors for all atoms.
@@ -148,6 +310,11 @@ class NeighborList:
                 ``numneigh[0]`` components are the neighbors of atom `0`, the next
                 ``numneigh[1]`` components are the neighbors of atom `1` ....
         """
+        if request_padding and half_list:
+            raise NeighborListError(
+                "Half neighbor list is not supported for padding atoms."
+            )
+
         if request_padding:
             if not self.padding_need_neigh:
                 raise NeighborListError(
@@ -156,25 +323,261 @@ class NeighborList:
                 )
             N = len(self.coords)
         else:
-            N = self.conf.get_num_atoms()
+            N = len(self._coords_at_build)
 
-        cutoffs = np.asarray([self.infl_dist], dtype=np.double)
-        neigh_list_index = 0
+        # obtain the neighbor list of all atoms in a single call (CSR style)
+        numneigh, neighlist, error = nl.get_numneigh_and_neighlist_1D(
+            self.neigh, self.cutoffs, neigh_list_index, N
+        )
+        check_error(error, "nl.get_numneigh_and_neighlist_1D")
 
-        numneigh = []
-        neighlist = []
-        for i in range(N):
-            num_neigh, neigh_indices, error = nl.get_neigh(
-                self.neigh, cutoffs, neigh_list_index, i
+        if species_cutoffs is not None:
+            numneigh, neighlist = self._prune_by_species(
+                numneigh, neighlist, species_cutoffs
             )
-            check_error(error, "nl.get_neigh")
-            numneigh.append(num_neigh)
-            neighlist.append(neigh_indices)
-        neighlist = np.asarray(np.concatenate(neighlist), dtype=np.intc)
-        numneigh = np.asarray(numneigh, dtype=np.intc)
+
+        if half_list:
+            numneigh, neighlist = self._to_half_list(numneigh, neighlist)
+
+        return numneigh, neighlist
+
+    def _to_half_list(
+        self, numneigh: np.array, neighlist: np.array
+    ) -> Tuple[np.array, np.array]:
+        """
+        Keep each pair of interacting contributing atoms only once.
+        """
+        n = len(numneigh)
+        atoms = np.repeat(np.arange(n), numneigh)
+        image = self.image[neighlist]
+
+        # contributing neighbor, or padding neighbor that is an image of another atom
+        keep = atoms < image
+
+        # padding neighbor that is an image of the atom itself: keep the one with a
+        # lattice translation pointing to the positive side
+        self_image = (atoms == image) & (neighlist >= n)
+        if np.any(self_image):
+            shift = self._padding_shift[neighlist[self_image] - n]
+            tol = 1e-6
+            positive = shift[:, 0] > tol
+            zero = np.abs(shift[:, 0]) <= tol
+            positive |= zero & (shift[:, 1] > tol)
+            zero &= np.abs(shift[:, 1]) <= tol
+            positive |= zero & (shift[:, 2] > tol)
+            keep[self_image] = positive
+
+        numneigh = np.asarray(np.bincount(atoms[keep], minlength=n), dtype=np.intc)
+        neighlist = np.asarray(neighlist[keep], dtype=np.intc)
 
         return numneigh, neighlist
 
+    def _prune_by_species(
+        self, numneigh: np.array, neighlist: np.array, species_cutoffs: Dict[str, float]
+    ) -> Tuple[np.array, np.array]:
+        """
+        Remove neighbors beyond the cutoff of the species pair.
+        """
+        unique_code, species_code = np.unique(self.species_code, return_inverse=True)
+        unique_species = code_to_species(unique_code)
+
+        n = len(unique_species)
+        rcutsq = np.zeros((n, n), dtype=np.double)
+        for i, si in enumerate(unique_species):
+            for j, sj in enumerate(unique_species):
+                rcut = species_cutoffs.get(
+                    f"{si}-{sj}", species_cutoffs.get(f"{sj}-{si}")
+                )
+                if rcut is None:
+                    raise NeighborListError(
+                        f"Cutoff for species pair `{si}-{sj}` not in `species_cutoffs`."
+                    )
+                rcutsq[i, j] = rcut * rcut
+
+        atoms = np.repeat(np.arange(len(numneigh)), numneigh)
+        rij = self.coords[neighlist] - self.coords[atoms]
+        rsq = np.sum(rij * rij, axis=1)
+        keep = rsq < rcutsq[species_code[atoms], species_code[neighlist]]
+
+        numneigh = np.asarray(
+            np.bincount(atoms[keep], minlength=len(numneigh)), dtype=np.intc
+        )
+        neighlist = np.asarray(neighlist[keep], dtype=np.intc)
+
+        return numneigh, neighlist
+
+    def filter(self, infl_dist: float) -> "NeighborList":
+        """
+        Create a neighbor list with a smaller influence distance from this one.
+
+        The neighbors are obtained by screening the neighbors of this neighbor list, and
+        no neighbor search is performed. The padding atoms are the same as this neighbor
+        list, which may include more atoms than needed for ``infl_dist``.
+
+        Args:
+            infl_dist: Influence distance of the new neighbor list. It should be no
+                larger than the influence distance of this neighbor list.
+
+        Returns:
+            A new neighbor list.
+        """
+        if infl_dist > self.infl_dist + self.skin:
+            raise NeighborListError(
+                f"Cannot create a neighbor list with `infl_dist = {infl_dist}` from one "
+                f"with `infl_dist = {self.infl_dist + self.skin}`."
+            )
+
+        numneigh, neighlist = self.get_numneigh_and_neighlist_1D(
+            request_padding=self.padding_need_neigh,
+            neigh_list_index=self._largest_cutoff_index(),
+        )
+
+        # screen neighbors by distance
+        atoms = np.repeat(np.arange(len(numneigh)), numneigh)
+        rij = self.coords[neighlist] - self.coords[atoms]
+        keep = np.sum(rij * rij, axis=1) < infl_dist * infl_dist
+
+        N = len(self.coords)
+        new_numneigh = np.asarray(np.bincount(atoms[keep], minlength=N), dtype=np.intc)
+        new_neighlist = np.asarray(neighlist[keep], dtype=np.intc)
+
+        new = self.__class__.__new__(self.__class__)
+        new.conf = self.conf
+        new._cell = self._cell
+        new._PBC = self._PBC
+        new._species_code_cb = self._species_code_cb
+        new._conf_hash = self._conf_hash
+        new.infl_dist = infl_dist
+        new.padding_need_neigh = self.padding_need_neigh
+        new.skin = 0.0
+        new.backend = self.backend
+        new.cutoffs = np.asarray([infl_dist], dtype=np.double)
+        new.coords = self.coords.copy()
+        new.species_code = self.species_code.copy()
+        new.image = self.image.copy()
+        new.padding_coords = self.padding_coords.copy()
+        new.padding_image = self.padding_image.copy()
+        new._padding_shift = self._padding_shift.copy()
+        new._coords_at_build = self._coords_at_build.copy()
+
+        new.neigh = nl.initialize()
+        error = nl.set_neigh(new.neigh, new.cutoffs, new_numneigh, new_neighlist)
+        check_error(error, "nl.set_neigh")
+        new.num_builds = 1
+
+        return new
+
+    def save(self, filename: Union[str, Path]):
+        """
+        Save the neighbor list to a binary ``.npz`` file.
+
+        The coordinates, species, images, and the neighbors of all the cutoffs are
+        saved, together with the hash of the configuration at the current coordinates
+        (see :attr:`conf_hash`), such that the neighbor list can be restored by
+        :meth:`load` without performing the neighbor search.
+
+        Args:
+            filename: Path to the file. The file is written atomically (see
+                :func:`~kliff.utils.savez_atomic`), such that a partially written file
+                is never observed by :meth:`load`.
+        """
+        numneigh, neighlist = self._get_all_neigh()
+
+        savez_atomic(
+            filename,
+            conf_hash=self.conf_hash,
+            infl_dist=self.infl_dist,
+            padding_need_neigh=self.padding_need_neigh,
+            skin=self.skin,
+            cutoffs=self.cutoffs,
+            coords=self.coords,
+            species_code=self.species_code,
+            image=self.image,
+            padding_shift=self._padding_shift,
+            coords_at_build=self._coords_at_build,
+            numneigh=numneigh,
+            neighlist=neighlist,
+        )
+
+    @classmethod
+    def load(cls, filename: Union[str, Path], conf: Configuration) -> "NeighborList":
+        """
+        Load a neighbor list saved by :meth:`save`.
+
+        Args:
+            filename: Path to the file.
+            conf: The atomic configuration the neighbor list was created for. It should
+                have the same cell, PBC, species, and coords as the one used to create the
+                neighbor list.
+
+        Returns:
+            The neighbor list.
+        """
+        with np.load(to_path(filename)) as data:
+            if str(data["conf_hash"]) != hash_configuration(conf):
+                raise NeighborListError(
+                    f"Neighbor list in `{filename}` is not created for configuration "
+                    f"`{conf.identifier}`."
+                )
+
+            new = cls.__new__(cls)
+            new.conf = conf
+            new._cell = np.array(conf.cell, dtype=np.double)
+            new._PBC = np.array(conf.PBC, dtype=np.intc)
+            new._species_code_cb = species_to_code(conf.species)
+            new._conf_hash = str(data["conf_hash"])
+            new.infl_dist = float(data["infl_dist"])
+            new.padding_need_neigh = bool(data["padding_need_neigh"])
+            new.skin = float(data["skin"])
+            new.backend = "nl"
+            new.cutoffs = np.asarray(data["cutoffs"], dtype=np.double)
+            new.coords = np.asarray(data["coords"], dtype=np.double)
+            new.species_code = np.asarray(data["species_code"], dtype=np.intc)
+            new.image = np.asarray(data["image"], dtype=np.intc)
+            new._padding_shift = np.asarray(data["padding_shift"], dtype=np.double)
+            new._coords_at_build = np.asarray(data["coords_at_build"], dtype=np.double)
+            numneigh = np.asarray(data["numneigh"], dtype=np.intc)
+            neighlist = np.asarray(data["neighlist"], dtype=np.intc)
+
+        n = len(new._coords_at_build)
+        new.padding_coords = new.coords[n:].copy()
+        new.padding_image = new.image[n:].copy()
+
+        new.neigh = nl.initialize()
+        cutoffs = new.cutoffs + new.skin
+        error = nl.set_neigh(new.neigh, cutoffs, numneigh, neighlist)
+        check_error(error, "nl.set_neigh")
+        new.num_builds = 1
+
+        return new
+
+    def _get_all_neigh(self) -> Tuple[np.array, np.array]:
+        """
+        Number of neighbors and neighbor list of all atoms for all cutoffs, in the
+        layout expected by `nl.set_neigh`.
+        """
+        N = len(self.coords)
+        all_numneigh = []
+        all_neighlist = []
+        for k in range(len(self.cutoffs)):
+            numneigh, neighlist, error = nl.get_numneigh_and_neighlist_1D(
+                self.neigh, self.cutoffs, k, N
+            )
+            check_error(error, "nl.get_numneigh_and_neighlist_1D")
+            all_numneigh.append(numneigh)
+            all_neighlist.append(neighlist)
+
+        numneigh = np.asarray(np.concatenate(all_numneigh), dtype=np.intc)
+        neighlist = np.asarray(np.concatenate(all_neighlist), dtype=np.intc)
+
+        return numneigh, neighlist
+
+    def _largest_cutoff_index(self) -> int:
+        """
+        Index of the neighbor list with the largest cutoff.
+        """
+        return int(np.argmax(self.cutoffs))
+
     def get_coords(self) -> np.array:
         """
         Return coords of both contributing and padding atoms.
@@ -182,6 +585,34 @@ class NeighborList:
         """
         return self.coords.copy()
 
+    @property
+    def species(self) -> np.array:
+        """
+        Species string of both contributing and padding atoms.
+        """
+        if self._species is None:
+            self._species = code_to_species(self.species_code)
+        return self._species
+
+    @property
+    def padding_species(self) -> np.array:
+        """
+        Species string of padding atoms.
+        """
+        return self.species[len(self._coords_at_build) :]
+
+    @property
+    def species_code(self) -> np.array:
+        """
+        Atomic number of both contributing and padding atoms.
+        """
+        return self._species_code
+
+    @species_code.setter
+    def species_code(self, species_code: np.array):
+        self._species_code = species_code
+        self._species = None
+
     def get_species(self) -> List[str]:
         """
         Return species of both contributing and padding atoms.
@@ -198,7 +629,7 @@ class NeighborList:
         Returns:
             1D array of integer species code.
         """
-        return np.asarray([mapping[s] for s in self.species], dtype=np.intc)
+        return map_species_code(self.species_code, mapping)
 
     def get_image(self) -> np.array:
         """
@@ -218,11 +649,22 @@ class NeighborList:
         """
         return self.padding_coords.copy()
 
-    def get_padding_speices(self) -> List[str]:
+    def get_padding_species(self) -> List[str]:
         """
         Return species string of padding atoms.
         """
-        return self.padding_speices[:]
+        return self.padding_species[:]
+
+    def get_padding_speices(self) -> List[str]:
+        """
+        Deprecated alias of :meth:`get_padding_species`.
+        """
+        warnings.warn(
+            "`get_padding_speices` is deprecated; use `get_padding_species` instead.",
+            category=DeprecationWarning,
+            stacklevel=2,
+        )
+        return self.get_padding_species()
 
     def get_padding_species_code(self, mapping: Dict[str, int]) -> np.array:
         """
@@ -234,7 +676,8 @@ class NeighborList:
         Returns:
             1D array of integer species code for padding atoms.
         """
-        return np.asarray([mapping[s] for s in self.padding_species], dtype=np.intc)
+        n = len(self._coords_at_build)
+        return map_species_code(self.species_code[n:], mapping)
 
     def get_padding_image(self) -> np.array:
         """
@@ -246,10 +689,615 @@ class NeighborList:
         return self.padding_image.copy()
 
     def __del__(self):
-        nl.clean(self.neigh)
+        # `neigh` does not exist if initialization failed
+        if hasattr(self, "neigh"):
+            nl.clean(self.neigh)
+
+
+class ImageNeighborList:
+    """
+    Neighbor list using image offsets instead of padding atoms.
+
+    For a small periodic cell with a large influence distance, :class:`NeighborList`
+    creates many padding atoms, which can outnumber the contributing atoms by orders of
+    magnitude. This neighbor list does not create padding atoms. Instead, a neighbor is
+    represented by the index of a contributing atom ``j`` together with an integer
+    lattice shift ``n``, such that the position of the neighbor is
+    ``coords[j] + n @ cell`` (the rows of ``cell`` are the lattice vectors). Small and
+    triclinic cells are supported, and the memory scales with the number of neighbor
+    pairs instead of the number of images.
+
+    The neighbor search loops over the contributing atoms and compares each of them
+    against all atoms in all the required images, so it is intended for small cells; for
+    large cells, :class:`NeighborList` is more efficient.
+
+    Use :func:`assemble_forces_from_pairs` and :func:`assemble_stress_from_pairs` to
+    obtain the forces and stress from the pairwise derivatives of the energy.
+
+    Args:
+        conf: atomic configuration.
+        infl_dist: Influence distance, within which atoms are interacting with each other.
+
+    Attributes:
+        coords: 2D array
+            Coordinates of contributing atoms.
+        species_code: 1D int array
+            Atomic number of contributing atoms.
+        cell: 2D array
+            Supercell lattice vectors (as rows).
+        num_builds: int
+            Number of times the neighbor list has been built.
+    """
+
+    def __init__(self, conf: Configuration, infl_dist: float):
+        self.conf = conf
+        self.infl_dist = infl_dist
+
+        self.coords = np.array(conf.coords, dtype=np.double)
+        self.species_code = species_to_code(conf.species)
+        self.cell = np.array(conf.cell, dtype=np.double)
+        self.PBC = np.asarray(conf.PBC, dtype=bool)
+
+        self.numneigh = None
+        self.neighlist = None
+        self.shifts = None
+
+        self.num_builds = 0
+        self.create_neigh()
+
+    def create_neigh(self):
+        """
+        Build the neighbor list.
+        """
+        coords = self.coords
+        N = len(coords)
+        rcut = self.infl_dist
+
+        # lattice shifts of the images that can contain neighbors
+        num_images = self._get_num_images()
+        shifts = np.asarray(
+            list(itertools.product(*[range(-k, k + 1) for k in num_images])),
+            dtype=np.intc,
+        )
+        offsets = np.dot(shifts, self.cell)
+        zero_shift = int(np.nonzero(~np.any(shifts, axis=1))[0][0])
+
+        numneigh = np.zeros(N, dtype=np.intc)
+        neighlist = []
+        neighshift = []
+        for i in range(N):
+            # rij[s, j]: displacement from atom i to the image of atom j given by shift s
+            rij = coords[None, :, :] + offsets[:, None, :] - coords[i]
+            within = np.sum(rij * rij, axis=2) < rcut * rcut
+            within[zero_shift, i] = False
+            s, j = np.nonzero(within)
+            numneigh[i] = len(j)
+            neighlist.append(j)
+            neighshift.append(shifts[s])
+
+        if N > 0:
+            self.neighlist = np.asarray(np.concatenate(neighlist), dtype=np.intc)
+            self.shifts = np.asarray(np.concatenate(neighshift), dtype=np.intc)
+        else:
+            self.neighlist = np.zeros(0, dtype=np.intc)
+            self.shifts = np.zeros((0, 3), dtype=np.intc)
+        self.numneigh = numneigh
+        self.num_builds += 1
+
+    def _get_num_images(self) -> List[int]:
+        """
+        Number of images to search along each lattice vector, on each side.
+        """
+        if not np.any(self.PBC):
+            return [0, 0, 0]
+
+        volume = abs(np.linalg.det(self.cell))
+        if volume < 1e-10:
+            raise NeighborListError("Cannot invert cell matrix. Determinant is 0.")
+
+        # atoms may not be wrapped into the cell; account for the spread of them
+        frac = np.linalg.solve(self.cell.T, self.coords.T).T
+        if len(frac) > 0:
+            spread = np.max(frac, axis=0) - np.min(frac, axis=0)
+        else:
+            spread = np.zeros(3)
+
+        num_images = []
+        for a in range(3):
+            if self.PBC[a]:
+                # distance between lattice planes spanned by the other two vectors
+                b, c = self.cell[(a + 1) % 3], self.cell[(a + 2) % 3]
+                d = volume / np.linalg.norm(np.cross(b, c))
+                num_images.append(int(np.ceil(self.infl_dist / d + spread[a])))
+            else:
+                num_images.append(0)
+
+        return num_images
+
+    def get_neigh(self, index: int) -> Tuple[np.array, np.array, np.array]:
+        """
+        Get the indices, coordinates, and species string of the neighbors of an atom.
+
+        Args:
+            index: Atom number whose neighbor info is requested.
+
+        Returns:
+            neigh_indices: Indices of the contributing atoms, of which the neighbors are
+                images.
+            neigh_coords: 2D array of shape (N, 3), where N is the number of neighbors.
+                Coordinates of neighbor atoms.
+            neigh_species: Species symbol of neighbor atoms.
+        """
+        start = int(np.sum(self.numneigh[:index]))
+        end = start + self.numneigh[index]
+        neigh_indices = self.neighlist[start:end]
+        neigh_coords = self.coords[neigh_indices] + np.dot(
+            self.shifts[start:end], self.cell
+        )
+        neigh_species = code_to_species(self.species_code[neigh_indices])
+
+        return neigh_indices, neigh_coords, neigh_species
+
+    def get_numneigh_and_neighlist_1D(
+        self, half_list: bool = False
+    ) -> Tuple[np.array, np.array, np.array]:
+        """
+        Get the number of neighbors, neighbor list, and lattice shifts for all atoms.
+
+        Args:
+            half_list: If ``True``, return a half neighbor list, in which each pair of
+                interacting atoms appears only once. Pair ``(i, j, n)`` is equivalent to
+                pair ``(j, i, -n)``; the former is kept if ``i < j``, or if ``i == j``
+                and the first nonzero component of ``n`` is positive.
+
+        Returns:
+            numneigh: 1D array; number of neighbors for all atoms.
+            neighlist: 1D array; indices of the neighbors for all atoms stacked into a
+                1D array, see :meth:`NeighborList.get_numneigh_and_neighlist_1D`. Note
+                the indices are always those of contributing atoms.
+            shifts: 2D int array of shape (len(neighlist), 3); lattice shift of each
+                neighbor in ``neighlist``.
+        """
+        numneigh = self.numneigh
+        neighlist = self.neighlist
+        shifts = self.shifts
+
+        if half_list:
+            atoms = np.repeat(np.arange(len(numneigh)), numneigh)
+            keep = atoms < neighlist
+            self_image = atoms == neighlist
+            if np.any(self_image):
+                s = shifts[self_image]
+                first_nonzero = s[np.arange(len(s)), np.argmax(s != 0, axis=1)]
+                keep[self_image] = first_nonzero > 0
+
+            numneigh = np.asarray(
+                np.bincount(atoms[keep], minlength=len(numneigh)), dtype=np.intc
+            )
+            neighlist = neighlist[keep]
+            shifts = shifts[keep]
+
+        return numneigh.copy(), neighlist.copy(), shifts.copy()
+
+    def get_displacements(
+        self, numneigh: np.array, neighlist: np.array, shifts: np.array
+    ) -> np.array:
+        """
+        Displacement vectors from atoms to their neighbors.
 
+        Args:
+            numneigh: Number of neighbors, as returned by
+                :meth:`get_numneigh_and_neighlist_1D`.
+            neighlist: Neighbor list, as returned by
+                :meth:`get_numneigh_and_neighlist_1D`.
+            shifts: Lattice shifts, as returned by
+                :meth:`get_numneigh_and_neighlist_1D`.
+
+        Returns:
+            2D array of shape (len(neighlist), 3), ``r_j + n @ cell - r_i`` for each
+            pair.
+        """
+        atoms = np.repeat(np.arange(len(numneigh)), numneigh)
+        rij = self.coords[neighlist] - self.coords[atoms]
+        rij += np.dot(shifts, self.cell)
+
+        return rij
+
+    def get_coords(self) -> np.array:
+        """
+        Return coords of contributing atoms. Shape (N,3).
+        """
+        return self.coords.copy()
+
+    def get_species(self) -> List[str]:
+        """
+        Return species of contributing atoms.
+        """
+        return code_to_species(self.species_code)
+
+    def get_species_code(self, mapping: Dict[str, int]) -> np.array:
+        """
+        Integer species code of contributing atoms.
 
-def assemble_forces(forces: np.array, n: int, padding_image: np.array) -> np.array:
+        Args:
+            mapping: A mapping between species string and its code.
+
+        Returns:
+            1D array of integer species code.
+        """
+        return map_species_code(self.species_code, mapping)
+
+
+class NeighborListCache:
+    """
+    A least recently used (LRU) cache of neighbor lists.
+
+    Neighbor lists are keyed by the content of the configuration (cell, PBC, species,
+    and coords), the influence distance, and ``padding_need_neigh``. A request for an
+    influence distance that is not in the cache is served by filtering a cached neighbor
+    list of the same configuration with a larger influence distance, if there is one.
+    The least recently used neighbor lists are evicted when the estimated memory of all
+    cached neighbor lists exceeds ``max_memory``; if it is 0, no neighbor list is kept
+    in memory.
+
+    The cached neighbor lists only keep the content hash and the arrays of a
+    configuration, not the configuration itself, i.e. their ``conf`` is ``None``.
+
+    If ``cache_dir`` is given, the neighbor lists are also persisted to it (see
+    :meth:`NeighborList.save`), keyed by the configuration hash and the influence
+    distance. A neighbor list not in memory is then loaded from disk if it was created
+    before, e.g. by a previous fitting run on the same dataset, instead of being created.
+
+    Args:
+        max_memory: Memory budget of the cache in bytes.
+        cache_dir: Directory to persist the neighbor lists. If ``None``, the neighbor
+            lists are only cached in memory.
+
+    Note:
+        The cached neighbor lists are shared by all the objects requesting them, and thus
+        they should not be modified (e.g. via :meth:`NeighborList.update`).
+
+        The cache is thread safe, and the neighbor lists of different configurations can
+        be created concurrently from multiple threads.
+    """
+
+    def __init__(
+        self, max_memory: int = 2 ** 28, cache_dir: Optional[Union[str, Path]] = None
+    ):
+        # {(conf_hash, infl_dist, padding_need_neigh): (neighbor list, memory)}
+        self._cache = OrderedDict()
+        self._memory = 0
+        self._max_memory = max_memory
+        self._lock = threading.Lock()
+        self.cache_dir = cache_dir
+
+    @property
+    def cache_dir(self) -> Optional[Path]:
+        """
+        Directory to persist the neighbor lists; ``None`` to disable persisting.
+        """
+        return self._cache_dir
+
+    @cache_dir.setter
+    def cache_dir(self, cache_dir: Optional[Union[str, Path]]):
+        self._cache_dir = None if cache_dir is None else to_path(cache_dir)
+
+    @property
+    def max_memory(self) -> int:
+        """
+        Memory budget of the cache in bytes.
+        """
+        return self._max_memory
+
+    @max_memory.setter
+    def max_memory(self, max_memory: int):
+        with self._lock:
+            self._max_memory = max_memory
+            self._evict()
+
+    def get(
+        self, conf: Configuration, infl_dist: float, padding_need_neigh: bool = False
+    ) -> NeighborList:
+        """
+        Get the neighbor list of a configuration, creating it if not in the cache.
+
+        Args:
+            conf: atomic configuration.
+            infl_dist: Influence distance of the neighbor list.
+            padding_need_neigh: Whether to generate neighbors for padding atoms.
+        """
+        conf_hash = hash_configuration(conf)
+        key = (conf_hash, float(infl_dist), padding_need_neigh)
+
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                return self._cache[key][0]
+
+            # the cached neighbor list of the same configuration with the smallest
+            # influence distance that is larger than the requested one
+            larger = [
+                k
+                for k in self._cache
+                if k[0] == conf_hash and k[2] == padding_need_neigh and k[1] > infl_dist
+            ]
+            if larger:
+                k = min(larger, key=lambda x: x[1])
+                self._cache.move_to_end(k)
+                source = self._cache[k][0]
+            else:
+                source = None
+
+        # create outside the lock, such that multiple threads can create concurrently
+        path = self._get_path(key)
+        if path is not None and path.exists():
+            neigh = NeighborList.load(path, conf)
+        else:
+            if source is not None:
+                neigh = source.filter(infl_dist)
+            else:
+                neigh = NeighborList(conf, infl_dist, padding_need_neigh)
+            if path is not None:
+                neigh.save(path)
+
+        if self._max_memory <= 0:
+            return neigh
+
+        # do not keep the configuration alive
+        neigh._conf_hash = conf_hash
+        neigh.conf = None
+
+        with self._lock:
+            # another thread may have created it in the meantime
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                return self._cache[key][0]
+            self._add(key, neigh)
+
+        return neigh
+
+    def clear(self):
+        """
+        Remove all neighbor lists from the cache. The files in ``cache_dir`` are kept.
+        """
+        with self._lock:
+            self._cache.clear()
+            self._memory = 0
+
+    @property
+    def memory(self) -> int:
+        """
+        Estimated memory (in bytes) of all cached neighbor lists.
+        """
+        return self._memory
+
+    def __len__(self):
+        return len(self._cache)
+
+    def _get_path(self, key) -> Optional[Path]:
+        if self._cache_dir is None:
+            return None
+        conf_hash, infl_dist, padding_need_neigh = key
+        return self._cache_dir.joinpath(
+            f"{conf_hash}_{infl_dist!r}_{int(padding_need_neigh)}.npz"
+        )
+
+    def _add(self, key, neigh: NeighborList):
+        mem = _estimate_memory(neigh)
+        self._cache[key] = (neigh, mem)
+        self._memory += mem
+        self._evict()
+
+    def _evict(self):
+        # evict least recently used, but always keep the most recently used one
+        while self._memory > self._max_memory and len(self._cache) > 1:
+            _, (_, m) = self._cache.popitem(last=False)
+            self._memory -= m
+
+
+# process-wide neighbor list cache, disabled (no memory budget) by default
+_neighbor_list_cache = NeighborListCache(max_memory=0)
+
+
+def get_neighbor_list(
+    conf: Configuration,
+    infl_dist: float,
+    padding_need_neigh: bool = False,
+    images: bool = False,
+) -> Union[NeighborList, ImageNeighborList]:
+    """
+    Get the neighbor list of a configuration from the process-wide cache.
+
+    This allows the calculators and descriptors that work on the same configuration to
+    share the neighbor list, instead of each creating its own. See
+    :class:`NeighborListCache`.
+
+    The cache is opt-in: by default, it has no memory budget, and a new neighbor list
+    is created for each call. Enable it by setting a memory budget, e.g.
+    ``get_neighbor_list_cache().max_memory = 2**28``.
+
+    Args:
+        conf: atomic configuration.
+        infl_dist: Influence distance of the neighbor list.
+        padding_need_neigh: Whether to generate neighbors for padding atoms. Ignored if
+            ``images=True``.
+        images: If ``True``, return an :class:`ImageNeighborList`, which uses lattice
+            shifts instead of padding atoms; it is not cached.
+    """
+    if images:
+        return ImageNeighborList(conf, infl_dist)
+
+    return _neighbor_list_cache.get(conf, infl_dist, padding_need_neigh)
+
+
+def get_neighbor_list_cache() -> NeighborListCache:
+    """
+    Return the process-wide neighbor list cache, e.g. to enable it by setting its
+    memory budget, or to clear it.
+    """
+    return _neighbor_list_cache
+
+
+def hash_configuration(conf: Configuration) -> str:
+    """
+    Hash of the content of a configuration, i.e. its cell, PBC, species, and coords.
+    """
+    return _hash_content(conf.cell, conf.PBC, conf.species, conf.coords)
+
+
+def _hash_content(cell, PBC, species, coords) -> str:
+    """
+    Hash of the cell, PBC, species, and coords of a configuration.
+    """
+    h = hashlib.sha1()
+    h.update(np.ascontiguousarray(cell, dtype=np.double).tobytes())
+    h.update(np.asarray(PBC, dtype=np.intc).tobytes())
+    h.update(" ".join(species).encode())
+    h.update(np.ascontiguousarray(coords, dtype=np.double).tobytes())
+
+    return h.hexdigest()
+
+
+def _estimate_memory(neigh: NeighborList) -> int:
+    """
+    Estimated memory (in bytes) used by a neighbor list.
+    """
+    numneigh, neighlist = neigh.get_numneigh_and_neighlist_1D(
+        request_padding=neigh.padding_need_neigh,
+        neigh_list_index=neigh._largest_cutoff_index(),
+    )
+    N = len(neigh.coords)
+
+    # coords, padding_coords, and padding shift
+    mem = 3 * neigh.coords.nbytes
+    mem += neigh.species_code.nbytes + neigh.image.nbytes + neigh.padding_image.nbytes
+    # number of neighbors, begin index, and neighbor list in the C++ extension
+    mem += 2 * N * numneigh.itemsize + neighlist.nbytes
+
+    return mem
+
+
+def _search_kdtree(
+    coords: np.array, cutoffs: np.array, need_neigh: np.array
+) -> Tuple[np.array, np.array]:
+    """
+    Find neighbors using a KD-tree.
+
+    Args:
+        coords: Coordinates of all atoms, 2D array of shape (N, 3).
+        cutoffs: Cutoffs of the neighbor lists.
+        need_neigh: Whether to find neighbors for an atom, 1D array of shape (N,).
+
+    Returns:
+        numneigh: Number of neighbors of all atoms for all cutoffs, in the layout
+            expected by `nl.set_neigh`, i.e. 1D array of shape (len(cutoffs) * N,).
+        neighlist: Neighbors of all atoms for the first cutoff, then for the second
+            cutoff...
+    """
+    N = len(coords)
+    need = np.nonzero(need_neigh)[0]
+
+    tree = cKDTree(coords)
+    tree_need = cKDTree(coords[need])
+    pairs = tree_need.sparse_distance_matrix(
+        tree, np.max(cutoffs), output_type="ndarray"
+    )
+    atoms = need[pairs["i"]]
+    neigh = np.asarray(pairs["j"], dtype=np.intc)
+    r = pairs["v"]
+
+    not_self = atoms != neigh
+    atoms = atoms[not_self]
+    neigh = neigh[not_self]
+    r = r[not_self]
+
+    if np.any(r * r < 1e-10):
+        k = np.argmin(r)
+        raise NeighborListError(
+            f"Collision of atoms {atoms[k] + 1} and {neigh[k] + 1}. Their distance is "
+            f"{r[k]}."
+        )
+
+    # sort by atom, then by neighbor
+    order = np.lexsort((neigh, atoms))
+    atoms = atoms[order]
+    neigh = neigh[order]
+    r = r[order]
+
+    all_numneigh = []
+    all_neighlist = []
+    for rcut in cutoffs:
+        within = r < rcut
+        all_numneigh.append(np.bincount(atoms[within], minlength=N))
+        all_neighlist.append(neigh[within])
+
+    numneigh = np.asarray(np.concatenate(all_numneigh), dtype=np.intc)
+    neighlist = np.asarray(np.concatenate(all_neighlist), dtype=np.intc)
+
+    return numneigh, neighlist
+
+
+def species_to_code(species: Sequence[str]) -> np.array:
+    """
+    Convert species strings to atomic numbers.
+
+    Args:
+        species: Species strings.
+
+    Returns:
+        1D int array of atomic numbers.
+    """
+    unique, inverse = np.unique(np.asarray(species, dtype=str), return_inverse=True)
+    try:
+        unique_code = np.asarray([atomic_number[s] for s in unique], dtype=np.intc)
+    except KeyError as e:
+        raise NeighborListError(f"Unknown species `{e.args[0]}`.")
+
+    return np.asarray(unique_code[inverse], dtype=np.intc).reshape(-1)
+
+
+def code_to_species(species_code: np.array) -> np.array:
+    """
+    Convert atomic numbers to species strings.
+
+    Args:
+        species_code: Atomic numbers.
+
+    Returns:
+        1D str array of species.
+    """
+    unique, inverse = np.unique(species_code, return_inverse=True)
+    unique_species = np.asarray([atomic_species[i] for i in unique], dtype=str)
+
+    return unique_species[inverse].reshape(-1)
+
+
+def map_species_code(species_code: np.array, mapping: Dict[str, int]) -> np.array:
+    """
+    Map atomic numbers to user defined species code.
+
+    Args:
+        species_code: Atomic numbers.
+        mapping: A mapping between species string and its code.
+
+    Returns:
+        1D int array of user defined species code.
+    """
+    table = np.full(len(atomic_species), -1, dtype=np.intc)
+    for s, code in mapping.items():
+        table[atomic_number[s]] = code
+
+    mapped = table[species_code]
+    if np.any(mapped < 0):
+        missing = code_to_species(np.unique(species_code[mapped < 0]))
+        raise NeighborListError(f"Species {list(missing)} not in `mapping`.")
+
+    return mapped
+
+
+def assemble_forces(
+    forces: np.array, n: int, padding_image: np.array, out: Optional[np.array] = None
+) -> np.array:
     """
     Assemble forces on padding atoms back to contributing atoms.
 
@@ -261,35 +1309,38 @@ def assemble_forces(forces: np.array, n: int, padding_image: np.array) -> np.arr
         n: Number of contributing atoms, i.e. Nc.
         padding_image: atom index, of which the padding atom is an image. 1D int array
             of shape (Np,).
+        out: Optional preallocated array of shape (Nc, 3) to store the total forces. If
+            ``None``, a new array is created.
 
     Returns:
         Total forces on contributing atoms. 2D array of shape (Nc, 3), where Nc is the
         number of contributing atoms.
     """
 
-    # numpy slicing does not make a copy !!!
-    total_forces = np.array(forces[:n])
-
-    has_padding = True if padding_image.size != 0 else False
+    if out is None:
+        out = np.empty((n, 3), dtype=np.double)
 
-    if has_padding:
+    # numpy slicing does not make a copy !!!
+    out[:] = forces[:n]
 
+    if padding_image.size != 0:
+        image = np.asarray(padding_image, dtype=np.intp)
         pad_forces = forces[n:]
-        n_padding = pad_forces.shape[0]
+        # scatter-add forces on padding atoms to the atoms they are images of
+        for k in range(3):
+            out[:, k] += np.bincount(image, weights=pad_forces[:, k], minlength=n)
+
+    return out
 
-        if n < n_padding:
-            for i in range(n):
-                # indices of padding atoms that are images of contributing atom i
-                indices = np.where(padding_image == i)
-                total_forces[i] += np.sum(pad_forces[indices], axis=0)
-        else:
-            for f, org_index in zip(pad_forces, padding_image):
-                total_forces[org_index] += f
 
-    return total_forces
+# indices of the Voigt components (xx, yy, zz, yz, zx, xy) in the 3x3 virial matrix
+_VOIGT_ROW = np.array([0, 1, 2, 1, 2, 0])
+_VOIGT_COL = np.array([0, 1, 2, 2, 0, 1])
 
 
-def assemble_stress(coords: np.array, forces: np.array, volume: float) -> np.array:
+def assemble_stress(
+    coords: np.array, forces: np.array, volume: float, out: Optional[np.array] = None
+) -> np.array:
     """
     Calculate the virial stress using the negative f dot r method.
 
@@ -303,20 +1354,104 @@ def assemble_stress(coords: np.array, forces: np.array, volume: float) -> np.arr
             number of padding atoms. The first Nc rows are the forces on contributing
             atoms.
         volume: Volume of the configuration.
+        out: Optional preallocated 1D array of shape (6,) to store the stress. If
+            ``None``, a new array is created.
+
+    Return:
+        Virial stress in Voigt notation. 1D array of shape (6,).
+    """
+
+    if out is None:
+        out = np.empty(6, dtype=np.double)
+
+    # virial[a, b] = sum_i coords[i, a] * forces[i, b], computed in a single pass
+    virial = np.dot(coords.T, forces)
+    out[:] = virial[_VOIGT_ROW, _VOIGT_COL]
+    out /= -volume
+
+    return out
+
+
+def assemble_forces_from_pairs(
+    dEdr: np.array,
+    numneigh: np.array,
+    neighlist: np.array,
+    n: int,
+    image: Optional[np.array] = None,
+    out: Optional[np.array] = None,
+) -> np.array:
+    """
+    Assemble forces on contributing atoms from the derivatives of the energy with
+    respect to the pair displacements.
+
+    For a pair of atom ``i`` and its neighbor ``j`` with displacement ``r_ij = r_j -
+    r_i``, the force on atom ``i`` is ``dE/dr_ij`` and the force on atom ``j`` (or the
+    contributing atom it is an image of) is ``-dE/dr_ij``.
+
+    Args:
+        dEdr: Derivatives of the energy with respect to the pair displacements. 2D array
+            of shape (len(neighlist), 3).
+        numneigh: Number of neighbors of the atoms.
+        neighlist: Neighbor list of the atoms, concatenated into a 1D array.
+        n: Number of contributing atoms.
+        image: Atom index, of which an atom in ``neighlist`` is an image, e.g.
+            :attr:`NeighborList.image`. ``None`` if the indices in ``neighlist`` are
+            already those of the contributing atoms, e.g. for
+            :class:`ImageNeighborList`.
+        out: Optional preallocated array of shape (n, 3) to store the total forces. If
+            ``None``, a new array is created.
+
+    Returns:
+        Total forces on contributing atoms. 2D array of shape (n, 3).
+    """
+
+    if out is None:
+        out = np.empty((n, 3), dtype=np.double)
+
+    atoms = np.repeat(np.arange(len(numneigh)), numneigh)
+    if image is None:
+        neigh = np.asarray(neighlist, dtype=np.intp)
+    else:
+        neigh = np.asarray(image, dtype=np.intp)[neighlist]
+
+    for k in range(3):
+        out[:, k] = np.bincount(atoms, weights=dEdr[:, k], minlength=n)[:n]
+        out[:, k] -= np.bincount(neigh, weights=dEdr[:, k], minlength=n)[:n]
+
+    return out
+
+
+def assemble_stress_from_pairs(
+    rij: np.array, dEdr: np.array, volume: float, out: Optional[np.array] = None
+) -> np.array:
+    """
+    Calculate the virial stress from the pair displacements and the derivatives of the
+    energy with respect to them.
+
+    This does not need the coordinates of padding atoms, and thus works for both
+    :class:`NeighborList` and :class:`ImageNeighborList`.
+
+    Args:
+        rij: Pair displacements. 2D array of shape (M, 3), where M is the number of
+            pairs.
+        dEdr: Derivatives of the energy with respect to the pair displacements. 2D array
+            of shape (M, 3).
+        volume: Volume of the configuration.
+        out: Optional preallocated 1D array of shape (6,) to store the stress. If
+            ``None``, a new array is created.
 
     Return:
         Virial stress in Voigt notation. 1D array of shape (6,).
     """
 
-    stress = np.zeros(6)
-    stress[0] = -np.sum(np.multiply(coords[:, 0], forces[:, 0])) / volume
-    stress[1] = -np.sum(np.multiply(coords[:, 1], forces[:, 1])) / volume
-    stress[2] = -np.sum(np.multiply(coords[:, 2], forces[:, 2])) / volume
-    stress[3] = -np.sum(np.multiply(coords[:, 1], forces[:, 2])) / volume
-    stress[4] = -np.sum(np.multiply(coords[:, 2], forces[:, 0])) / volume
-    stress[5] = -np.sum(np.multiply(coords[:, 0], forces[:, 1])) / volume
+    if out is None:
+        out = np.empty(6, dtype=np.double)
+
+    virial = np.dot(rij.T, dEdr)
+    out[:] = virial[_VOIGT_ROW, _VOIGT_COL]
+    out /= volume
 
-    return stress
+    return out
 
 
 class NeighborListError(Exception):
@@ -231,6 +231,50 @@ int nbl_build(NeighList * const nl,
 }
 
 
+int nbl_set_neigh(NeighList * const nl,
+                  int const numberOfParticles,
+                  int const numberOfCutoffs,
+                  double const * cutoffs,
+                  int const * numberOfNeighbors,
+                  int const * neighborList)
+{
+  // free previous neigh content and then create new
+  nbl_clean_content(nl);
+  nbl_allocate_memory(nl, numberOfCutoffs, numberOfParticles);
+
+  // `numberOfNeighbors` stores the number of neighbors of all particles for the
+  // first cutoff, then for the second cutoff...; `neighborList` stores the
+  // neighbors in the same order
+  int offset = 0;
+  for (int k = 0; k < numberOfCutoffs; k++)
+  {
+    NeighListOne * cnl = &(nl->lists[k]);
+    int total = 0;
+    for (int i = 0; i < numberOfParticles; i++)
+    {
+      int n = numberOfNeighbors[k * numberOfParticles + i];
+      if (n < 0)
+      {
+        MY_WARNING("Negative number of neighbors.");
+        nbl_clean_content(nl);
+        return 1;
+      }
+      cnl->Nneighbors[i] = n;
+      cnl->beginIndex[i] = total;
+      total += n;
+    }
+
+    cnl->numberOfParticles = numberOfParticles;
+    cnl->cutoff = cutoffs[k];
+    cnl->neighborList = new int[total];
+    std::memcpy(cnl->neighborList, neighborList + offset, sizeof(int) * total);
+    offset += total;
+  }
+
+  return 0;
+}
+
+
 int nbl_get_neigh(void const * const dataObject,
                   int const numberOfCutoffs,
                   double const * const cutoffs,
@@ -43,6 +43,13 @@ int nbl_build(NeighList * const nl,
               double const * cutoffs,
               int const * needNeighbors);
 
+int nbl_set_neigh(NeighList * const nl,
+                  int const numberOfParticles,
+                  int const numberOfCutoffs,
+                  double const * cutoffs,
+                  int const * numberOfNeighbors,
+                  int const * neighborList);
+
 int nbl_get_neigh(void const * const nl,
                   int const numberOfCutoffs,
                   double const * const cutoffs,
@@ -2,6 +2,7 @@
 #include <iostream>
 #include <pybind11/numpy.h>
 #include <pybind11/pybind11.h>
+#include <cstring>
 #include <stdlib.h>
 
 
@@ -57,6 +58,10 @@ PYBIND11_MODULE(nl, module)
         double const * pcutoffs = cutoffs.data();
         double const * c = coords.data();
         int const * nn = need_neigh.data();
+
+        // release the GIL such that neighbor lists can be built concurrently
+        // from multiple python threads
+        py::gil_scoped_release release;
         error = error
                 || nbl_build(nl,
                              Natoms,
@@ -75,6 +80,52 @@ PYBIND11_MODULE(nl, module)
       py::arg("need_neigh").noconvert());
 
 
+  module.def(
+      "set_neigh",
+      [](NeighList * const nl,
+         py::array_t<double> cutoffs,
+         py::array_t<int> numneigh,
+         py::array_t<int> neighlist) {
+        int numberOfCutoffs = cutoffs.size();
+        int error = numberOfCutoffs > 0 ? 0 : 1;
+        int Natoms = error ? 0 : numneigh.size() / numberOfCutoffs;
+        if (!error && Natoms * numberOfCutoffs != numneigh.size())
+        {
+          MY_WARNING("\"numneigh\" size is not a multiple of \"cutoffs\" size.");
+          error = 1;
+        }
+
+        // total number of neighbors should match the size of neighlist
+        if (!error)
+        {
+          int const * nn = numneigh.data();
+          long total = 0;
+          for (int i = 0; i < numneigh.size(); i++) { total += nn[i]; }
+          if (total != neighlist.size())
+          {
+            MY_WARNING("\"numneigh\" and \"neighlist\" size does not match.");
+            error = 1;
+          }
+        }
+
+        double const * pcutoffs = cutoffs.data();
+        int const * nn = numneigh.data();
+        int const * neigh = neighlist.data();
+
+        py::gil_scoped_release release;
+        error = error
+                || nbl_set_neigh(nl, Natoms, numberOfCutoffs, pcutoffs, nn, neigh);
+
+        return error;
+      },
+      py::arg("NeighList"),
+      py::arg("cutoffs").noconvert(),
+      py::arg("numneigh").noconvert(),
+      py::arg("neighlist").noconvert(),
+      "Set the neighbor list from the number of neighbors and the flattened "
+      "neighbor list of all particles. Return error.");
+
+
   module.def(
       "get_neigh",
       [](NeighList const * const nl,
@@ -119,6 +170,61 @@ PYBIND11_MODULE(nl, module)
       py::arg("particle_number"),
       "Return(number_of_neighbors, neighbors_of_particle, error)");
 
+
+  module.def(
+      "get_numneigh_and_neighlist_1D",
+      [](NeighList const * const nl,
+         py::array_t<double> cutoffs,
+         int const neighborListIndex,
+         int const numberOfParticles) {
+        int error = 0;
+        double const * pcutoffs = cutoffs.data();
+        NeighListOne const * cnl = NULL;
+
+        if (neighborListIndex >= nl->numberOfNeighborLists
+            || neighborListIndex < 0)
+        { error = 1; }
+        else
+        {
+          cnl = &(nl->lists[neighborListIndex]);
+          if (pcutoffs[neighborListIndex] > cnl->cutoff + 1.0e-10)
+          { error = 1; }
+          if (numberOfParticles > cnl->numberOfParticles
+              || numberOfParticles < 0)
+          {
+            MY_WARNING("Invalid number of particles requested");
+            error = 1;
+          }
+        }
+
+        int N = error ? 0 : numberOfParticles;
+
+        // neighbors of the first N particles are stored contiguously
+        int total = 0;
+        if (N > 0) { total = cnl->beginIndex[N - 1] + cnl->Nneighbors[N - 1]; }
+
+        py::array_t<int> numneigh(N);
+        py::array_t<int> neighlist(total);
+        if (N > 0)
+        {
+          std::memcpy(
+              numneigh.mutable_data(), cnl->Nneighbors, sizeof(int) * N);
+          std::memcpy(
+              neighlist.mutable_data(), cnl->neighborList, sizeof(int) * total);
+        }
+
+        py::tuple re(3);
+        re[0] = numneigh;
+        re[1] = neighlist;
+        re[2] = error;
+        return re;
+      },
+      py::arg("NeighList"),
+      py::arg("cutoffs").noconvert(),
+      py::arg("neighborListIndex"),
+      py::arg("number_of_particles"),
+      "Return(number_of_neighbors, neighbor_list, error)");
+
   // cannot bind `nbl_get_neigh_kim` directly, since it has pointer arguments
   // so we return a pointer to this function
   module.def("get_neigh_kim", []() {
@@ -144,7 +250,7 @@ PYBIND11_MODULE(nl, module)
         if (error)
           MY_WARNING("\"coords\" size and \"species\" size does not match.");
 
-        int Npad;
+        int Npad = 0;
         std::vector<double> pad_coords;
         std::vector<int> pad_species;
         std::vector<int> pad_image;
@@ -154,17 +260,22 @@ PYBIND11_MODULE(nl, module)
         double const * coords2 = coords.data();
         int const * species2 = species.data();
 
-        error = error
-                || nbl_create_paddings(Natoms,
-                                       influenceDistance,
-                                       cell2,
-                                       PBC2,
-                                       coords2,
-                                       species2,
-                                       Npad,
-                                       pad_coords,
-                                       pad_species,
-                                       pad_image);
+        {
+          // release the GIL such that paddings can be created concurrently
+          // from multiple python threads
+          py::gil_scoped_release release;
+          error = error
+                  || nbl_create_paddings(Natoms,
+                                         influenceDistance,
+                                         cell2,
+                                         PBC2,
+                                         coords2,
+                                         species2,
+                                         Npad,
+                                         pad_coords,
+                                         pad_species,
+                                         pad_image);
+        }
 
         // pack as a 2D numpy array
         auto pad_coords_array
@@ -1,3 +1,4 @@
+import heapq
 import multiprocessing as mp
 import random
 
@@ -185,6 +186,155 @@ def _func2(f, iX, args, worker_end):
     worker_end.send(results)
 
 
+class WorkerPool:
+    """
+    A pool of long-lived worker processes, each holding a shard of the data.
+
+    Unlike :meth:`kliff.parallel.parmap2`, which creates new processes and sends them
+    the data each time it is called, the processes are created and the data are
+    distributed only once at initialization. Then each call of :meth:`map` only sends a
+    (typically small) message to the workers, e.g. the parameters of a model, and
+    collects the results of the workers.
+
+    Parameters
+    ----------
+    f: function
+        The function that operates on a shard of the data. It is called as
+        ``f(shard, *message, *args)``, where ``shard`` is a list of the data held by a
+        worker, and ``message`` is the positional arguments provided to :meth:`map`.
+
+    X: list
+        Data to be parallelized. It is split into ``nprocs`` contiguous shards, such that
+        concatenating the results of the shards preserves the order of the data.
+
+    args: args
+        Extra positional arguments needed by the function ``f``.
+
+    nprocs: int
+        Number of processors to use.
+
+    Example
+    -------
+    >>> def func(shard, x, y):
+    >>>     return [x * i + y for i in shard]
+    >>> with WorkerPool(func, range(4), 1, nprocs=2) as pool:
+    >>>     pool.map(2)  # [[1, 3], [5, 7]]
+    >>>     pool.map(3)  # [[1, 4], [7, 10]]
+    """
+
+    def __init__(self, f, X, *args, nprocs=mp.cpu_count()):
+        X = list(X)
+        nprocs = max(1, min(nprocs, len(X)))
+
+        self._processes = []
+        self._managers = []
+        for idx in np.array_split(np.arange(len(X)), nprocs):
+            shard = [X[i] for i in idx]
+            manager_end, worker_end = mp.Pipe(duplex=True)
+            p = mp.Process(target=_worker, args=(f, shard, args, worker_end))
+            p.daemon = True
+            p.start()
+            self._processes.append(p)
+            self._managers.append(manager_end)
+
+    @property
+    def nprocs(self) -> int:
+        """
+        Number of worker processes.
+        """
+        return len(self._processes)
+
+    def map(self, *message):
+        """
+        Send ``message`` to all workers, and collect their results.
+
+        Return
+        ------
+        list
+            A list of results, one for each shard, in the order of the shards.
+        """
+        if not self._processes:
+            raise RuntimeError("Worker pool is closed.")
+
+        for m in self._managers:
+            m.send(message)
+
+        results = [m.recv() for m in self._managers]
+        for success, r in results:
+            if not success:
+                raise r
+
+        return [r for _, r in results]
+
+    def close(self):
+        """
+        Stop the worker processes.
+        """
+        for m in self._managers:
+            m.send(None)
+        for p in self._processes:
+            p.join()
+        for m in self._managers:
+            m.close()
+        self._processes = []
+        self._managers = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def _worker(f, shard, args, conn):
+    while True:
+        message = conn.recv()
+        if message is None:
+            break
+        try:
+            conn.send((True, f(shard, *message, *args)))
+        except Exception as e:
+            conn.send((False, e))
+
+
+def partition_by_cost(costs, nparts):
+    """
+    Partition data into groups of about equal total cost.
+
+    This uses the longest processing time (LPT) scheme: the data are assigned to the
+    group of the least total cost one by one, in the descending order of their costs.
+
+    Parameters
+    ----------
+    costs: list
+        Cost (e.g. compute time) of each data.
+
+    nparts: int
+        Number of groups.
+
+    Return
+    ------
+    list
+        A list of ``nparts`` lists, each being the indices of the data in a group in
+        ascending order.
+
+    Example
+    -------
+    >>> partition_by_cost([1, 8, 2, 3, 4], 2)  # [[0, 1], [2, 3, 4]]
+    """
+    costs = np.asarray(costs, dtype=float)
+
+    # (total cost, group index), such that ties are broken by group index
+    heap = [(0.0, i) for i in range(nparts)]
+    groups = [[] for _ in range(nparts)]
+    for i in np.argsort(-costs, kind="stable"):
+        total, g = heapq.heappop(heap)
+        groups[g].append(int(i))
+        heapq.heappush(heap, (total + costs[i], g))
+
+    return [sorted(g) for g in groups]
+
+
 def get_MPI_world_size():
     try:
         from mpi4py import MPI
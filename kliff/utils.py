@@ -1,6 +1,7 @@
 import os
 import random
 import tarfile
+import tempfile
 from collections.abc import Sequence
 from pathlib import Path
 from typing import Union
@@ -129,6 +130,33 @@ def create_directory(path: Union[str, Path], is_directory=False):
         os.makedirs(dirname)
 
 
+def savez_atomic(filename: Union[str, Path], **arrays):
+    """
+    Save arrays to a binary ``.npz`` file atomically.
+
+    The arrays are first written to a uniquely named temporary file in the same
+    directory, which then replaces ``filename``, such that a partially written file is
+    never observed, even when several processes or threads save to the same file.
+
+    Args:
+        filename: Path to the file.
+        arrays: Arrays to save, passed to :func:`numpy.savez`.
+    """
+    filename = to_path(filename)
+    create_directory(filename)
+    fd, tmp = tempfile.mkstemp(
+        dir=filename.parent, prefix=f"{filename.name}.", suffix=".tmp"
+    )
+    try:
+        with os.fdopen(fd, "wb") as f:
+            np.savez(f, **arrays)
+        os.replace(tmp, filename)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+
 def yaml_dump(obj, filename):
     create_directory(filename)
     with open(to_path(filename), "w") as f:
@@ -4,7 +4,7 @@ import numpy as np
 import pytest
 from kliff.calculators import Calculator
 from kliff.dataset import Dataset
-from kliff.models import KIMModel
+from kliff.models import KIMModel, LennardJones
 
 ref_energies = [-277.409737571, -275.597759276, -276.528342759, -275.482988187]
 
@@ -82,3 +82,31 @@ class TestCalculator:
 
         assert params["sigma"][0] == sigma + 0.1
         assert params["A"][0] == A + 0.1
+
+    def test_create_nthreads(self):
+        test_file_path = Path(__file__).parents[1].joinpath("configs_extxyz")
+        tset = Dataset(test_file_path.joinpath("Si_4"))
+        configs = tset.get_configs()
+
+        calc = Calculator(LennardJones())
+        ref = calc.create(configs, use_stress=[False, True, False, True])
+        ref_energies = []
+        for ca in ref:
+            calc.compute(ca)
+            ref_energies.append(calc.get_energy(ca))
+
+        # compute arguments created by threads are in the order of the configurations
+        cas = calc.create(configs, use_stress=[False, True, False, True], nthreads=3)
+        assert len(cas) == len(ref)
+        for ca, ref_ca, ref_e in zip(cas, ref, ref_energies):
+            assert ca.conf is ref_ca.conf
+            assert ca.compute_stress == ref_ca.compute_stress
+
+            numneigh, neighlist = ca.neigh.get_numneigh_and_neighlist_1D()
+            ref_numneigh, ref_neighlist = ref_ca.neigh.get_numneigh_and_neighlist_1D()
+            assert np.array_equal(numneigh, ref_numneigh)
+            assert np.array_equal(neighlist, ref_neighlist)
+            assert np.array_equal(ca.neigh.coords, ref_ca.neigh.coords)
+
+            calc.compute(ca)
+            assert calc.get_energy(ca) == pytest.approx(ref_e)
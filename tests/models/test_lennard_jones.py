@@ -4,7 +4,11 @@ import warnings
 import numpy as np
 import pytest
 from kliff.dataset import Configuration
-from kliff.models.lennard_jones import LennardJones, LJComputeArguments
+from kliff.models.lennard_jones import (
+    LennardJones,
+    LJComputeArguments,
+    LJImageComputeArguments,
+)
 
 
 def write_tmp_params(fname):
@@ -23,22 +27,22 @@ def energy_forces_stress(
     model, config, use_energy=False, use_forces=False, use_stress=False
 ):
 
-    pred_energy = -56.08345486063805
+    pred_energy = -56.08346669855117
     pred_forces = [
-        [2.41107532e-02, 1.29215347e-03, 2.89182619e-04],
-        [-2.13103656e-02, -7.23000337e-03, -1.28954011e-02],
-        [3.89036609e-04, -2.07124189e-03, -3.83185414e-01],
-        [7.03144295e-04, 4.09004596e-04, -3.62012614e-01],
-        [-1.84061312e-03, 6.56687434e-03, 3.62871504e-01],
-        [-6.79944094e-03, 6.50195868e-03, 3.95977434e-01],
+        [2.41100250e-02, 1.29088535e-03, 2.89203985e-04],
+        [-2.13103445e-02, -7.23018831e-03, -1.28954010e-02],
+        [3.89467457e-04, -2.07198659e-03, -3.83186169e-01],
+        [7.03134231e-04, 4.08830982e-04, -3.62012628e-01],
+        [-1.84062274e-03, 6.56670624e-03, 3.62871519e-01],
+        [-6.79901017e-03, 6.50120560e-03, 3.95978177e-01],
     ]
     pred_stress = [
-        4.24791582e-03,
-        4.26804209e-03,
-        4.41900170e-03,
-        -3.25993799e-06,
-        -2.05334688e-06,
-        -2.82003088e-06,
+        4.24791648e-03,
+        4.26804316e-03,
+        4.41900269e-03,
+        -3.25994400e-06,
+        -2.05334507e-06,
+        -2.82003359e-06,
     ]
 
     ref_energy = -5.302666
@@ -138,3 +142,209 @@ def test_lj():
     energy_forces_stress(model, config, True, False, False)
     energy_forces_stress(model, config, True, True, False)
     energy_forces_stress(model, config, True, True, True)
+
+
+def test_lj_half_and_full_list():
+    model = LennardJones()
+    params = model.get_model_params()
+    config = Configuration.from_file(
+        "./configs_extxyz/MoS2/MoS2_energy_forces_stress.xyz"
+    )
+
+    pred = []
+    for half_list in [True, False]:
+        ca = LJComputeArguments(
+            config,
+            supported_species=None,
+            influence_distance=model.get_influence_distance(),
+            compute_energy=True,
+            compute_forces=True,
+            compute_stress=True,
+        )
+        ca.half_list = half_list
+        ca.compute(params)
+        pred.append(ca.get_prediction())
+
+    # padding atoms are exact lattice images, so both occurrences of a periodic pair in
+    # the full list have the same distance as the one in the half list
+    assert np.allclose(pred[0], pred[1], rtol=1e-12, atol=1e-14)
+
+
+@pytest.mark.parametrize(
+    "path,species",
+    [
+        ("./configs_extxyz/MoS2/MoS2_energy_forces_stress.xyz", ["Mo", "S"]),
+        ("./configs_extxyz/Si_4/Si_T300_step_0.xyz", None),
+    ],
+)
+def test_lj_image_neighbor_list(path, species):
+    config = Configuration.from_file(path)
+    model = LennardJones(species=species)
+    params = model.get_model_params()
+    if species is not None:
+        for k, rcut in enumerate([4.0, 4.5, 5.0]):
+            params["cutoff"][k] = rcut
+
+    image_model = LennardJones(species=species, image_neighbor_list=True)
+    assert image_model.get_compute_argument_class() is LJImageComputeArguments
+
+    pred = []
+    jac = []
+    for ca_class in [LJComputeArguments, LJImageComputeArguments]:
+        for half_list in [True, False]:
+            ca = ca_class(
+                config,
+                supported_species=model.get_supported_species(),
+                influence_distance=model.get_influence_distance(),
+                compute_energy=True,
+                compute_forces=True,
+                compute_stress=True,
+            )
+            ca.half_list = half_list
+            ca.compute(params)
+            pred.append(ca.get_prediction())
+            jac.append(ca.compute_prediction_jacobian(params))
+
+    for p, j in zip(pred[1:], jac[1:]):
+        assert np.allclose(p, pred[0])
+        for name in ["epsilon", "sigma"]:
+            assert np.allclose(j[name], jac[0][name])
+
+
+def test_lj_pairs_cache():
+    model = LennardJones()
+    params = model.get_model_params()
+    config = Configuration.from_file(
+        "./configs_extxyz/MoS2/MoS2_energy_forces_stress.xyz"
+    )
+
+    def get_ca(conf):
+        return LJComputeArguments(
+            conf,
+            supported_species=None,
+            influence_distance=model.get_influence_distance(),
+            compute_energy=True,
+            compute_forces=True,
+            compute_stress=True,
+        )
+
+    ca = get_ca(config)
+    ca.compute(params)
+    pairs = ca._get_pairs()
+    ca.compute(params)
+    for x, y in zip(pairs, ca._get_pairs()):
+        assert x is y
+
+    # rebuilding the neighbor list invalidates the pairs
+    coords = config.coords + np.random.RandomState(0).uniform(
+        -0.1, 0.1, config.coords.shape
+    )
+    assert ca.neigh.update(coords)
+    ca.compute(params)
+    assert ca._get_pairs()[0] is not pairs[0]
+
+    moved = Configuration(config.cell, config.species, coords, config.PBC)
+    ref_ca = get_ca(moved)
+    ref_ca.compute(params)
+    assert np.allclose(ca.get_prediction(), ref_ca.get_prediction())
+
+
+def test_lj_prediction_jacobian():
+    model = LennardJones()
+    model.set_opt_params(sigma=[[2.0]], epsilon=[[1.5]])
+    config = Configuration.from_file(
+        "./configs_extxyz/MoS2/MoS2_energy_forces_stress.xyz"
+    )
+    ca = LJComputeArguments(
+        config,
+        supported_species=None,
+        influence_distance=model.get_influence_distance(),
+        compute_energy=True,
+        compute_forces=True,
+        compute_stress=True,
+    )
+    params = model.get_model_params()
+    jac = ca.compute_prediction_jacobian(params)
+
+    # finite difference
+    delta = 1e-6
+    for name in ["epsilon", "sigma"]:
+        value = params[name][0]
+        params[name][0] = value + delta
+        ca.compute(params)
+        pred_plus = ca.get_prediction()
+        params[name][0] = value - delta
+        ca.compute(params)
+        pred_minus = ca.get_prediction()
+        params[name][0] = value
+
+        fd = (pred_plus - pred_minus) / (2 * delta)
+        assert jac[name].shape == (len(fd), 1)
+        assert np.allclose(jac[name][:, 0], fd, rtol=1e-5, atol=1e-8)
+
+
+def test_lj_multi_species():
+    config = Configuration.from_file(
+        "./configs_extxyz/MoS2/MoS2_energy_forces_stress.xyz"
+    )
+
+    def get_ca(model):
+        ca = LJComputeArguments(
+            config,
+            supported_species=model.get_supported_species(),
+            influence_distance=model.get_influence_distance(),
+            compute_energy=True,
+            compute_forces=True,
+            compute_stress=True,
+        )
+        return ca
+
+    # same parameters for all species pairs is the same as a single species
+    model = LennardJones(species=["Mo", "S"])
+    assert len(model.get_model_params()["epsilon"]) == 3
+    ref_model = LennardJones()
+    ca = get_ca(model)
+    ca.compute(model.get_model_params())
+    ref_ca = get_ca(ref_model)
+    ref_ca.compute(ref_model.get_model_params())
+    assert np.allclose(ca.get_prediction(), ref_ca.get_prediction())
+
+    # different parameters for each species pair
+    model.set_opt_params(epsilon=[[1.0], [1.5], [2.0]], sigma=[[2.0], [2.2], [2.4]])
+    params = model.get_model_params()
+    for k, rcut in enumerate([4.0, 4.5, 5.0]):
+        params["cutoff"][k] = rcut
+    ca = get_ca(model)
+    ca.compute(params)
+
+    code = {"Mo": 0, "S": 1}
+    pair = {(0, 0): 0, (0, 1): 1, (1, 0): 1, (1, 1): 2}
+    neigh = ca.neigh
+    energy = 0
+    for i in range(config.get_num_atoms()):
+        nei_indices, nei_coords, nei_species = neigh.get_neigh(i)
+        for xyz, s in zip(nei_coords, nei_species):
+            k = pair[(code[neigh.species[i]], code[s])]
+            r = np.linalg.norm(xyz - neigh.coords[i])
+            energy += 0.5 * ca.calc_phi(
+                params["epsilon"][k], params["sigma"][k], r, params["cutoff"][k]
+            )
+    assert ca.get_energy() == pytest.approx(energy, 1e-10)
+
+    # jacobian
+    jac = ca.compute_prediction_jacobian(params)
+    delta = 1e-6
+    for name in ["epsilon", "sigma"]:
+        assert jac[name].shape[1] == 3
+        for k in range(3):
+            value = params[name][k]
+            params[name][k] = value + delta
+            ca.compute(params)
+            pred_plus = ca.get_prediction()
+            params[name][k] = value - delta
+            ca.compute(params)
+            pred_minus = ca.get_prediction()
+            params[name][k] = value
+
+            fd = (pred_plus - pred_minus) / (2 * delta)
+            assert np.allclose(jac[name][:, k], fd, rtol=1e-5, atol=1e-8)
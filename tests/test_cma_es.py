@@ -0,0 +1,60 @@
+import warnings
+
+import numpy as np
+import pytest
+from kliff.cma_es import cma_es
+
+
+def rosenbrock(X):
+    return [np.sum(100 * (x[1:] - x[:-1] ** 2) ** 2 + (1 - x[:-1]) ** 2) for x in X]
+
+
+def test_cma_es():
+    x0 = np.zeros(3)
+    result = cma_es(rosenbrock, x0, sigma0=0.5, maxiter=1000, tol=1e-10, seed=35)
+    assert np.allclose(result.x, np.ones(3), atol=1e-4)
+    assert result.success
+    assert result.status == 0
+    assert result.nit < 1000
+
+    # bounds
+    bounds = (np.full(3, -1.0), np.full(3, 0.5))
+    result = cma_es(rosenbrock, x0, bounds=bounds, maxiter=200, seed=35)
+    assert np.all(result.x >= -1) and np.all(result.x <= 0.5)
+    assert result.x[0] == pytest.approx(0.5, abs=1e-3)
+
+
+def test_cma_es_fixed_params():
+    def quadratic(X):
+        return [(x[0] - 0.3) ** 2 + (x[1] - 0.5) ** 2 for x in X]
+
+    # the second parameter is fixed by its bounds
+    bounds = ([0.0, 1.0], [1.0, 1.0])
+    with warnings.catch_warnings():
+        warnings.simplefilter("error")
+        result = cma_es(quadratic, [0.5, 1.0], bounds=bounds, maxiter=200, seed=35)
+    assert result.x[0] == pytest.approx(0.3, abs=1e-4)
+    assert result.x[1] == 1.0
+
+    # all parameters fixed
+    result = cma_es(quadratic, [0.5, 1.0], bounds=([0.5, 1.0], [0.5, 1.0]))
+    assert result.success
+    assert np.array_equal(result.x, [0.5, 1.0])
+    assert result.fun == pytest.approx(0.29)
+    assert result.nfev == 1
+
+
+def test_cma_es_termination():
+    x0 = np.zeros(3)
+
+    # generations exhausted before converging
+    result = cma_es(rosenbrock, x0, sigma0=0.5, maxiter=5, seed=35)
+    assert not result.success
+    assert result.status == 1
+    assert result.nit == 5
+    assert result.nfev == 5 * (4 + int(3 * np.log(3)))
+
+    # no finite function value
+    result = cma_es(lambda X: np.full(len(X), np.nan), x0, maxiter=5, seed=35)
+    assert not result.success
+    assert result.status == 2
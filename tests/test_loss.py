@@ -0,0 +1,831 @@
+import threading
+import types
+import warnings
+
+import kliff.loss
+import kliff.parallel
+import numpy as np
+import pytest
+from kliff.calculators import Calculator
+from kliff.dataset import Dataset
+from kliff.loss import (
+    Loss,
+    LossError,
+    _Checkpoint,
+    _estimate_compute_cost,
+    _get_finite_difference_points,
+    _get_finite_difference_steps,
+    energy_forces_residual,
+)
+from kliff.models import LennardJones
+
+
+def init(
+    use_stress=False,
+    nprocs=1,
+    params_relation_callback=None,
+    bounded=False,
+    num_configs=None,
+):
+    model = LennardJones(params_relation_callback=params_relation_callback)
+    epsilon = [[0.5, 0.1, 1.0]] if bounded else [[0.5]]
+    model.set_opt_params(sigma=[[2.0, 1.0, 3.0]], epsilon=epsilon)
+
+    tset = Dataset("./configs_extxyz/Si_4")
+    configs = tset.get_configs()[:num_configs]
+
+    calc = Calculator(model)
+    calc.create(configs, use_energy=True, use_forces=True, use_stress=use_stress)
+
+    return Loss(calc, nprocs=nprocs)
+
+
+def test_prediction_jacobian():
+    loss = init(use_stress=True)
+    calc = loss.calculator
+    assert calc.has_prediction_jacobian()
+
+    ca = calc.get_compute_arguments()[0]
+    jac = calc.get_prediction_jacobian(ca)
+    natoms = ca.conf.get_num_atoms()
+    assert jac.shape == (1 + 3 * natoms + 6, calc.get_num_opt_params())
+
+    # parameters related by a callback cannot use analytic jacobian
+    loss = init(params_relation_callback=lambda params: None)
+    assert not loss.calculator.has_prediction_jacobian()
+    assert not loss._has_analytic_jacobian()
+
+
+@pytest.mark.parametrize("nprocs", [1, 2])
+def test_residual_jacobian(nprocs):
+    loss = init(nprocs=nprocs)
+    x = loss.calculator.get_opt_params()
+    jac = loss._get_residual_jacobian(x)
+
+    delta = 1e-6
+    fd = []
+    for i in range(len(x)):
+        xp = np.array(x)
+        xp[i] += delta
+        xm = np.array(x)
+        xm[i] -= delta
+        fd.append((loss._get_residual(xp) - loss._get_residual(xm)) / (2 * delta))
+    fd = np.stack(fd, axis=1)
+
+    assert jac.shape == fd.shape
+    assert np.allclose(jac, fd, rtol=1e-5, atol=1e-8)
+
+
+def test_least_squares_analytic_jacobian():
+    loss = init()
+    assert loss._has_analytic_jacobian()
+    x0 = loss.calculator.get_opt_params()
+
+    result = loss.minimize("trf", verbose=0)
+    x_analytic = result.x
+
+    # finite difference
+    loss.calculator.update_model_params(x0)
+    result = loss.minimize("trf", jac="2-point", verbose=0)
+
+    assert np.allclose(x_analytic, result.x, rtol=1e-4)
+
+
+def test_loss_gradient():
+    loss = init()
+    x = loss.calculator.get_opt_params()
+    loss_value, grad = loss._get_loss_and_gradient(x)
+    assert loss_value == pytest.approx(loss._get_loss(x))
+
+    delta = 1e-6
+    fd = []
+    for i in range(len(x)):
+        xp = np.array(x)
+        xp[i] += delta
+        xm = np.array(x)
+        xm[i] -= delta
+        fd.append((loss._get_loss(xp) - loss._get_loss(xm)) / (2 * delta))
+    assert np.allclose(grad, fd, rtol=1e-5)
+
+
+def test_minimize_analytic_gradient():
+    loss = init()
+    x0 = loss.calculator.get_opt_params()
+
+    result = loss.minimize("L-BFGS-B")
+    x_analytic = result.x
+
+    # finite difference
+    loss.calculator.update_model_params(x0)
+    result = loss.minimize("L-BFGS-B", jac="2-point")
+
+    assert np.allclose(x_analytic, result.x, rtol=1e-4)
+
+
+@pytest.mark.parametrize("jac", ["2-point", None])
+def test_minimize_worker_pool(jac):
+    kwargs = {"verbose": 0, "max_nfev": 5}
+    if jac is not None:
+        kwargs["jac"] = jac
+
+    ref = init(nprocs=1).minimize("trf", **kwargs)
+
+    loss = init(nprocs=2)
+    result = loss.minimize("trf", **kwargs)
+    assert loss._pool is None
+    assert np.allclose(result.x, ref.x)
+    assert np.allclose(result.fun, ref.fun)
+
+
+@pytest.mark.parametrize("scheme", ["2-point", "3-point"])
+@pytest.mark.parametrize("nprocs", [1, 2])
+def test_residual_jacobian_fd(scheme, nprocs):
+    loss = init(nprocs=nprocs)
+    x = loss.calculator.get_opt_params()
+    jac = loss._get_residual_jacobian(x)
+
+    if nprocs > 1:
+        loss._pool = loss._create_pool()
+    try:
+        fd = loss._get_residual_jacobian_fd(x, scheme=scheme)
+    finally:
+        if loss._pool is not None:
+            loss._pool.close()
+
+    assert fd.shape == jac.shape
+    assert np.allclose(fd, jac, rtol=1e-4, atol=1e-5)
+
+
+@pytest.mark.parametrize("scheme", ["2-point", "3-point"])
+def test_residual_jacobian_fd_single_config(scheme):
+    loss = init(nprocs=4, num_configs=1)
+    x = loss.calculator.get_opt_params()
+    jac = loss._get_residual_jacobian(x)
+
+    loss._pool = loss._create_pool()
+    try:
+        # the points are split between workers, even with a single configuration
+        assert loss._pool.nprocs == 4
+        lb, ub = loss._get_opt_params_bounds_arrays()
+        h, central = _get_finite_difference_steps(x, lb, ub, scheme)
+        points = _get_finite_difference_points(x, h, central, scheme)
+        results = loss._pool.map(points, "residual")
+        assert sum(len(r) > 0 for r in results) > 1
+        assert sorted(k for r in results for k, _ in r) == list(range(len(points)))
+
+        fd = loss._get_residual_jacobian_fd(x, scheme=scheme)
+    finally:
+        loss._pool.close()
+
+    assert fd.shape == jac.shape
+    assert np.allclose(fd, jac, rtol=1e-4, atol=1e-5)
+
+
+def test_residual_jacobian_fd_evaluations():
+    loss = init()
+    x = loss.calculator.get_opt_params()
+    num_evaluations = [0]
+    compute_residual = loss._compute_residual
+
+    def counted(x):
+        num_evaluations[0] += 1
+        return compute_residual(x)
+
+    loss._compute_residual = counted
+
+    # the residual at x of the last evaluation is reused
+    r = loss._get_residual(x)
+    fd = loss._get_residual_jacobian_fd(x, scheme="2-point")
+    assert num_evaluations[0] == 1 + len(x)
+
+    # the residual at x is computed once for the loss and the gradient
+    num_evaluations[0] = 0
+    value, grad = loss._get_loss_and_gradient(x, fd_scheme="2-point")
+    assert num_evaluations[0] == 1 + len(x)
+    assert value == pytest.approx(0.5 * np.dot(r, r))
+    assert np.allclose(grad, np.dot(fd.T, r))
+
+    # given f0
+    num_evaluations[0] = 0
+    loss._get_residual_jacobian_fd(2 * x, scheme="3-point", f0=r)
+    assert num_evaluations[0] == 2 * len(x)
+
+
+@pytest.mark.parametrize("scheme", ["2-point", "3-point"])
+def test_finite_difference_steps_bounds(scheme):
+    x = np.array([1.0, 2.0, 3.0])
+    lb = np.array([-np.inf, 1.0, 3.0])
+    ub = np.array([np.inf, 2.0, 4.0])
+    h, central = _get_finite_difference_steps(x, lb, ub, scheme)
+
+    assert np.all(x + h >= lb) and np.all(x + h <= ub)
+    assert h[0] > 0 and h[1] < 0 and h[2] > 0
+    if scheme == "3-point":
+        assert list(central) == [True, False, False]
+        assert np.all(x + 2 * h >= lb) and np.all(x + 2 * h <= ub)
+    else:
+        assert not np.any(central)
+
+    # user provided relative step
+    h, _ = _get_finite_difference_steps(x, lb, ub, scheme, rel_step=1e-3)
+    assert np.allclose(np.abs(h), 1e-3 * x)
+
+
+def test_minimize_parallel_fd():
+    def residual_fn(identifier, natoms, weight, prediction, reference, data):
+        return energy_forces_residual(
+            identifier, natoms, weight, prediction, reference, data
+        )
+
+    kwargs = {"verbose": 0, "max_nfev": 5}
+
+    loss = init(nprocs=1)
+    loss.residual_fn = residual_fn
+    assert not loss._has_analytic_jacobian()
+    ref = loss.minimize("trf", **kwargs)
+
+    loss = init(nprocs=2)
+    loss.residual_fn = residual_fn
+    result = loss.minimize("trf", **kwargs)
+    assert loss._pool is None
+    assert np.allclose(result.x, ref.x, rtol=1e-6)
+
+    # user provided step
+    kwargs["diff_step"] = 1e-4
+    ref = init(nprocs=1)
+    ref.residual_fn = residual_fn
+    ref = ref.minimize("trf", **kwargs)
+    loss = init(nprocs=2)
+    loss.residual_fn = residual_fn
+    result = loss.minimize("trf", **kwargs)
+    assert np.allclose(result.x, ref.x, rtol=1e-6)
+
+
+def test_residual_buffer():
+    loss = init()
+    x = loss.calculator.get_opt_params()
+    cas = loss.calculator.get_compute_arguments()
+
+    ref = np.concatenate(
+        [
+            loss._get_residual_single_config(
+                ca, loss.calculator, loss.residual_fn, loss.residual_data
+            )
+            for ca in cas
+        ]
+    )
+    assert loss._residual_offsets[-1] == len(ref)
+
+    # the buffer is reused, but the returned residual is not
+    r1 = loss._get_residual(x)
+    r2 = loss._get_residual(2 * x)
+    assert np.allclose(r1, ref)
+    assert not np.allclose(r1, r2)
+    assert loss._compute_residual(x) is loss._residual
+    assert loss._get_loss(x) == pytest.approx(0.5 * np.dot(ref, ref))
+
+
+def atom_forces_residual(identifier, natoms, weight, prediction, reference, data):
+    """
+    Residual of the energy and of the magnitude of the force on each atom, which is
+    smaller than the prediction.
+    """
+    energy = prediction[0] - reference[0]
+    pred_forces = np.reshape(prediction[1 : 1 + 3 * natoms], (natoms, 3))
+    ref_forces = np.reshape(reference[1 : 1 + 3 * natoms], (natoms, 3))
+    forces = np.linalg.norm(pred_forces, axis=1) - np.linalg.norm(ref_forces, axis=1)
+
+    return np.concatenate(([energy / natoms], forces))
+
+
+@pytest.mark.parametrize("nprocs", [1, 2])
+def test_residual_of_different_size(nprocs):
+    loss = init(nprocs=nprocs)
+    loss.residual_fn = atom_forces_residual
+    x = loss.calculator.get_opt_params()
+    cas = loss.calculator.get_compute_arguments()
+
+    ref = np.concatenate(
+        [
+            loss._get_residual_single_config(
+                ca, loss.calculator, loss.residual_fn, loss.residual_data
+            )
+            for ca in cas
+        ]
+    )
+    assert len(ref) < loss._residual_offsets[-1]
+
+    # the offsets are learned at the first evaluation
+    assert np.allclose(loss._get_residual(x), ref)
+    assert loss._residual_offsets[-1] == len(ref)
+    assert loss._get_loss(x) == pytest.approx(0.5 * np.dot(ref, ref))
+
+    # in worker pool
+    loss._pool = loss._create_pool()
+    try:
+        assert np.allclose(loss._get_residual(x), ref)
+        assert np.allclose(loss.evaluate_many([x])[0], 0.5 * np.dot(ref, ref))
+    finally:
+        loss._pool.close()
+        loss._pool = None
+
+    result = loss.minimize("trf", verbose=0, max_nfev=5)
+    assert result.fun.shape == ref.shape
+
+
+def test_result_cache():
+    loss = init()
+    assert loss.cache_info() is None
+    x0 = loss.calculator.get_opt_params()
+    kwargs = {"jac": "2-point", "options": {"maxiter": 5}}
+    ref = loss.minimize("L-BFGS-B", **kwargs)
+
+    loss = Loss(loss.calculator, cache_size=8)
+    r1 = loss._get_residual(x0)
+    r2 = loss._get_residual(np.array(x0))
+    assert np.array_equal(r1, r2)
+    assert loss._get_loss(x0) == pytest.approx(0.5 * np.dot(r1, r1))
+    info = loss.cache_info()
+    assert info["hits"] == 2 and info["misses"] == 1 and info["size"] == 1
+
+    # cached results give the same minimization
+    loss.clear_cache()
+    loss.calculator.update_model_params(x0)
+    result = loss.minimize("L-BFGS-B", **kwargs)
+    assert np.allclose(result.x, ref.x)
+    assert loss.cache_info()["size"] == 8
+
+    # tolerance
+    loss = Loss(loss.calculator, cache_size=1, cache_tol=1e-6)
+    loss._get_loss(x0)
+    loss._get_loss(x0 + 1e-7)
+    loss._get_loss(x0 + 1e-5)
+    info = loss.cache_info()
+    assert info["hits"] == 1 and info["misses"] == 2
+
+    # cache options are not supported for neural network models
+    with pytest.raises(LossError):
+        Loss(object(), cache_size=8)
+
+
+def test_estimate_compute_cost():
+    loss = init()
+    for ca in loss.calculator.get_compute_arguments():
+        numneigh, _ = ca.neigh.get_numneigh_and_neighlist_1D()
+        natoms = ca.conf.get_num_atoms()
+        assert _estimate_compute_cost(ca) == natoms + np.sum(numneigh)
+
+
+@pytest.mark.parametrize("jac", ["analytic", "2-point", "3-point"])
+def test_batch_gradient(jac):
+    loss = init()
+    x = loss.calculator.get_opt_params()
+    N = len(loss.calculator.get_compute_arguments())
+
+    ref_loss, ref_grad = loss._get_loss_and_gradient(x)
+    batch_loss, batch_grad = loss._get_loss_and_gradient_batch(x, np.arange(N), jac)
+    assert batch_loss == pytest.approx(ref_loss / N)
+    assert np.allclose(batch_grad, ref_grad / N, rtol=1e-4)
+
+
+@pytest.mark.parametrize("method", ["SGD", "Adam"])
+def test_minibatch_minimize(method):
+    loss = init()
+    x0 = loss.calculator.get_opt_params()
+    loss0 = loss._get_loss(x0)
+
+    kwargs = {"batch_size": 2, "num_epochs": 5, "lr": 1e-3, "seed": 35}
+    if method == "SGD":
+        kwargs["momentum"] = 0.5
+    result = loss.minimize(method, **kwargs)
+
+    assert result.nit == 10
+    assert len(result.history) == 5
+    assert np.array_equal(loss.calculator.get_opt_params(), result.x)
+    assert loss._get_loss(result.x) < loss0
+
+    # bounds are respected
+    lb, ub = loss._get_opt_params_bounds_arrays()
+    assert np.all(result.x >= lb) and np.all(result.x <= ub)
+
+    # reproducible with seed
+    loss.calculator.update_model_params(x0)
+    result2 = loss.minimize(method, **kwargs)
+    assert np.allclose(result.x, result2.x)
+
+
+@pytest.mark.parametrize("nprocs", [1, 2])
+def test_evaluate_many(nprocs):
+    loss = init(nprocs=nprocs)
+    x = loss.calculator.get_opt_params()
+    X = [x, 1.01 * x, 0.99 * x]
+
+    losses = loss.evaluate_many(X)
+    ref = [init()._get_loss(xi) for xi in X]
+    assert np.allclose(losses, ref)
+
+
+@pytest.mark.parametrize("nprocs", [1, 2])
+@pytest.mark.parametrize("method", ["differential_evolution", "CMA-ES"])
+def test_population_minimize(method, nprocs):
+    if method == "differential_evolution":
+        # all parameters need to be bounded
+        with pytest.raises(LossError):
+            init().minimize(method)
+        kwargs = {"maxiter": 5, "popsize": 4, "polish": False, "seed": 35}
+    else:
+        kwargs = {"maxiter": 5, "popsize": 6, "seed": 35}
+
+    loss = init(nprocs=nprocs, bounded=True)
+    x0 = loss.calculator.get_opt_params()
+    result = loss.minimize(method, **kwargs)
+    assert loss._pool is None
+    assert result.fun < loss._get_loss(x0)
+    assert result.fun == pytest.approx(loss._get_loss(result.x))
+
+    ref = init(bounded=True).minimize(method, **kwargs)
+    assert np.allclose(result.x, ref.x)
+
+
+@pytest.mark.parametrize("method", ["differential_evolution", "CMA-ES"])
+def test_population_checkpoint(tmp_path, method):
+    if method == "differential_evolution":
+        kwargs = {"maxiter": 5, "popsize": 4, "polish": False, "seed": 35}
+    else:
+        kwargs = {"maxiter": 5, "popsize": 6, "seed": 35}
+
+    # the losses computed by the worker processes are recorded as the serial ones
+    states = []
+    for nprocs in [1, 2]:
+        path = tmp_path / f"checkpoint_{nprocs}.npz"
+        loss = init(nprocs=nprocs, bounded=True)
+        result = loss.minimize(method, checkpoint=path, checkpoint_interval=1, **kwargs)
+        state = _Checkpoint.load(path)
+        assert state["nevals"] >= result.nfev
+        assert state["best_loss"] == pytest.approx(result.fun)
+        states.append(state)
+
+    assert states[0]["nevals"] == states[1]["nevals"]
+    assert np.allclose(states[0]["best_x"], states[1]["best_x"])
+
+
+@pytest.mark.parametrize("nprocs", [1, 2])
+def test_multistart(nprocs):
+    loss = init(bounded=True)
+    x = loss.calculator.get_opt_params()
+    lb, ub = loss._get_opt_params_bounds_arrays()
+
+    results = loss.multistart(
+        "L-BFGS-B", nstarts=4, nprocs=nprocs, seed=35, options={"maxiter": 5}
+    )
+    assert sorted(r["start"] for r in results) == [0, 1, 2, 3]
+    assert [r for r in results if r["start"] == 0][0]["x0"] == pytest.approx(x)
+
+    # model parameters set to the best results
+    assert np.allclose(loss.calculator.get_opt_params(), results[0]["x"])
+
+    losses = [r["loss"] for r in results]
+    assert losses == sorted(losses)
+    for r in results:
+        assert np.all(r["x0"] >= lb) and np.all(r["x0"] <= ub)
+        assert r["loss"] == pytest.approx(loss._get_loss(r["x"]))
+
+    ref = init(bounded=True).multistart(
+        "L-BFGS-B", nstarts=4, nprocs=1, seed=35, options={"maxiter": 5}
+    )
+    assert np.allclose([r["loss"] for r in ref], losses)
+
+
+def test_multistart_failure():
+    loss = init()
+    # unsupported method fails every minimization, without stopping the others
+    results = loss.multistart("not_a_method", nstarts=2, seed=35)
+    assert all(not r["success"] and np.isnan(r["loss"]) for r in results)
+
+
+def test_checkpoint_and_resume(tmp_path):
+    path = tmp_path / "checkpoint.npz"
+    kwargs = {"verbose": 0, "max_nfev": 3}
+
+    loss = init()
+    loss.minimize("trf", checkpoint=path, checkpoint_interval=2, **kwargs)
+    assert loss._checkpoint is None
+    assert not list(tmp_path.glob("*.tmp"))
+
+    with np.load(path) as data:
+        nevals = int(data["nevals"])
+        best_x = data["best_x"]
+        best_loss = float(data["best_loss"])
+    assert nevals > 0
+    assert best_loss == pytest.approx(loss._get_loss(best_x))
+
+    # resume, continuing to save to the same file
+    loss = init()
+    result = loss.minimize("trf", resume_from=path, **kwargs)
+    with np.load(path) as data:
+        assert int(data["nevals"]) > nevals
+        assert float(data["best_loss"]) <= best_loss
+
+    # same as starting from the best parameters
+    ref = init()
+    ref.calculator.update_model_params(best_x)
+    ref_result = ref.minimize("trf", **kwargs)
+    assert np.allclose(result.x, ref_result.x)
+
+    # mismatched number of parameters
+    x = np.ones(3)
+    np.savez(path, x=x, best_x=x, best_loss=1.0, nevals=1)
+    with pytest.raises(LossError):
+        init().minimize("trf", resume_from=path, **kwargs)
+
+
+def test_checkpoint_non_finite_loss(tmp_path):
+    path = tmp_path / "checkpoint.npz"
+    checkpoint = _Checkpoint(path, interval=1)
+    checkpoint.record([1.0, 2.0], np.nan)
+    checkpoint.record([3.0, 4.0], np.inf)
+
+    # no finite loss: the last parameters are the best
+    state = _Checkpoint.load(path)
+    assert np.array_equal(state["best_x"], [3.0, 4.0])
+    assert state["best_loss"] == np.inf
+    assert state["nevals"] == 2
+
+    checkpoint.record([5.0, 6.0], 1.0)
+    checkpoint.record([7.0, 8.0], np.nan)
+    state = _Checkpoint.load(path)
+    assert np.array_equal(state["best_x"], [5.0, 6.0])
+    assert state["best_loss"] == 1.0
+
+
+@pytest.mark.parametrize("nprocs", [1, 2])
+def test_multistart_checkpoint(tmp_path, nprocs):
+    path = tmp_path / "checkpoint.npz"
+    kwargs = {"verbose": 0, "max_nfev": 3}
+
+    loss = init()
+    results = loss.multistart(
+        "trf", nstarts=2, nprocs=nprocs, seed=35, checkpoint=path, **kwargs
+    )
+
+    # a checkpoint for each minimization
+    assert not path.exists()
+    for r in results:
+        state = _Checkpoint.load(tmp_path / f"checkpoint_{r['start']}.npz")
+        assert state["best_loss"] == pytest.approx(init()._get_loss(state["best_x"]))
+
+    with pytest.raises(LossError):
+        loss.multistart("trf", nstarts=2, resume_from=path, **kwargs)
+
+
+class FakeComm:
+    """
+    In-process stand-in of an MPI communicator, where each rank runs in a thread, to
+    test the MPI code paths without mpi4py.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self._barrier = threading.Barrier(size)
+        self._local = threading.local()
+        self._values = [None] * size
+
+    def Get_rank(self):
+        return self._local.rank
+
+    def Get_size(self):
+        return self.size
+
+    def _exchange(self, value):
+        self._values[self.Get_rank()] = value
+        self._barrier.wait()
+        values = list(self._values)
+        self._barrier.wait()
+        return values
+
+    def Bcast(self, buf, root=0):
+        buf[:] = self._exchange(np.array(buf))[root]
+
+    def bcast(self, obj, root=0):
+        return self._exchange(obj)[root]
+
+    def allgather(self, obj):
+        return self._exchange(obj)
+
+    def Gatherv(self, sendbuf, recvbuf, root=0):
+        values = self._exchange(np.array(sendbuf))
+        if self.Get_rank() == root:
+            buf, counts, displs, _ = recvbuf
+            for v, c, d in zip(values, counts, displs):
+                assert len(v) == c
+                buf[d : d + c] = v
+
+    def Allreduce(self, sendbuf, recvbuf, op=None):
+        recvbuf[:] = np.sum(self._exchange(np.array(recvbuf)), axis=0)
+
+    def run(self, fn):
+        """
+        Run `fn(rank)` on all ranks, and return the results of the ranks.
+        """
+        results = [None] * self.size
+        errors = []
+
+        def target(rank):
+            self._local.rank = rank
+            try:
+                results[rank] = fn(rank)
+            except BaseException as e:
+                errors.append(e)
+                self._barrier.abort()
+
+        threads = [threading.Thread(target=target, args=(r,)) for r in range(self.size)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        if errors:
+            raise errors[0]
+
+        return results
+
+
+@pytest.fixture
+def fake_mpi(monkeypatch):
+    def make(size):
+        comm = FakeComm(size)
+        mpi = types.SimpleNamespace(
+            COMM_WORLD=comm, DOUBLE=None, IN_PLACE=None, SUM=None
+        )
+        monkeypatch.setattr(kliff.loss, "MPI", mpi, raising=False)
+        monkeypatch.setattr(kliff.parallel, "get_MPI_world_size", lambda: size)
+        return comm
+
+    return make
+
+
+def run_residual_MPI(comm, losses, X):
+    """
+    Compute the residual at each of `X` in MPI mode, and return those of rank 0.
+    """
+
+    def run(rank):
+        loss = losses[rank]
+        if rank == 0:
+            residuals = [loss._get_residual_MPI(x) for x in X]
+            loss._stop_MPI_workers()
+            return residuals
+        else:
+            loss._compute_residual_MPI(X[0])
+
+    return comm.run(run)[0]
+
+
+@pytest.mark.parametrize("size", [2, 3])
+@pytest.mark.parametrize("residual_fn", [energy_forces_residual, atom_forces_residual])
+def test_residual_MPI(fake_mpi, size, residual_fn):
+    ref = init()
+    ref.residual_fn = residual_fn
+    x = ref.calculator.get_opt_params()
+    X = [x, 1.01 * x, 0.99 * x]
+    ref_residuals = [ref._get_residual(xi) for xi in X]
+
+    comm = fake_mpi(size)
+    losses = [init() for _ in range(size)]
+    for loss in losses:
+        loss.residual_fn = residual_fn
+    residuals = run_residual_MPI(comm, losses, X)
+
+    for r, ref_r in zip(residuals, ref_residuals):
+        assert np.allclose(r, ref_r)
+
+    # each configuration is computed by one rank, and its residual is placed at its
+    # offset in the residual of all configurations
+    loss = losses[0]
+    partition = loss._mpi_partition
+    assert sorted(i for p in partition for i in p) == list(range(4))
+    sizes = np.diff(loss._residual_offsets)
+    counts = [int(np.sum(sizes[np.asarray(p, dtype=int)])) for p in partition]
+    assert loss._mpi_counts == counts
+    assert list(loss._mpi_displs) == list(np.cumsum([0] + counts[:-1]))
+    assert np.array_equal(
+        np.sort(loss._mpi_recv_index), np.arange(len(ref_residuals[0]))
+    )
+
+
+@pytest.mark.parametrize("size", [2, 3])
+def test_residual_jacobian_MPI(fake_mpi, size):
+    ref = init()
+    x = ref.calculator.get_opt_params()
+    ref_jac = ref._get_residual_jacobian(x)
+    ref_loss, ref_grad = ref._get_loss_and_gradient(x)
+
+    comm = fake_mpi(size)
+    losses = [init() for _ in range(size)]
+
+    def run(rank):
+        loss = losses[rank]
+        if rank == 0:
+            jac = loss._get_residual_jacobian_MPI(x)
+            loss_and_grad = loss._get_loss_and_gradient_MPI(x)
+            loss._stop_MPI_workers()
+            return jac, loss_and_grad
+        else:
+            loss._compute_residual_MPI(x)
+
+    jac, (value, grad) = comm.run(run)[0]
+    assert np.allclose(jac, ref_jac)
+    assert value == pytest.approx(ref_loss)
+    assert np.allclose(grad, ref_grad)
+
+
+def test_rebalance_MPI(fake_mpi):
+    size = 2
+    comm = fake_mpi(size)
+    losses = [init() for _ in range(size)]
+    x = losses[0].calculator.get_opt_params()
+
+    def run(rank):
+        loss = losses[rank]
+        loss.rebalance_after = 2
+        # all configurations on rank 0 before rebalancing
+        loss._set_mpi_partition([[0, 1, 2, 3], []])
+        if rank == 0:
+            residuals = []
+            partitions = []
+            for _ in range(3):
+                residuals.append(loss._get_residual_MPI(x))
+                partitions.append(loss._mpi_partition)
+            loss._stop_MPI_workers()
+            return residuals, partitions
+        else:
+            loss._compute_residual_MPI(x)
+
+    residuals, partitions = comm.run(run)[0]
+
+    # rebalanced at the end of the second evaluation
+    assert partitions[0] == [[0, 1, 2, 3], []]
+    assert partitions[1] == partitions[2]
+    assert all(len(p) > 0 for p in partitions[2])
+    assert losses[1]._mpi_partition == partitions[2]
+
+    assert np.array_equal(residuals[0], residuals[1])
+    assert np.array_equal(residuals[0], residuals[2])
+
+
+def test_minimize_MPI(fake_mpi):
+    size = 2
+    kwargs = {"options": {"maxiter": 3}}
+
+    def add_opt_param(loss):
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            loss.calculator.model.set_opt_params(cutoff=[[5.0]])
+
+    ref_loss = init()
+    ref = [ref_loss.minimize("L-BFGS-B", **kwargs)]
+    add_opt_param(ref_loss)
+    ref.append(ref_loss.minimize("L-BFGS-B", **kwargs))
+
+    comm = fake_mpi(size)
+    losses = [init() for _ in range(size)]
+    results = [comm.run(lambda rank: losses[rank].minimize("L-BFGS-B", **kwargs))]
+    # the buffers are reset when the number of optimizing parameters changes between
+    # minimizations
+    for loss in losses:
+        add_opt_param(loss)
+    results.append(comm.run(lambda rank: losses[rank].minimize("L-BFGS-B", **kwargs)))
+    assert len(losses[1]._mpi_message) == 1 + 3
+
+    for rank_results, ref_r in zip(results, ref):
+        for r in rank_results:
+            assert np.allclose(r.x, ref_r.x)
+            assert r.fun == pytest.approx(ref_r.fun)
+
+
+@pytest.mark.parametrize("num_candidates", [3, 6])
+def test_evaluate_many_MPI(fake_mpi, num_candidates):
+    size = 2
+    ref = init()
+    x = ref.calculator.get_opt_params()
+    X = [(1 + 0.01 * i) * x for i in range(num_candidates)]
+    ref_losses = [ref._get_loss(xi) for xi in X]
+
+    comm = fake_mpi(size)
+    losses = [init() for _ in range(size)]
+
+    def run(rank):
+        loss = losses[rank]
+        if rank == 0:
+            result = loss.evaluate_many(X)
+            loss._stop_MPI_workers()
+            return result
+        else:
+            loss._compute_residual_MPI(x)
+
+    result = comm.run(run)[0]
+    assert np.allclose(result, ref_losses)
+
+    if num_candidates > 4:
+        # more candidates than configurations: rank 1 computes the loss of all the
+        # configurations at every other candidate, the last of which is X[5]
+        assert np.allclose(losses[1].calculator.get_opt_params(), X[5])
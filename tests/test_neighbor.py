@@ -1,6 +1,22 @@
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
 import numpy as np
+import pytest
 from kliff.dataset.dataset import Configuration
-from kliff.neighbor import NeighborList
+from kliff.neighbor import (
+    ImageNeighborList,
+    NeighborList,
+    NeighborListCache,
+    assemble_forces,
+    assemble_forces_from_pairs,
+    assemble_stress,
+    assemble_stress_from_pairs,
+    get_neighbor_list,
+    get_neighbor_list_cache,
+)
+from kliff.neighbor import nl
+from kliff.neighbor.neighbor import NeighborListError, hash_configuration
 
 target_coords = np.asarray(
     [
@@ -59,5 +75,470 @@ def test_neigh():
         assert nei_species.size == 0
 
     numneigh, neighlist = neigh.get_numneigh_and_neighlist_1D(request_padding=False)
-    np.array_equal(numneigh, all_numneigh)
-    np.array_equal(neighlist, np.concatenate(all_indices))
+    assert np.array_equal(numneigh, all_numneigh)
+    assert np.array_equal(neighlist, np.concatenate(all_indices))
+
+
+def test_create_paddings_non_symmetric_cell():
+    # a cell whose transpose is not symmetric, to check the inverse of the cell used to
+    # get the fractional coordinates
+    cell = np.asarray([[3.0, 0.4, 0.2], [0.7, 3.2, 0.3], [1.1, 0.5, 3.4]])
+    PBC = np.asarray([1, 1, 1], dtype=np.intc)
+    coords = np.asarray([[0.1, 0.2, 0.3], [1.6, 1.4, 1.9]])
+    species_code = np.asarray([1, 2], dtype=np.intc)
+
+    out = nl.create_paddings(2.0, cell, PBC, coords, species_code)
+    coords_pd, species_code_pd, image_pd, error = out
+    assert error == 0
+    assert len(coords_pd) > 0
+
+    # padding atoms are exact lattice images of the contributing atoms
+    shift = np.linalg.solve(cell.T, (coords_pd - coords[image_pd]).T).T
+    assert np.allclose(shift, np.round(shift), rtol=0, atol=1e-12)
+    assert np.array_equal(species_code_pd, species_code[image_pd])
+
+
+def test_numneigh_and_neighlist_1D():
+    conf = Configuration.from_file(
+        "configs_extxyz/bilayer_graphene/bilayer_sep3.36_i0_j0.xyz"
+    )
+
+    neigh = NeighborList(conf, infl_dist=4, padding_need_neigh=True)
+    numneigh, neighlist = neigh.get_numneigh_and_neighlist_1D(request_padding=True)
+
+    assert numneigh.dtype == np.intc
+    assert neighlist.dtype == np.intc
+    assert len(numneigh) == len(neigh.coords)
+    assert len(neighlist) == np.sum(numneigh)
+
+    start = 0
+    for i, n in enumerate(numneigh):
+        nei_indices, _, _ = neigh.get_neigh(i)
+        assert np.array_equal(neighlist[start : start + n], nei_indices)
+        start += n
+
+    # invalid neighbor list index
+    for index in [-1, 1]:
+        _, _, error = nl.get_numneigh_and_neighlist_1D(
+            neigh.neigh, neigh.cutoffs, index, len(neigh.coords)
+        )
+        assert error == 1
+
+
+def _neigh_within(neigh, i, infl_dist):
+    nei_indices, nei_coords, _ = neigh.get_neigh(i)
+    r = np.linalg.norm(nei_coords - neigh.coords[i], axis=1)
+    return sorted(neigh.image[nei_indices[r < infl_dist]])
+
+
+def test_update_with_skin():
+    conf = Configuration.from_file(
+        "configs_extxyz/bilayer_graphene/bilayer_sep3.36_i0_j0.xyz"
+    )
+    infl_dist = 3.5
+    neigh = NeighborList(conf, infl_dist=infl_dist, skin=0.4)
+
+    np.random.seed(35)
+    N = conf.get_num_atoms()
+
+    # small perturbation: neighbor list is reused
+    coords = conf.coords + np.random.uniform(-0.1, 0.1, (N, 3))
+    rebuilt = neigh.update(coords)
+    assert not rebuilt
+    assert np.allclose(neigh.coords[:N], coords)
+    shift = neigh.coords[N:] - coords[neigh.padding_image]
+    assert np.allclose(shift, neigh._padding_shift)
+
+    ref = NeighborList(conf, infl_dist=infl_dist)
+    ref.create_neigh(coords)
+    for i in range(N):
+        assert _neigh_within(neigh, i, infl_dist) == _neigh_within(ref, i, infl_dist)
+
+    # large perturbation: neighbor list is rebuilt
+    coords = conf.coords + np.random.uniform(-0.3, 0.3, (N, 3))
+    rebuilt = neigh.update(coords)
+    assert rebuilt
+    assert np.allclose(neigh.coords[:N], coords)
+
+
+def test_assemble_forces_and_stress():
+    np.random.seed(35)
+    n = 5
+    padding_image = np.asarray([0, 3, 3, 1, 0, 4, 3], dtype=np.intc)
+    forces = np.random.rand(n + len(padding_image), 3)
+    coords = np.random.rand(n + len(padding_image), 3)
+    volume = 2.0
+
+    ref_forces = np.array(forces[:n])
+    for f, idx in zip(forces[n:], padding_image):
+        ref_forces[idx] += f
+    assert np.allclose(assemble_forces(forces, n, padding_image), ref_forces)
+
+    out = np.empty((n, 3))
+    total_forces = assemble_forces(forces, n, padding_image, out=out)
+    assert total_forces is out
+    assert np.allclose(out, ref_forces)
+
+    # no padding
+    assert np.allclose(assemble_forces(forces[:n], n, np.array([])), forces[:n])
+
+    ref_stress = [
+        -np.sum(coords[:, 0] * forces[:, 0]) / volume,
+        -np.sum(coords[:, 1] * forces[:, 1]) / volume,
+        -np.sum(coords[:, 2] * forces[:, 2]) / volume,
+        -np.sum(coords[:, 1] * forces[:, 2]) / volume,
+        -np.sum(coords[:, 2] * forces[:, 0]) / volume,
+        -np.sum(coords[:, 0] * forces[:, 1]) / volume,
+    ]
+    assert np.allclose(assemble_stress(coords, forces, volume), ref_stress)
+
+
+def test_cache():
+    conf = Configuration.from_file(
+        "configs_extxyz/bilayer_graphene/bilayer_sep3.36_i0_j0.xyz"
+    )
+    N = conf.get_num_atoms()
+
+    cache = NeighborListCache()
+    neigh = cache.get(conf, 4.0)
+    assert cache.get(conf, 4.0) is neigh
+    assert len(cache) == 1
+
+    # the cached neighbor list does not keep the configuration alive
+    assert neigh.conf is None
+    ref = NeighborList(conf, 4.0)
+    assert neigh.conf_hash == ref.conf_hash
+    coords = conf.coords + 0.01
+    neigh.create_neigh(coords)
+    ref.create_neigh(coords)
+    for i in range(N):
+        assert np.array_equal(neigh.get_neigh(i)[0], ref.get_neigh(i)[0])
+    neigh.create_neigh(conf.coords)
+
+    # served by filtering the one with a larger influence distance
+    small = cache.get(conf, 3.0)
+    assert small is not neigh
+    assert len(cache) == 2
+    ref = NeighborList(conf, 3.0)
+    for i in range(N):
+        assert _neigh_within(small, i, 3.0) == _neigh_within(ref, i, 3.0)
+        assert len(small.get_neigh(i)[0]) == len(ref.get_neigh(i)[0])
+
+    # a different configuration content is a different entry
+    conf2 = Configuration(
+        conf.cell, conf.species, conf.coords + 0.1, conf.PBC, identifier="conf2"
+    )
+    assert cache.get(conf2, 4.0) is not neigh
+    assert len(cache) == 3
+
+    # eviction of least recently used
+    cache.get(conf, 4.0)
+    cache.max_memory = cache.memory - 1
+    assert len(cache) == 2
+    assert cache.get(conf, 4.0) is neigh
+
+    cache.clear()
+    assert len(cache) == 0
+    assert cache.memory == 0
+
+    # a cache without memory budget does not keep any neighbor list
+    cache = NeighborListCache(max_memory=0)
+    assert cache.get(conf, 4.0) is not cache.get(conf, 4.0)
+    assert len(cache) == 0
+
+
+def test_process_wide_cache_opt_in():
+    conf = Configuration.from_file(
+        "configs_extxyz/bilayer_graphene/bilayer_sep3.36_i0_j0.xyz"
+    )
+
+    cache = get_neighbor_list_cache()
+    assert cache.max_memory == 0
+    neigh = get_neighbor_list(conf, 4.0)
+    assert neigh.conf is conf
+    assert get_neighbor_list(conf, 4.0) is not neigh
+    assert len(cache) == 0
+
+    image_neigh = get_neighbor_list(conf, 4.0, images=True)
+    assert isinstance(image_neigh, ImageNeighborList)
+    assert len(cache) == 0
+
+    try:
+        cache.max_memory = 2 ** 28
+        neigh = get_neighbor_list(conf, 4.0)
+        assert get_neighbor_list(conf, 4.0) is neigh
+    finally:
+        cache.clear()
+        cache.max_memory = 0
+
+
+def test_multiple_cutoffs_and_species_cutoffs():
+    conf = Configuration.from_file(
+        "configs_extxyz/bilayer_graphene/bilayer_sep3.36_i0_j0.xyz"
+    )
+    conf.species[0] = "O"
+    N = conf.get_num_atoms()
+
+    cutoffs = [2.0, 3.5, 4.0]
+    neigh = NeighborList(conf, infl_dist=4.0, cutoffs=cutoffs)
+    for k, rcut in enumerate(cutoffs):
+        ref = NeighborList(conf, infl_dist=rcut)
+        numneigh, _ = neigh.get_numneigh_and_neighlist_1D(neigh_list_index=k)
+        ref_numneigh, _ = ref.get_numneigh_and_neighlist_1D()
+        assert np.array_equal(numneigh, ref_numneigh)
+        for i in range(N):
+            nei_indices, _, _ = neigh.get_neigh(i, k)
+            ref_indices, _, _ = ref.get_neigh(i)
+            assert sorted(neigh.image[nei_indices]) == sorted(ref.image[ref_indices])
+
+    species_cutoffs = {"C-C": 4.0, "C-O": 3.5, "O-O": 2.0}
+    numneigh, neighlist = neigh.get_numneigh_and_neighlist_1D(
+        neigh_list_index=2, species_cutoffs=species_cutoffs
+    )
+    start = 0
+    for i in range(N):
+        nei = neighlist[start : start + numneigh[i]]
+        start += numneigh[i]
+        all_nei, nei_coords, nei_species = neigh.get_neigh(i, 2)
+        r = np.linalg.norm(nei_coords - neigh.coords[i], axis=1)
+        rcut = [
+            species_cutoffs.get(f"{neigh.species[i]}-{s}")
+            or species_cutoffs[f"{s}-{neigh.species[i]}"]
+            for s in nei_species
+        ]
+        assert np.array_equal(nei, all_nei[r < rcut])
+
+
+def test_half_list():
+    conf = Configuration.from_file("configs_extxyz/MoS2/MoS2_energy_forces_stress.xyz")
+    N = conf.get_num_atoms()
+    neigh = NeighborList(conf, infl_dist=5.0)
+
+    def pair_sum(numneigh, neighlist):
+        atoms = np.repeat(np.arange(N), numneigh)
+        rij = neigh.coords[neighlist] - neigh.coords[atoms]
+        r = np.linalg.norm(rij, axis=1)
+        energy = np.sum(1 / r)
+        forces = np.zeros_like(neigh.coords)
+        np.add.at(forces, atoms, rij / r[:, None] ** 3)
+        np.add.at(forces, neighlist, -rij / r[:, None] ** 3)
+        return energy, assemble_forces(forces, N, neigh.padding_image)
+
+    numneigh, neighlist = neigh.get_numneigh_and_neighlist_1D()
+    half_numneigh, half_neighlist = neigh.get_numneigh_and_neighlist_1D(half_list=True)
+    assert 2 * np.sum(half_numneigh) == np.sum(numneigh)
+
+    energy, forces = pair_sum(numneigh, neighlist)
+    half_energy, half_forces = pair_sum(half_numneigh, half_neighlist)
+    assert half_energy == pytest.approx(0.5 * energy, 1e-10)
+    assert np.allclose(half_forces, 0.5 * forces)
+
+
+def test_cache_threads():
+    path = Path("configs_extxyz/bilayer_graphene")
+    configs = [Configuration.from_file(f) for f in sorted(path.glob("*.xyz"))]
+
+    cache = NeighborListCache()
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        neighs = list(executor.map(lambda c: cache.get(c, 4.0), configs))
+    assert len(cache) == len(configs)
+
+    for conf, neigh in zip(configs, neighs):
+        assert cache.get(conf, 4.0) is neigh
+        ref = NeighborList(conf, 4.0)
+        assert np.allclose(neigh.coords, ref.coords)
+        assert np.array_equal(
+            neigh.get_numneigh_and_neighlist_1D()[1],
+            ref.get_numneigh_and_neighlist_1D()[1],
+        )
+
+
+def test_image_neigh():
+    # small triclinic cell, with an atom outside of the cell
+    cell = np.asarray([[2.5, 0.0, 0.0], [1.1, 2.3, 0.0], [0.4, -0.6, 2.7]])
+    coords = np.asarray([[0.1, 0.2, 0.3], [2.9, 1.6, -0.4]])
+    conf = Configuration(cell, ["Si", "Si"], coords, [True, True, False])
+    N = conf.get_num_atoms()
+    infl_dist = 5.0
+
+    neigh = ImageNeighborList(conf, infl_dist)
+    ref = NeighborList(conf, infl_dist)
+
+    for i in range(N):
+        indices, nei_coords, _ = neigh.get_neigh(i)
+        ref_indices, ref_coords, _ = ref.get_neigh(i)
+        r = np.linalg.norm(nei_coords - coords[i], axis=1)
+        ref_r = np.linalg.norm(ref_coords - coords[i], axis=1)
+        assert np.allclose(sorted(r), sorted(ref_r))
+        assert sorted(indices) == sorted(ref.image[ref_indices])
+
+    def pair_terms(rij):
+        r = np.linalg.norm(rij, axis=1)
+        return np.sum(1 / r), rij / r[:, None] ** 3
+
+    # reference using padding atoms
+    numneigh, neighlist = ref.get_numneigh_and_neighlist_1D(half_list=True)
+    atoms = np.repeat(np.arange(N), numneigh)
+    rij = ref.coords[neighlist] - ref.coords[atoms]
+    ref_energy, dEdr = pair_terms(rij)
+    forces = np.zeros_like(ref.coords)
+    np.add.at(forces, atoms, dEdr)
+    np.add.at(forces, neighlist, -dEdr)
+    ref_forces = assemble_forces(forces, N, ref.padding_image)
+    ref_stress = assemble_stress(ref.coords, forces, conf.get_volume())
+    assert np.allclose(
+        assemble_forces_from_pairs(dEdr, numneigh, neighlist, N, ref.image), ref_forces
+    )
+    assert np.allclose(
+        assemble_stress_from_pairs(rij, dEdr, conf.get_volume()), ref_stress
+    )
+
+    for half_list in [True, False]:
+        numneigh, neighlist, shifts = neigh.get_numneigh_and_neighlist_1D(half_list)
+        rij = neigh.get_displacements(numneigh, neighlist, shifts)
+        energy, dEdr = pair_terms(rij)
+        forces = assemble_forces_from_pairs(dEdr, numneigh, neighlist, N)
+        stress = assemble_stress_from_pairs(rij, dEdr, conf.get_volume())
+        factor = 1.0 if half_list else 2.0
+        assert energy == pytest.approx(factor * ref_energy, 1e-10)
+        assert np.allclose(forces, factor * ref_forces)
+        assert np.allclose(stress, factor * ref_stress)
+
+
+def test_save_and_load(tmp_path):
+    conf = Configuration.from_file(
+        "configs_extxyz/bilayer_graphene/bilayer_sep3.36_i0_j0.xyz"
+    )
+    N = conf.get_num_atoms()
+
+    neigh = NeighborList(conf, 4.0, padding_need_neigh=True, cutoffs=[3.0, 4.0])
+    path = tmp_path.joinpath("neigh.npz")
+    neigh.save(path)
+    loaded = NeighborList.load(path, conf)
+
+    assert np.allclose(loaded.coords, neigh.coords)
+    assert np.array_equal(loaded.species, neigh.species)
+    assert np.array_equal(loaded.image, neigh.image)
+    assert np.array_equal(loaded.padding_image, neigh.padding_image)
+    for k in range(2):
+        for request_padding in [True, False]:
+            ref = neigh.get_numneigh_and_neighlist_1D(request_padding, k)
+            out = loaded.get_numneigh_and_neighlist_1D(request_padding, k)
+            assert np.array_equal(out[0], ref[0])
+            assert np.array_equal(out[1], ref[1])
+
+    # loaded neighbor list is usable as a normal one
+    coords = conf.coords + 0.01
+    loaded.update(coords)
+    assert np.allclose(loaded.coords[:N], coords)
+
+    conf2 = Configuration(conf.cell, conf.species, conf.coords + 0.1, conf.PBC)
+    with pytest.raises(NeighborListError):
+        NeighborList.load(path, conf2)
+
+    # persisted by cache
+    cache = NeighborListCache(cache_dir=tmp_path.joinpath("cache"))
+    neigh = cache.get(conf, 4.0)
+    assert len(list(cache.cache_dir.glob("*.npz"))) == 1
+    cache.clear()
+    loaded = cache.get(conf, 4.0)
+    assert loaded is not neigh
+    assert np.array_equal(
+        loaded.get_numneigh_and_neighlist_1D()[1],
+        neigh.get_numneigh_and_neighlist_1D()[1],
+    )
+
+
+def test_save_after_update(tmp_path):
+    conf = Configuration.from_file(
+        "configs_extxyz/bilayer_graphene/bilayer_sep3.36_i0_j0.xyz"
+    )
+    coords = conf.coords + 0.01
+    moved = Configuration(conf.cell, conf.species, coords, conf.PBC)
+
+    for skin in [0.0, 1.0]:
+        # rebuilt without skin, and only the coordinates refreshed with skin
+        neigh = NeighborList(conf, 4.0, skin=skin)
+        assert neigh.conf_hash == hash_configuration(conf)
+        neigh.update(coords)
+        assert neigh.conf_hash == hash_configuration(moved)
+
+        path = tmp_path.joinpath(f"neigh_{skin}.npz")
+        neigh.save(path)
+        loaded = NeighborList.load(path, moved)
+        assert np.allclose(loaded.coords, neigh.coords)
+        with pytest.raises(NeighborListError):
+            NeighborList.load(path, conf)
+
+
+def test_save_threads(tmp_path):
+    conf = Configuration.from_file(
+        "configs_extxyz/bilayer_graphene/bilayer_sep3.36_i0_j0.xyz"
+    )
+    neigh = NeighborList(conf, 4.0)
+    path = tmp_path.joinpath("neigh.npz")
+
+    # several threads saving to the same file do not interfere with each other
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        list(executor.map(lambda _: neigh.save(path), range(8)))
+
+    assert [p.name for p in tmp_path.iterdir()] == ["neigh.npz"]
+    loaded = NeighborList.load(path, conf)
+    assert np.array_equal(
+        loaded.get_numneigh_and_neighlist_1D()[1],
+        neigh.get_numneigh_and_neighlist_1D()[1],
+    )
+
+
+def test_species_code():
+    conf = Configuration.from_file(
+        "configs_extxyz/bilayer_graphene/bilayer_sep3.36_i0_j0.xyz"
+    )
+    conf.species[0] = "O"
+    neigh = NeighborList(conf, infl_dist=2)
+
+    assert neigh.species_code.dtype == np.intc
+    assert np.array_equal(
+        neigh.species_code, [8 if s == "O" else 6 for s in target_species]
+    )
+    assert np.array_equal(neigh.species, target_species)
+    assert np.array_equal(neigh.padding_species, target_species[4:])
+    with pytest.warns(DeprecationWarning):
+        assert np.array_equal(neigh.get_padding_speices(), target_species[4:])
+
+    mapping = {"C": 0, "O": 1}
+    code = neigh.get_species_code(mapping)
+    assert np.array_equal(code, [mapping[s] for s in target_species])
+    padding_code = neigh.get_padding_species_code(mapping)
+    assert np.array_equal(padding_code, code[4:])
+
+    with pytest.raises(NeighborListError):
+        neigh.get_species_code({"C": 0})
+
+
+@pytest.mark.parametrize("padding_need_neigh", [True, False])
+def test_kdtree_backend(padding_need_neigh):
+    for fname in [
+        "configs_extxyz/bilayer_graphene/bilayer_sep3.36_i0_j0.xyz",
+        "configs_extxyz/MoS2/MoS2_energy_forces_stress.xyz",
+    ]:
+        conf = Configuration.from_file(fname)
+        cutoffs = [3.0, 4.5]
+        ref = NeighborList(conf, 4.5, padding_need_neigh, cutoffs=cutoffs)
+        neigh = NeighborList(
+            conf, 4.5, padding_need_neigh, cutoffs=cutoffs, backend="kdtree"
+        )
+        assert np.allclose(neigh.coords, ref.coords)
+
+        N = len(ref.coords) if padding_need_neigh else conf.get_num_atoms()
+        for k in range(len(cutoffs)):
+            numneigh, _ = neigh.get_numneigh_and_neighlist_1D(padding_need_neigh, k)
+            ref_numneigh, _ = ref.get_numneigh_and_neighlist_1D(padding_need_neigh, k)
+            assert np.array_equal(numneigh, ref_numneigh)
+            for i in range(N):
+                assert sorted(neigh.get_neigh(i, k)[0]) == sorted(
+                    ref.get_neigh(i, k)[0]
+                )
+
+    with pytest.raises(NeighborListError):
+        NeighborList(conf, 4.5, backend="octree")
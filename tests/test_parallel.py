@@ -1,5 +1,6 @@
 import numpy as np
-from kliff.parallel import parmap1, parmap2
+import pytest
+from kliff.parallel import WorkerPool, parmap1, parmap2, partition_by_cost
 
 
 def func(x, y, z=1):
@@ -35,3 +36,43 @@ def test_main():
 
     results = parmap2(func, zip(X, Y), 1, nprocs=2, tuple_X=True)
     assert np.array_equal(results, XpYp1)
+
+
+def shard_func(shard, x, y):
+    if x is None:
+        raise ValueError("x is None")
+    return [x * i + y for i in shard]
+
+
+def test_worker_pool():
+    X = range(5)
+    with WorkerPool(shard_func, X, 1, nprocs=2) as pool:
+        assert pool.nprocs == 2
+        for x in [2, 3]:
+            results = pool.map(x)
+            assert len(results) == 2
+            assert np.array_equal(np.concatenate(results), [x * i + 1 for i in X])
+
+        with pytest.raises(ValueError):
+            pool.map(None)
+
+        # still usable after an error in the workers
+        assert np.array_equal(np.concatenate(pool.map(1)), [i + 1 for i in X])
+
+
+def test_partition_by_cost():
+    costs = [1, 8, 2, 3, 4]
+    groups = partition_by_cost(costs, 2)
+    assert groups == [[0, 1], [2, 3, 4]]
+
+    # mixing small and large costs
+    rng = np.random.RandomState(35)
+    costs = np.concatenate([np.full(50, 8), np.full(10, 2000)])
+    costs = rng.permutation(costs)
+    groups = partition_by_cost(costs, 4)
+    assert sorted(i for g in groups for i in g) == list(range(len(costs)))
+    loads = [np.sum(costs[g]) for g in groups]
+    assert max(loads) - min(loads) <= max(costs)
+
+    # more groups than data
+    assert partition_by_cost([1, 2], 3) == [[1], [0], []]
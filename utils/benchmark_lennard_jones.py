@@ -0,0 +1,107 @@
+"""Benchmark the vectorized `LennardJones` compute kernel against a per-pair loop.
+
+The per-pair loop is the implementation `LJComputeArguments.compute` used before it
+was vectorized, i.e. a loop over the full neighbor list of each atom. The energy,
+forces, and stress of both are checked to agree, and the compute times are reported for
+bulk configurations of different number of atoms.
+
+To run:
+$ python benchmark_lennard_jones.py
+$ python benchmark_lennard_jones.py --natoms 100 1000 --cutoff 6
+"""
+
+import argparse
+
+import numpy as np
+from benchmark_neighbor import create_configuration, timeit
+from kliff.models.lennard_jones import LennardJones, LJComputeArguments
+from kliff.neighbor import assemble_forces, assemble_stress
+
+
+def compute_loop(ca, params):
+    """
+    Compute energy, forces, and stress by looping over the full neighbor list of each
+    atom, as `LJComputeArguments.compute` did before it was vectorized.
+    """
+    epsilon = params["epsilon"][0]
+    sigma = params["sigma"][0]
+    rcut = params["cutoff"][0]
+    coords = ca.conf.coords
+
+    coords_including_padding = ca.neigh.coords
+    forces_including_padding = np.zeros_like(coords_including_padding)
+
+    energy = 0
+    for i, xyz_i in enumerate(coords):
+        neighlist, _, _ = ca.neigh.get_neigh(i)
+        for j in neighlist:
+            xyz_j = coords_including_padding[j]
+            rij = xyz_j - xyz_i
+            r = np.linalg.norm(rij)
+            if r > rcut:
+                phi, dphi = 0.0, 0.0
+            else:
+                sor = sigma / r
+                sor6 = sor * sor * sor
+                sor6 = sor6 * sor6
+                sor12 = sor6 * sor6
+                phi = 4 * epsilon * (sor12 - sor6)
+                dphi = 24 * epsilon * (-2 * sor12 + sor6) / r
+            energy += 0.5 * phi
+            pair = 0.5 * dphi / r * rij
+            forces_including_padding[i] = forces_including_padding[i] + pair
+            forces_including_padding[j] = forces_including_padding[j] - pair
+
+    forces = assemble_forces(
+        forces_including_padding, len(coords), ca.neigh.padding_image
+    )
+    volume = ca.conf.get_volume()
+    stress = assemble_stress(coords_including_padding, forces_including_padding, volume)
+
+    return energy, forces, stress
+
+
+def benchmark(natoms, density, cutoff, repeat):
+    model = LennardJones()
+    model.set_opt_params(cutoff=[[cutoff]])
+    params = model.get_model_params()
+
+    header = (
+        f"{'natoms':>7} {'pairs':>9} {'loop (s)':>10} {'vectorized (s)':>15} "
+        f"{'speedup':>8} {'rel diff':>10}"
+    )
+    print(header)
+    print("-" * len(header))
+
+    for n in natoms:
+        conf = create_configuration("bulk", n, density)
+        ca = LJComputeArguments(conf, None, cutoff, True, True, True)
+        npairs = np.sum(ca.neigh.get_numneigh_and_neighlist_1D(half_list=True)[0])
+
+        t_loop, (energy, forces, stress) = timeit(lambda: compute_loop(ca, params), 1)
+        t_vec, _ = timeit(lambda: ca.compute(params), repeat)
+
+        # relative difference, since random configurations can have huge energies
+        diff = max(
+            np.max(np.abs(x - y)) / np.max(np.abs(x))
+            for x, y in [
+                (energy, ca.get_energy()),
+                (forces, ca.get_forces()),
+                (stress, ca.get_stress()),
+            ]
+        )
+        print(
+            f"{n:>7} {npairs:>9} {t_loop:>10.5f} {t_vec:>15.5f} "
+            f"{t_loop / t_vec:>8.1f} {diff:>10.2e}"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--natoms", nargs="+", type=int, default=[100, 1000, 5000])
+    parser.add_argument("--density", type=float, default=0.05)
+    parser.add_argument("--cutoff", type=float, default=5.0)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    benchmark(args.natoms, args.density, args.cutoff, args.repeat)
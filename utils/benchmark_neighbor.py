@@ -0,0 +1,106 @@
+"""Benchmark the neighbor list backends of `kliff.neighbor.NeighborList`.
+
+The build time (creating padding atoms and searching neighbors) and the query time
+(getting the neighbor list of all atoms) of the `nl` (cell list) and `kdtree` backends
+are compared for bulk, slab, and cluster configurations of different number of atoms,
+densities, and cutoffs.
+
+To run:
+$ python benchmark_neighbor.py
+$ python benchmark_neighbor.py --natoms 100 1000 --densities 0.05 --cutoffs 5 8
+"""
+
+import argparse
+import time
+
+import numpy as np
+from kliff.dataset.dataset import Configuration
+from kliff.neighbor import NeighborList
+
+
+def create_configuration(kind, natoms, density, seed=35):
+    """
+    Create a configuration of randomly placed atoms.
+
+    Args:
+        kind: `bulk` (atoms fill a periodic cubic box), `slab` (atoms fill the lower
+            third of a periodic box, the rest is vacuum), or `cluster` (atoms fill a
+            sphere in a non-periodic box).
+        natoms: number of atoms
+        density: number of atoms per unit volume of the occupied region
+    """
+    rng = np.random.RandomState(seed)
+    volume = natoms / density
+
+    if kind == "bulk":
+        L = volume ** (1 / 3)
+        cell = np.diag([L, L, L])
+        coords = rng.uniform(0, L, (natoms, 3))
+        PBC = [True, True, True]
+    elif kind == "slab":
+        L = (volume / 2) ** (1 / 3)
+        cell = np.diag([L, L, 6 * L])
+        coords = rng.uniform(0, 1, (natoms, 3)) * [L, L, 2 * L]
+        PBC = [True, True, True]
+    elif kind == "cluster":
+        R = (3 * volume / (4 * np.pi)) ** (1 / 3)
+        direction = rng.normal(size=(natoms, 3))
+        direction /= np.linalg.norm(direction, axis=1)[:, None]
+        r = R * rng.uniform(0, 1, natoms) ** (1 / 3)
+        coords = direction * r[:, None]
+        cell = np.diag([4 * R, 4 * R, 4 * R])
+        PBC = [False, False, False]
+    else:
+        raise ValueError(f"Unknown configuration kind `{kind}`.")
+
+    return Configuration(cell, ["Si"] * natoms, coords, PBC)
+
+
+def timeit(func, repeat):
+    """
+    Best wall time of calling `func` for `repeat` times, and the result of the last call.
+    """
+    best = np.inf
+    for _ in range(repeat):
+        t = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - t)
+    return best, result
+
+
+def benchmark(kinds, natoms, densities, cutoffs, repeat):
+    header = (
+        f"{'kind':>8} {'natoms':>7} {'density':>8} {'cutoff':>7} {'backend':>8} "
+        f"{'build (s)':>10} {'query (s)':>10} {'neighbors':>10}"
+    )
+    print(header)
+    print("-" * len(header))
+
+    for kind in kinds:
+        for n in natoms:
+            for rho in densities:
+                conf = create_configuration(kind, n, rho)
+                for rcut in cutoffs:
+                    for backend in NeighborList.backends:
+                        t_build, neigh = timeit(
+                            lambda: NeighborList(conf, rcut, backend=backend), repeat
+                        )
+                        t_query, (numneigh, _) = timeit(
+                            neigh.get_numneigh_and_neighlist_1D, repeat
+                        )
+                        print(
+                            f"{kind:>8} {n:>7} {rho:>8.3f} {rcut:>7.2f} {backend:>8} "
+                            f"{t_build:>10.5f} {t_query:>10.5f} {np.sum(numneigh):>10}"
+                        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--kinds", nargs="+", default=["bulk", "slab", "cluster"])
+    parser.add_argument("--natoms", nargs="+", type=int, default=[100, 1000, 5000])
+    parser.add_argument("--densities", nargs="+", type=float, default=[0.02, 0.05])
+    parser.add_argument("--cutoffs", nargs="+", type=float, default=[4.0, 8.0])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    benchmark(args.kinds, args.natoms, args.densities, args.cutoffs, args.repeat)